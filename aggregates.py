@@ -0,0 +1,158 @@
+import json
+from collections import Counter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS agg_totals (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS agg_descriptors (
+    descriptor TEXT PRIMARY KEY,
+    total_weight INTEGER NOT NULL,
+    project_count INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_agg_descriptors_weight ON agg_descriptors(total_weight);
+
+CREATE TABLE IF NOT EXISTS agg_ingredients (
+    name TEXT PRIMARY KEY,
+    uses INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_agg_ingredients_uses ON agg_ingredients(uses);
+
+CREATE TABLE IF NOT EXISTS agg_daily (
+    day TEXT PRIMARY KEY,
+    projects INTEGER NOT NULL DEFAULT 0,
+    formulations INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+
+
+class DashboardAggregates:
+    """Dashboard counters maintained incrementally inside the store's write transactions.
+
+    Every project, profile and formulation write applies its delta to the counter
+    tables, so the dashboard never scans projects. ``summary()`` is additionally
+    memoized until a write happens through this process or another connection.
+    """
+
+    def __init__(self, conn):
+        conn.executescript(SCHEMA)
+        self._conn = conn
+        self._version = 0
+        self._summary = None
+        self._summary_version = None
+
+    def needs_rebuild(self):
+        has_projects = self._conn.execute("SELECT 1 FROM projects LIMIT 1").fetchone()
+        has_totals = self._conn.execute("SELECT 1 FROM agg_totals LIMIT 1").fetchone()
+        return bool(has_projects) and not has_totals
+
+    def rebuild(self, conn):
+        """Recompute every counter from the base tables (for databases predating aggregates)."""
+        for table in ("agg_totals", "agg_descriptors", "agg_ingredients", "agg_daily"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            "INSERT INTO agg_totals (key, value) "
+            "SELECT 'projects', COUNT(*) FROM projects UNION ALL "
+            "SELECT 'formulations', COALESCE(SUM(formulation_count), 0) FROM projects"
+        )
+        conn.execute(
+            "INSERT INTO agg_descriptors (descriptor, total_weight, project_count) "
+            "SELECT descriptor, SUM(value), COUNT(*) FROM profiles GROUP BY descriptor"
+        )
+        conn.execute(
+            "INSERT INTO agg_daily (day, projects, formulations) "
+            "SELECT created, COUNT(*), 0 FROM projects GROUP BY created"
+        )
+        # Counts without stored rows (e.g. seed data) are attributed to the project's creation day
+        conn.execute(
+            "UPDATE agg_daily SET formulations = ("
+            "SELECT SUM(p.formulation_count - (SELECT COUNT(*) FROM formulations f WHERE f.project_id = p.id)) "
+            "FROM projects p WHERE p.created = agg_daily.day)"
+        )
+        ingredient_uses = Counter()
+        for created, payload in conn.execute("SELECT substr(created, 1, 10), payload FROM formulations"):
+            self._count_day(conn, created, formulations=1)
+            ingredient_uses.update(_ingredient_names(json.loads(payload)))
+        conn.executemany("INSERT INTO agg_ingredients (name, uses) VALUES (?, ?)", ingredient_uses.items())
+        self._touch()
+
+    def project_created(self, conn, day, formulation_count=0):
+        # The project's profile is counted by the profile_changed call that writes it
+        self._add_total(conn, "projects", 1)
+        self._add_total(conn, "formulations", formulation_count)
+        self._count_day(conn, day, projects=1, formulations=formulation_count)
+
+    def profile_changed(self, conn, old_profile, new_profile):
+        rows = []
+        for desc in set(old_profile) | set(new_profile):
+            old, new = old_profile.get(desc, 0), new_profile.get(desc, 0)
+            if old != new:
+                rows.append((desc, new - old, (new > 0) - (old > 0)))
+        conn.executemany(
+            "INSERT INTO agg_descriptors (descriptor, total_weight, project_count) VALUES (?1, ?2, ?3) "
+            "ON CONFLICT(descriptor) DO UPDATE SET total_weight = total_weight + ?2, "
+            "project_count = project_count + ?3",
+            rows,
+        )
+        conn.execute("DELETE FROM agg_descriptors WHERE project_count <= 0")
+        self._touch()
+
+    def formulation_added(self, conn, day, formulation):
+        self._add_total(conn, "formulations", 1)
+        self._count_day(conn, day, formulations=1)
+        conn.executemany(
+            "INSERT INTO agg_ingredients (name, uses) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET uses = uses + 1",
+            [(name,) for name in _ingredient_names(formulation)],
+        )
+
+    def summary(self):
+        """Totals, top descriptor and most-used ingredient."""
+        version = (self._version, self._conn.execute("PRAGMA data_version").fetchone()[0])
+        if self._summary_version == version:
+            return self._summary
+        totals = dict(self._conn.execute("SELECT key, value FROM agg_totals"))
+        top_descriptor = self._conn.execute(
+            "SELECT descriptor FROM agg_descriptors WHERE total_weight > 0 ORDER BY total_weight DESC LIMIT 1"
+        ).fetchone()
+        top_ingredient = self._conn.execute(
+            "SELECT name FROM agg_ingredients ORDER BY uses DESC LIMIT 1"
+        ).fetchone()
+        self._summary = {
+            "projects": totals.get("projects", 0),
+            "formulations": totals.get("formulations", 0),
+            "top_descriptor": top_descriptor[0] if top_descriptor else None,
+            "signature_ingredient": top_ingredient[0] if top_ingredient else None,
+        }
+        self._summary_version = version
+        return self._summary
+
+    def daily_activity(self):
+        """(day, projects created, formulations created) rows, oldest first."""
+        return self._conn.execute("SELECT day, projects, formulations FROM agg_daily ORDER BY day").fetchall()
+
+    def _add_total(self, conn, key, amount):
+        conn.execute(
+            "INSERT INTO agg_totals (key, value) VALUES (?1, ?2) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + ?2",
+            (key, amount),
+        )
+        self._touch()
+
+    def _count_day(self, conn, day, projects=0, formulations=0):
+        conn.execute(
+            "INSERT INTO agg_daily (day, projects, formulations) VALUES (?1, ?2, ?3) "
+            "ON CONFLICT(day) DO UPDATE SET projects = projects + ?2, formulations = formulations + ?3",
+            (day, projects, formulations),
+        )
+        self._touch()
+
+    def _touch(self):
+        self._version += 1
+
+
+def _ingredient_names(formulation):
+    # Count each ingredient once per formulation
+    return {item["name"].strip().title() for item in formulation.get("ingredients", []) if item.get("name")}
@@ -0,0 +1,242 @@
+"""Generate formulations for a file of briefs without the Streamlit UI.
+
+Briefs are read one at a time from CSV or JSON Lines (optionally gzipped). Each brief
+has an ``id``, a ``description`` and a ``profile``; in CSV the profile is either a JSON
+``profile`` column or one column per descriptor. Generation runs through a bounded
+async pool sharing the app's response cache and rate-limit scheduler, and scoring
+runs in a process pool over the memory-mapped ingredient catalog.
+
+    python batch.py briefs.csv results.jsonl --api-key sk-... --concurrency 8
+
+Results are appended to the output as JSON Lines as each brief finishes. Rerunning
+with the same output resumes: briefs already written as ``ok`` or ``invalid`` are
+skipped and failed ones are retried.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import openai
+
+from blend import score_formulation
+from catalog import IngredientCatalog, catalog_path
+from config import data_path
+from llm import ResponseCache, agenerate_formulation
+from portability import validate_profile
+from profiles import ALL_DESCRIPTORS
+from scheduler import PRIORITY_BULK, RequestScheduler
+from stability import StabilitySimulator
+
+# Statuses that a resumed run does not redo; "error" results are retried
+FINISHED_STATUSES = ("ok", "invalid")
+
+# Output is fsynced after this many results, bounding what a crash can lose to the OS buffer
+SYNC_EVERY = 50
+
+
+def read_briefs(path):
+    """Yield ``(id, brief)`` pairs, where ``brief`` is a dict or a ValueError for a bad row."""
+    with open(path, "rb") as raw:
+        stream = gzip.GzipFile(fileobj=raw) if raw.read(2) == b"\x1f\x8b" else raw
+        raw.seek(0)
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        if path.endswith((".csv", ".csv.gz")):
+            for position, row in enumerate(csv.DictReader(text), start=1):
+                yield _brief_id(row, position), _brief_from_csv(row)
+            return
+        for position, line in enumerate(text, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield str(position), ValueError(f"invalid JSON ({e.msg})")
+                continue
+            if not isinstance(record, dict):
+                yield str(position), ValueError("brief is not an object")
+                continue
+            yield _brief_id(record, position), {"description": record.get("description", ""),
+                                                "profile": record.get("profile", {})}
+
+
+def _brief_id(record, position):
+    # Positions are stable across runs over the same file, so they work as resume keys
+    return str(record.get("id") or position)
+
+
+def _brief_from_csv(row):
+    try:
+        if row.get("profile"):
+            profile = json.loads(row["profile"])
+        else:
+            profile = {desc: int(row[desc]) for desc in ALL_DESCRIPTORS if (row.get(desc) or "").strip()}
+    except (ValueError, json.JSONDecodeError) as e:
+        return ValueError(f"invalid profile ({e})")
+    return {"description": row.get("description") or "", "profile": profile}
+
+
+def validate_brief(brief):
+    if isinstance(brief, Exception):
+        raise ValueError(str(brief))
+    if not isinstance(brief["description"], str):
+        raise ValueError("description must be a string")
+    validate_profile(brief["profile"])
+    if not brief["description"].strip() and not brief["profile"]:
+        raise ValueError("brief needs a description or a profile")
+
+
+def finished_ids(path):
+    """IDs already written to ``path`` with a finished status, tolerating a torn last line."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as fileobj:
+        for line in fileobj:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") in FINISHED_STATUSES:
+                done.add(record["id"])
+            else:
+                done.discard(record.get("id"))
+    return done
+
+
+_catalog = None
+_simulator = None
+
+
+def _init_worker(path):
+    # Workers are spawned (the scheduler runs threads, which fork does not copy safely)
+    # and each maps the same catalog file, so its pages are shared rather than copied
+    global _catalog, _simulator
+    _catalog = IngredientCatalog.load(path)
+    _simulator = StabilitySimulator(_catalog, cache_size=64)
+
+
+def _score(formulation, profile):
+    scores = score_formulation(_catalog, formulation, profile)
+    scores["longevity_hours"] = round(_simulator.simulate([formulation])[0]["longevity_hours"], 1)
+    return scores
+
+
+async def run_batch(briefs, output, api_key, model, temperature, concurrency=8, workers=None,
+                    cache=None, scheduler=None, done=frozenset(), progress=None):
+    """Generate, score and append results for every brief not in ``done``; return counts.
+
+    At most ``concurrency`` requests are in flight and at most twice that many briefs
+    are held in memory, so input size does not affect memory use.
+    """
+    counts = {"ok": 0, "cached": 0, "invalid": 0, "error": 0, "skipped": 0}
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    started = time.perf_counter()
+
+    async def process(brief_id, brief, pool, client):
+        try:
+            validate_brief(brief)
+        except ValueError as e:
+            return {"id": brief_id, "status": "invalid", "error": str(e)}
+        try:
+            async with semaphore:
+                formulation, cached = await agenerate_formulation(
+                    client, model, temperature, brief["profile"], brief["description"], cache=cache,
+                    scheduler=scheduler, priority=PRIORITY_BULK,
+                )
+            scores = await loop.run_in_executor(pool, _score, formulation, brief["profile"])
+        except Exception as e:
+            return {"id": brief_id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+        return {"id": brief_id, "status": "ok", "cached": cached, "formulation": formulation, "scores": scores}
+
+    with open(output, "a+", encoding="utf-8") as out, \
+            ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=_init_worker, initargs=(catalog_path(),)) as pool:
+        # Start on a fresh line if the previous run died mid-write
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        written = 0
+
+        def write(result):
+            nonlocal written
+            out.write(json.dumps(result, separators=(",", ":")) + "\n")
+            out.flush()
+            written += 1
+            if written % SYNC_EVERY == 0:
+                os.fsync(out.fileno())
+            counts[result["status"]] += 1
+            counts["cached"] += bool(result.get("cached"))
+            if progress is not None:
+                progress(counts, time.perf_counter() - started)
+
+        async with openai.AsyncOpenAI(api_key=api_key, max_retries=0 if scheduler else 2) as client:
+            pending = set()
+            for brief_id, brief in briefs:
+                if brief_id in done:
+                    counts["skipped"] += 1
+                    continue
+                if len(pending) >= 2 * concurrency:
+                    finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in finished:
+                        write(task.result())
+                pending.add(asyncio.create_task(process(brief_id, brief, pool, client)))
+            for next_done in asyncio.as_completed(pending):
+                write(await next_done)
+        os.fsync(out.fileno())
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate formulations for a file of briefs.")
+    parser.add_argument("input", help="CSV or JSON Lines briefs (optionally .gz)")
+    parser.add_argument("output", help="JSON Lines results; an existing file is resumed")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"),
+                        help="defaults to the OPENAI_API_KEY environment variable")
+    parser.add_argument("--model", default="gpt-4-turbo")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM requests in flight")
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="skip the shared response cache")
+    parser.add_argument("--restart", action="store_true", help="ignore results already in the output")
+    args = parser.parse_args()
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or OPENAI_API_KEY)")
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = finished_ids(args.output)
+    cache = None if args.no_cache else ResponseCache(data_path("response_cache.sqlite3"))
+
+    last_report = [0.0]
+
+    def progress(counts, elapsed):
+        if elapsed - last_report[0] < 1:
+            return
+        last_report[0] = elapsed
+        finished = counts["ok"] + counts["invalid"] + counts["error"]
+        print(f"\r{finished} done ({counts['ok']} ok, {counts['cached']} cached, {counts['error']} failed, "
+              f"{counts['invalid']} invalid) in {elapsed:.0f}s", end="", file=sys.stderr, flush=True)
+
+    counts = asyncio.run(run_batch(
+        read_briefs(args.input), args.output, args.api_key, args.model, args.temperature,
+        concurrency=args.concurrency, workers=args.workers, cache=cache, scheduler=RequestScheduler(),
+        done=done, progress=progress,
+    ))
+    print(file=sys.stderr)
+    print(json.dumps(counts, indent=2))
+    sys.exit(1 if counts["error"] else 0)
+
+
+if __name__ == "__main__":
+    main()
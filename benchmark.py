@@ -0,0 +1,319 @@
+"""Headless rerun benchmarks for streamlit-fragrance-app.py.
+
+Each scenario runs in a fresh subprocess with its own data directory, a stubbed
+OpenAI client and the app's cosmetic pauses skipped, drives the app with Streamlit's
+AppTest and records rerun wall time, peak Python memory, the serialized size of the
+rendered element tree and the memory held in session state.
+
+    python benchmark.py                          # all scenarios -> benchmark_results.json
+    python benchmark.py --scenario dashboard_1k  # a single scenario
+    python benchmark.py --baseline old.json      # also flag >25% slowdowns against a previous run
+
+Exits non-zero if any scenario exceeds its threshold.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit-fragrance-app.py")
+
+# Upper bounds per scenario: median rerun seconds, peak traced MB during a rerun, rendered KB
+# and KB held in the session's own state (shared reference data excluded).
+# AppTest reruns the whole script even for widgets inside fragments, so the slider and
+# preset timings bound what a browser session sees from above.
+THRESHOLDS = {
+    "dashboard_10": {"rerun_seconds": 0.6, "peak_mb": 10, "output_kb": 100, "session_kb": 256},
+    "dashboard_1k": {"rerun_seconds": 0.6, "peak_mb": 10, "output_kb": 100, "session_kb": 256},
+    "dashboard_10k": {"rerun_seconds": 0.6, "peak_mb": 10, "output_kb": 100, "session_kb": 256},
+    "slider_change": {"rerun_seconds": 0.5, "peak_mb": 10, "output_kb": 60, "session_kb": 256},
+    "preset_apply": {"rerun_seconds": 0.5, "peak_mb": 10, "output_kb": 60, "session_kb": 256},
+    # Each step returns to the dashboard and then creates, redirecting with st.rerun: three runs
+    "project_creation": {"rerun_seconds": 1.2, "peak_mb": 10, "output_kb": 60, "session_kb": 256},
+}
+
+# Untimed reruns before the timed ones in every scenario
+WARMUP_RERUNS = 2
+
+STUB_REPLY = json.dumps({
+    "name": "Benchmark Accord",
+    "ingredients": [
+        {"name": "Bergamot Oil", "percentage": 30, "note": "top"},
+        {"name": "Hedione", "percentage": 45, "note": "heart"},
+        {"name": "Iso E Super", "percentage": 25, "note": "base"},
+    ],
+    "notes": "Stubbed response",
+})
+
+
+def install_openai_stub():
+    """Replace the OpenAI clients with ones that answer instantly with ``STUB_REPLY``."""
+    import openai
+
+    usage = types.SimpleNamespace(prompt_tokens=50, completion_tokens=80, total_tokens=130)
+
+    def completion():
+        message = types.SimpleNamespace(content=STUB_REPLY)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+    def chunks():
+        for i in range(0, len(STUB_REPLY), 16):
+            delta = types.SimpleNamespace(content=STUB_REPLY[i:i + 16])
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta, finish_reason=None)], usage=None)
+
+    class Completions:
+        def create(self, stream=False, **kwargs):
+            return chunks() if stream else completion()
+
+    class AsyncCompletions:
+        async def create(self, **kwargs):
+            return completion()
+
+    class StubOpenAI:
+        def __init__(self, **kwargs):
+            self.chat = types.SimpleNamespace(completions=Completions())
+
+    class StubAsyncOpenAI:
+        def __init__(self, **kwargs):
+            self.chat = types.SimpleNamespace(completions=AsyncCompletions())
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+    openai.OpenAI = StubOpenAI
+    openai.AsyncOpenAI = StubAsyncOpenAI
+
+
+def skip_app_pauses():
+    """Make ``time.sleep`` calls made by the app script return at once; other callers still sleep.
+
+    The app pauses for two seconds after creating a project so the success message can be
+    read, which would otherwise swamp the rerun timing.
+    """
+    sleep = time.sleep
+
+    def patched(seconds):
+        if sys._getframe(1).f_code.co_filename != APP_PATH:
+            sleep(seconds)
+
+    time.sleep = patched
+
+
+def seed_projects(count, store=None):
+    from profiles import ALL_DESCRIPTORS
+    from store import get_store
+
+    rng = random.Random(0)
+    store = store or get_store()
+    with store.transaction():
+        for i in range(count):
+            profile = {desc: rng.randint(1, 7) for desc in rng.sample(ALL_DESCRIPTORS, 4)}
+            store.create_project(f"Bench {i:05d}", "Benchmark project", profile,
+                                 created=f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                                 formulation_count=rng.randint(0, 20))
+
+
+def output_bytes(at):
+    """Serialized size of every element and block proto currently rendered."""
+    def walk(node):
+        proto = getattr(node, "proto", None)
+        total = proto.ByteSize() if hasattr(proto, "ByteSize") else 0
+        children = getattr(node, "children", None) or {}
+        for child in (children.values() if isinstance(children, dict) else children):
+            total += walk(child)
+        return total
+    return walk(at._tree)
+
+
+def open_project(at, name):
+    at.sidebar.selectbox(key="project_picker").select(name).run()
+
+
+def _dashboard(projects):
+    def setup(at):
+        return None
+
+    def interact(at, i):
+        at.run()
+    return projects, setup, interact
+
+
+def _slider_change():
+    def setup(at):
+        open_project(at, "Bench 00000")
+
+    def interact(at, i):
+        at.slider(key="slider_Woody").set_value(1 + i % 7).run()
+    return 1000, setup, interact
+
+
+def _preset_apply():
+    def setup(at):
+        open_project(at, "Bench 00000")
+        [s for s in at.selectbox if s.label == "Quick Presets"][0].select("Citrus Aromatic").run()
+
+    def interact(at, i):
+        [b for b in at.button if b.label == "Apply Preset"][0].click().run()
+    return 1000, setup, interact
+
+
+def _project_creation():
+    def setup(at):
+        return None
+
+    def interact(at, i):
+        if at.session_state["current_project"] is not None:
+            # Creation opens the new project; returning to the dashboard is part of the workflow
+            open_project(at, "Create New Project")
+        at.text_input(key="new_project_name_input").input(f"Bench New {i}")
+        at.slider(key="slider_floral_new").set_value(5)
+        [b for b in at.button if b.label == "Create Project"][0].click().run()
+    return 1000, setup, interact
+
+
+SCENARIOS = {
+    "dashboard_10": lambda: _dashboard(10),
+    "dashboard_1k": lambda: _dashboard(1000),
+    "dashboard_10k": lambda: _dashboard(10000),
+    "slider_change": _slider_change,
+    "preset_apply": _preset_apply,
+    "project_creation": _project_creation,
+}
+
+
+def run_scenario(name, repeat):
+    """Measure one scenario in this process; the data directory must already be isolated."""
+    install_openai_stub()
+    skip_app_pauses()
+    from streamlit.testing.v1 import AppTest
+
+    from catalog import get_catalog
+    from molecules import get_thumbnail_cache
+    from profiles import ALL_DESCRIPTORS, PRESET_COMBINATIONS
+    from telemetry import session_footprint
+
+    projects, setup, interact = SCENARIOS[name]()
+    seed_projects(projects)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=300)
+    started = time.perf_counter()
+    at.run()
+    cold_seconds = time.perf_counter() - started
+    at.sidebar.text_input[0].input("sk-benchmark").run()
+    setup(at)
+    # Let startup thumbnail rendering finish so it does not compete with the timed reruns
+    get_thumbnail_cache().wait()
+    # Untimed reruns first, so lazily built caches and first-use imports are not timed
+    for i in range(WARMUP_RERUNS):
+        interact(at, repeat + 1 + i)
+
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        interact(at, i)
+        timings.append(time.perf_counter() - started)
+        if at.exception:
+            raise RuntimeError(f"{name}: app raised {at.exception[0].value}")
+
+    # Memory is traced on a separate rerun so tracing overhead does not skew the timings
+    tracemalloc.start()
+    interact(at, repeat)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "projects": projects,
+        "repeat": repeat,
+        "cold_run_seconds": round(cold_seconds, 4),
+        "rerun_seconds": round(statistics.median(timings), 4),
+        "rerun_seconds_max": round(max(timings), 4),
+        "peak_mb": round(peak / 2 ** 20, 2),
+        "output_kb": round(output_bytes(at) / 1024, 1),
+        "session_kb": round(sum(session_footprint(
+            at.session_state.to_dict(), shared=(ALL_DESCRIPTORS, PRESET_COMBINATIONS, get_catalog()),
+        ).values()) / 1024, 1),
+    }
+
+
+def run_isolated(name, repeat):
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ, ESSENCE_DATA_DIR=data_dir)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name, "--repeat", str(repeat)],
+            env=env, capture_output=True, text=True,
+        )
+    if proc.returncode != 0:
+        # Streamlit logs deprecation warnings to stderr; report the exception line instead
+        errors = [line for line in proc.stderr.splitlines() if line and not line[0].isspace() and "Error" in line]
+        return {"error": errors[-1] if errors else f"exited with code {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check(name, result, baseline=None, tolerance=0.25):
+    """List threshold (and baseline) violations for a scenario result."""
+    if "error" in result:
+        return [result["error"]]
+    failures = [
+        f"{metric} {result[metric]} > {limit}"
+        for metric, limit in THRESHOLDS[name].items() if result[metric] > limit
+    ]
+    previous = (baseline or {}).get(name)
+    if previous and "rerun_seconds" in previous:
+        limit = previous["rerun_seconds"] * (1 + tolerance)
+        if result["rerun_seconds"] > limit:
+            failures.append(f"rerun_seconds {result['rerun_seconds']} > baseline {previous['rerun_seconds']} +{tolerance:.0%}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark app reruns headlessly.")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--repeat", type=int, default=10, help="timed reruns per scenario")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="previous results file to compare rerun times against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.repeat)))
+        return
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fileobj:
+            baseline = {name: entry["result"] for name, entry in json.load(fileobj)["scenarios"].items()}
+
+    scenarios = {}
+    for name in args.scenario or SCENARIOS:
+        result = run_isolated(name, args.repeat)
+        failures = check(name, result, baseline, args.tolerance)
+        scenarios[name] = {"result": result, "thresholds": THRESHOLDS[name], "passed": not failures,
+                           "failures": failures}
+        print(f"{name:18} {'ok  ' if not failures else 'FAIL'} {json.dumps(result)}"
+              + (f"  [{'; '.join(failures)}]" if failures else ""))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "passed": all(entry["passed"] for entry in scenarios.values()),
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as fileobj:
+        json.dump(report, fileobj, indent=2)
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
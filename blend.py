@@ -0,0 +1,123 @@
+import numpy as np
+
+from profiles import profile_vector
+
+
+def project_capped_simplex(values, upper, iterations=32):
+    """Row-wise Euclidean projection onto {0 <= w <= upper, sum(w) = 1}.
+
+    Solved by bisection on the shift ``tau`` in ``clip(v - tau, 0, upper)``, for all
+    rows at once.
+    """
+    lo = (values - upper).min(axis=1, keepdims=True) - 1.0
+    hi = values.max(axis=1, keepdims=True)
+    for _ in range(iterations):
+        tau = (lo + hi) / 2
+        total = np.clip(values - tau, 0, upper).sum(axis=1, keepdims=True)
+        too_big = total > 1
+        lo = np.where(too_big, tau, lo)
+        hi = np.where(too_big, hi, tau)
+    return np.clip(values - (lo + hi) / 2, 0, upper)
+
+
+def optimize_blends(descriptors, targets, upper, iterations=200, ridge=0.01):
+    """Batched constrained least squares for blend weights.
+
+    Minimizes ``||W @ descriptors - targets||^2 + ridge * ||W||^2`` per row subject to
+    ``0 <= W <= upper`` and rows summing to 1, using accelerated projected gradient.
+    ``descriptors`` is (ingredients, descriptors); ``targets`` is (batch, descriptors).
+    Returns the (batch, ingredients) weight matrix.
+    """
+    descriptors = np.asarray(descriptors, dtype=np.float64)
+    targets = np.atleast_2d(np.asarray(targets, dtype=np.float64))
+    upper = np.broadcast_to(np.asarray(upper, dtype=np.float64), (descriptors.shape[0],))
+    if upper.sum() < 1:
+        raise ValueError("Ingredient limits sum to less than 100%; no feasible blend")
+
+    gram = descriptors @ descriptors.T
+    step = 1.0 / (2 * (np.linalg.eigvalsh(gram)[-1] + ridge))
+    target_proj = targets @ descriptors.T
+
+    weights = project_capped_simplex(np.full((len(targets), len(descriptors)), 1.0 / len(descriptors)), upper)
+    momentum = weights.copy()
+    t = 1.0
+    for _ in range(iterations):
+        gradient = 2 * (momentum @ gram - target_proj + ridge * momentum)
+        next_weights = project_capped_simplex(momentum - step * gradient, upper)
+        next_t = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        momentum = next_weights + ((t - 1) / next_t) * (next_weights - weights)
+        weights, t = next_weights, next_t
+    return weights
+
+
+def _drop_traces(row, upper, min_percentage):
+    """Indices left after dropping trace amounts; ``row`` is re-projected in place onto the caps.
+
+    Rescaling the remaining weights would undo the caps, so each drop is followed by a
+    projection of the kept weights, repeated until no trace amounts remain. Traces
+    are kept if dropping them would leave limits summing to less than 100%.
+    """
+    keep = np.flatnonzero(row > 0)
+    while True:
+        traces = row[keep] * 100 < min_percentage
+        if not traces.any() or upper[keep[~traces]].sum() < 1:
+            return keep
+        row[keep[traces]] = 0.0
+        keep = keep[~traces]
+        row[keep] = project_capped_simplex(row[None, keep], upper[keep])[0]
+
+
+def draft_formulations(catalog, profiles, max_share=0.3, min_percentage=0.5):
+    """Deterministic formulation drafts for many target profiles in one batched solve.
+
+    Each ingredient is capped by its IFRA limit and by ``max_share`` of the blend.
+    Returns formulation dicts in the same shape as LLM formulations.
+    """
+    targets = np.stack([profile_vector(profile) for profile in profiles])
+    upper = np.minimum(np.asarray(catalog.ifra_limit, dtype=np.float64) / 100.0, max_share)
+    weights = optimize_blends(catalog.descriptors, targets, upper)
+    fitted = weights @ np.asarray(catalog.descriptors, dtype=np.float64)
+    errors = np.sqrt(((fitted - targets) ** 2).mean(axis=1))
+
+    drafts = []
+    for row, error in zip(weights, errors):
+        keep = _drop_traces(row, upper, min_percentage)
+        keep = keep[np.argsort(-row[keep])]
+        # Round down at a cap so rounding cannot push an ingredient over its limit
+        percentages = np.minimum(np.round(row[keep] * 100, 1), np.floor(upper[keep] * 1000) / 10)
+        drafts.append({
+            "name": "Local Draft",
+            "ingredients": [
+                {"name": str(catalog.names[i]), "percentage": round(float(p), 1), "note": str(catalog.notes[i])}
+                for i, p in zip(keep, percentages)
+            ],
+            "notes": f"Deterministic draft from the ingredient catalog (profile RMS error {error:.2f}).",
+        })
+    return drafts
+
+
+def draft_formulation(catalog, profile, **kwargs):
+    return draft_formulations(catalog, [profile], **kwargs)[0]
+
+
+def score_formulation(catalog, formulation, profile):
+    """Check a formulation against the catalog and measure how well it fits ``profile``.
+
+    Returns the percentage total, unknown ingredients, IFRA limit breaches, cost per kg
+    and the RMS error between the target profile and the blend's descriptor vector, the
+    latter two over catalog ingredients only.
+    """
+    names = [item["name"] for item in formulation["ingredients"]]
+    percentages = np.array([float(item.get("percentage", 0) or 0) for item in formulation["ingredients"]])
+    rows = catalog.lookup_many(names) if names else np.zeros(0, dtype=int)
+    known = rows >= 0
+    limits = np.asarray(catalog.ifra_limit, dtype=np.float64)[rows[known]]
+    weights = percentages[known] / percentages[known].sum() if percentages[known].sum() > 0 else percentages[known]
+    fitted = weights @ np.asarray(catalog.descriptors, dtype=np.float64)[rows[known]]
+    return {
+        "total_percentage": round(float(percentages.sum()), 2),
+        "unknown_ingredients": [name for name, ok in zip(names, known) if not ok],
+        "ifra_breaches": [names[i] for i, limit in zip(np.flatnonzero(known), limits) if percentages[i] > limit],
+        "cost_per_kg": round(float(weights @ np.asarray(catalog.cost, dtype=np.float64)[rows[known]]), 2),
+        "profile_rms_error": round(float(np.sqrt(((fitted - profile_vector(profile)) ** 2).mean())), 3),
+    }
@@ -0,0 +1,202 @@
+import csv
+import os
+import tempfile
+
+import numpy as np
+import streamlit as st
+
+from config import data_path
+from profiles import ALL_DESCRIPTORS, DESCRIPTOR_INDEX
+
+CATALOG_VERSION = 1
+NOTES = ["top", "heart", "base"]
+
+CATALOG_DTYPE = np.dtype([
+    ("name", "U48"),
+    ("key", "U48"),  # lowercased name; the file is sorted on it for searchsorted lookups
+    ("note", "U5"),
+    ("descriptors", np.float32, (len(ALL_DESCRIPTORS),)),
+    ("volatility", np.float32),  # relative evaporation rate, 1 = most volatile
+    ("cost", np.float32),  # USD per kg
+    ("ifra_limit", np.float32),  # maximum % in the finished product (100 = unrestricted)
+])
+
+# Built-in starter catalog: (name, note, volatility, cost, IFRA limit, descriptor intensities 0-7)
+SEED_INGREDIENTS = [
+    ("Bergamot Oil", "top", 0.90, 60, 100, {"Citrus": 7, "Fresh": 5, "Fruity": 2, "Green": 1}),
+    ("Lemon Oil", "top", 0.95, 30, 100, {"Citrus": 7, "Fresh": 6, "Sour": 3}),
+    ("Sweet Orange Oil", "top", 0.90, 12, 100, {"Citrus": 6, "Fruity": 4, "Sweet": 3}),
+    ("Grapefruit Oil", "top", 0.90, 45, 100, {"Citrus": 6, "Fresh": 4, "Sour": 2, "Fruity": 2}),
+    ("Mandarin Oil", "top", 0.88, 70, 100, {"Citrus": 6, "Sweet": 3, "Fruity": 3}),
+    ("Lime Oil", "top", 0.92, 50, 100, {"Citrus": 7, "Fresh": 4, "Green": 3, "Sour": 3}),
+    ("Citral", "top", 0.85, 25, 0.6, {"Citrus": 7, "Sour": 3, "Fresh": 3}),
+    ("Peppermint Oil", "top", 0.85, 40, 100, {"Fresh": 7, "Herbal": 5, "Green": 2}),
+    ("Rosemary Oil", "top", 0.80, 35, 100, {"Herbal": 6, "Fresh": 4, "Woody": 2, "Green": 2}),
+    ("Basil Oil", "top", 0.80, 90, 100, {"Herbal": 6, "Green": 4, "Spicy": 2}),
+    ("Galbanum Oil", "top", 0.75, 400, 100, {"Green": 7, "Earthy": 3, "Balsamic": 2}),
+    ("Cis-3-Hexenol", "top", 0.95, 60, 100, {"Green": 7, "Fresh": 4}),
+    ("Rhubofix", "top", 0.60, 300, 100, {"Sour": 5, "Green": 4, "Fruity": 3}),
+    ("Black Pepper Oil", "top", 0.75, 150, 100, {"Spicy": 6, "Fresh": 3, "Woody": 3}),
+    ("Cardamom Oil", "top", 0.70, 400, 100, {"Spicy": 5, "Fresh": 4, "Citrus": 2, "Herbal": 2}),
+    ("Pink Pepper Oil", "top", 0.80, 350, 100, {"Spicy": 4, "Fruity": 3, "Fresh": 3, "Woody": 1}),
+    ("Linalool", "top", 0.70, 15, 100, {"Floral": 4, "Fresh": 4, "Citrus": 2, "Herbal": 2}),
+    ("Lavender Oil", "heart", 0.60, 80, 100, {"Herbal": 6, "Floral": 4, "Fresh": 3, "Powdery": 1}),
+    ("Clary Sage Oil", "heart", 0.60, 150, 100, {"Herbal": 5, "Amber": 2, "Musky": 1, "Sweet": 1}),
+    ("Hedione", "heart", 0.50, 25, 100, {"Floral": 5, "Fresh": 4, "Citrus": 1}),
+    ("Phenylethyl Alcohol", "heart", 0.55, 12, 100, {"Floral": 6, "Sweet": 2, "Fresh": 1}),
+    ("Rose Absolute", "heart", 0.45, 6000, 100, {"Floral": 7, "Sweet": 3, "Fruity": 2, "Spicy": 1}),
+    ("Jasmine Absolute", "heart", 0.40, 4000, 100, {"Floral": 7, "Sweet": 3, "Fruity": 2, "Musky": 2}),
+    ("Ylang Ylang Oil", "heart", 0.45, 120, 3.8, {"Floral": 6, "Sweet": 4, "Creamy": 3, "Spicy": 1}),
+    ("Geraniol", "heart", 0.55, 20, 5.3, {"Floral": 6, "Citrus": 3, "Fruity": 2}),
+    ("Heliotropin", "heart", 0.30, 30, 100, {"Powdery": 6, "Floral": 3, "Vanilla": 3, "Sweet": 3, "Nutty": 1}),
+    ("Alpha Isomethyl Ionone", "heart", 0.35, 20, 20, {"Powdery": 6, "Floral": 5, "Woody": 2}),
+    ("Cinnamon Bark Oil", "heart", 0.50, 120, 0.2, {"Spicy": 7, "Sweet": 3, "Woody": 2}),
+    ("Clove Bud Oil", "heart", 0.45, 40, 0.5, {"Spicy": 7, "Woody": 2, "Balsamic": 2}),
+    ("Gamma Decalactone", "heart", 0.35, 60, 100, {"Fruity": 7, "Creamy": 4, "Sweet": 3}),
+    ("Delta Decalactone", "heart", 0.30, 70, 100, {"Creamy": 6, "Nutty": 3, "Sweet": 3, "Fruity": 2}),
+    ("Raspberry Ketone", "heart", 0.30, 45, 100, {"Fruity": 6, "Sweet": 4}),
+    ("Acetyl Pyrazine", "heart", 0.50, 200, 100, {"Nutty": 7, "Earthy": 2, "Sweet": 1}),
+    ("Iso E Super", "base", 0.25, 30, 21.4, {"Woody": 6, "Amber": 4, "Powdery": 2, "Musky": 2}),
+    ("Cedarwood Oil", "base", 0.25, 25, 100, {"Woody": 7, "Earthy": 2, "Balsamic": 1}),
+    ("Sandalwood Oil", "base", 0.15, 2000, 100, {"Woody": 6, "Creamy": 5, "Sweet": 2, "Musky": 1}),
+    ("Vetiver Oil", "base", 0.10, 300, 100, {"Earthy": 7, "Woody": 5, "Green": 1}),
+    ("Patchouli Oil", "base", 0.12, 90, 100, {"Earthy": 7, "Woody": 5, "Balsamic": 2, "Sweet": 1}),
+    ("Oakmoss Absolute", "base", 0.15, 500, 0.1, {"Earthy": 6, "Green": 4, "Woody": 3}),
+    ("Ambroxan", "base", 0.10, 800, 100, {"Amber": 6, "Woody": 4, "Musky": 3}),
+    ("Labdanum Absolute", "base", 0.12, 250, 100, {"Amber": 7, "Balsamic": 5, "Sweet": 3, "Earthy": 2}),
+    ("Vanillin", "base", 0.15, 15, 100, {"Vanilla": 7, "Sweet": 6, "Creamy": 2}),
+    ("Ethyl Vanillin", "base", 0.15, 25, 100, {"Vanilla": 7, "Sweet": 7, "Creamy": 2}),
+    ("Ethyl Maltol", "base", 0.20, 40, 100, {"Sweet": 7, "Fruity": 2, "Nutty": 1}),
+    ("Coumarin", "base", 0.25, 15, 1.6, {"Sweet": 4, "Powdery": 4, "Nutty": 2, "Vanilla": 2, "Herbal": 1}),
+    ("Tonka Bean Absolute", "base", 0.20, 400, 10, {"Sweet": 5, "Vanilla": 4, "Nutty": 4, "Powdery": 2}),
+    ("Benzoin Resinoid", "base", 0.10, 40, 100, {"Balsamic": 7, "Vanilla": 5, "Sweet": 4, "Amber": 2}),
+    ("Peru Balsam", "base", 0.10, 80, 0.4, {"Balsamic": 7, "Vanilla": 3, "Sweet": 3}),
+    ("Galaxolide", "base", 0.10, 12, 100, {"Musky": 7, "Powdery": 3, "Sweet": 2, "Floral": 1}),
+    ("Habanolide", "base", 0.08, 60, 100, {"Musky": 7, "Woody": 2, "Powdery": 2}),
+    ("Ethylene Brassylate", "base", 0.08, 20, 100, {"Musky": 6, "Powdery": 3, "Sweet": 2}),
+]
+
+
+def build_catalog(rows, path):
+    """Write ``(name, note, volatility, cost, ifra_limit, descriptors)`` rows as a sorted .npy file.
+
+    The file is written to a temporary name and renamed into place, so processes
+    loading it concurrently never observe a partial catalog.
+    """
+    data = np.zeros(len(rows), dtype=CATALOG_DTYPE)
+    for i, (name, note, volatility, cost, ifra_limit, descriptors) in enumerate(rows):
+        data[i]["name"] = name
+        data[i]["key"] = name.lower()
+        data[i]["note"] = note
+        data[i]["volatility"] = volatility
+        data[i]["cost"] = cost
+        data[i]["ifra_limit"] = ifra_limit
+        for desc, value in descriptors.items():
+            data[i]["descriptors"][DESCRIPTOR_INDEX[desc]] = value
+    data.sort(order="key")
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".npy", dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, "wb") as fileobj:
+        np.save(fileobj, data)
+    os.replace(tmp_path, path)
+
+
+def rows_from_csv(path):
+    """Read catalog rows from a CSV with name, note, volatility, cost, ifra_limit and descriptor columns."""
+    rows = []
+    with open(path, newline="", encoding="utf-8") as fileobj:
+        for record in csv.DictReader(fileobj):
+            descriptors = {desc: float(record[desc]) for desc in ALL_DESCRIPTORS if record.get(desc)}
+            rows.append((record["name"], record["note"].lower(), float(record["volatility"]),
+                         float(record["cost"]), float(record.get("ifra_limit") or 100), descriptors))
+    return rows
+
+
+class IngredientCatalog:
+    """Read-only ingredient catalog over a memory-mapped structured array.
+
+    Columns are NumPy views into the mapped file, so every session and process shares
+    the same pages. Rows are sorted by lowercased name, which doubles as the name and
+    prefix index.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.names = data["name"]
+        self.keys = data["key"]
+        self.notes = data["note"]
+        self.descriptors = data["descriptors"]
+        self.volatility = data["volatility"]
+        self.cost = data["cost"]
+        self.ifra_limit = data["ifra_limit"]
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path, mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.data)
+
+    def lookup(self, name):
+        """Row index for an exact (case-insensitive) name, or None."""
+        index = self.lookup_many([name])[0]
+        return None if index < 0 else int(index)
+
+    def lookup_many(self, names):
+        """Row indices for many names at once; -1 where a name is not in the catalog."""
+        if len(self) == 0:
+            return np.full(len(names), -1)
+        keys = np.array([name.strip().lower() for name in names], dtype=self.keys.dtype)
+        positions = np.searchsorted(self.keys, keys)
+        clipped = np.minimum(positions, len(self) - 1)
+        return np.where(self.keys[clipped] == keys, clipped, -1)
+
+    def search_prefix(self, prefix, limit=50):
+        key = prefix.strip().lower()
+        if not key:
+            return np.arange(min(limit, len(self)))
+        start = np.searchsorted(self.keys, key, side="left")
+        end = np.searchsorted(self.keys, key + "\U0010ffff", side="left")
+        return np.arange(start, min(end, start + limit))
+
+    def filter(self, notes=None, max_cost=None, min_ifra_limit=None, descriptor=None, min_intensity=1):
+        """Indices of ingredients matching every given criterion, computed as one boolean mask."""
+        mask = np.ones(len(self), dtype=bool)
+        if notes:
+            mask &= np.isin(self.notes, list(notes))
+        if max_cost is not None:
+            mask &= self.cost <= max_cost
+        if min_ifra_limit is not None:
+            mask &= self.ifra_limit >= min_ifra_limit
+        if descriptor:
+            mask &= self.descriptors[:, DESCRIPTOR_INDEX[descriptor]] >= min_intensity
+        return np.flatnonzero(mask)
+
+    def records(self, indices):
+        """Plain dict rows for display."""
+        return [
+            {
+                "Ingredient": str(self.names[i]),
+                "Note": str(self.notes[i]),
+                "Main Descriptors": ", ".join(
+                    ALL_DESCRIPTORS[j] for j in np.argsort(-self.descriptors[i])[:3] if self.descriptors[i][j] > 0
+                ),
+                "Volatility": round(float(self.volatility[i]), 2),
+                "Cost ($/kg)": round(float(self.cost[i]), 2),
+                "IFRA Limit (%)": round(float(self.ifra_limit[i]), 2),
+            }
+            for i in indices
+        ]
+
+
+def catalog_path():
+    """Path of the catalog file, building the starter catalog on first use."""
+    path = data_path(f"ingredient_catalog_v{CATALOG_VERSION}.npy")
+    if not path.exists():
+        build_catalog(SEED_INGREDIENTS, str(path))
+    return str(path)
+
+
+@st.cache_resource(show_spinner=False)
+def get_catalog():
+    return IngredientCatalog.load(catalog_path())
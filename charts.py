@@ -0,0 +1,70 @@
+import math
+
+import plotly.graph_objects as go
+import streamlit as st
+from plotly.subplots import make_subplots
+
+# Shared styling for project radar charts, applied via layout template
+RADAR_TEMPLATE = go.layout.Template(
+    layout=dict(
+        margin=dict(l=20, r=20, t=20, b=20),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#444'),
+        showlegend=False,
+        polar=dict(
+            radialaxis=dict(visible=True, range=[0, 7], linecolor='#3a2f5b', gridcolor='#f0f0f0'),
+            angularaxis=dict(linecolor='#3a2f5b', gridcolor='#f0f0f0'),
+        ),
+    ),
+    data=dict(
+        scatterpolar=[go.Scatterpolar(
+            fill='toself',
+            fillcolor='rgba(184, 151, 61, 0.2)',
+            line=dict(color='#b8973d', width=2),
+        )],
+    ),
+)
+
+
+def profile_key(profile):
+    """Hashable, order-independent form of a profile for memoization."""
+    return tuple(sorted((desc, val) for desc, val in profile.items() if val))
+
+
+def _radar_trace(profile_items, name=None):
+    attributes = [desc for desc, _ in profile_items]
+    values = [val for _, val in profile_items]
+    # Close the loop the way px.line_polar(line_close=True) does
+    return go.Scatterpolar(r=values + values[:1], theta=attributes + attributes[:1], name=name)
+
+
+# cache_data hands every caller its own copy, so layout changes made while rendering never
+# reach other sessions
+@st.cache_data(max_entries=2048, show_spinner=False)
+def radar_figure(profile_items, height=200):
+    """Small project radar chart, memoized on the profile contents."""
+    fig = go.Figure(_radar_trace(list(profile_items)))
+    fig.update_layout(template=RADAR_TEMPLATE, height=height)
+    return fig
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def radar_grid_figure(named_profiles, columns=3, row_height=260):
+    """One figure with a polar subplot per ``(name, profile_items)`` pair.
+
+    Sending a page of projects as a single figure avoids one Plotly payload (layout,
+    config and template) per card.
+    """
+    rows = max(1, math.ceil(len(named_profiles) / columns))
+    fig = make_subplots(
+        rows=rows, cols=columns,
+        specs=[[{"type": "polar"}] * columns for _ in range(rows)],
+        subplot_titles=[name for name, _ in named_profiles],
+        vertical_spacing=0.12 / rows,
+    )
+    for i, (name, profile_items) in enumerate(named_profiles):
+        fig.add_trace(_radar_trace(list(profile_items), name=name), row=i // columns + 1, col=i % columns + 1)
+    # Template polar settings apply to every polar subplot in plotly.js, so axes stay unstyled here
+    fig.update_layout(template=RADAR_TEMPLATE, height=row_height * rows, margin=dict(l=30, r=30, t=40, b=20))
+    return fig
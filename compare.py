@@ -0,0 +1,117 @@
+import numpy as np
+
+from profiles import ALL_DESCRIPTORS
+
+
+def comparison_features(catalog, formulations):
+    """Ingredient share and perceived profile matrices for many formulations.
+
+    ``weights`` is (formulations, ingredients) over the union of ingredient names, each
+    row summing to 1; ``profiles`` is the share-weighted catalog descriptor vector of
+    each formulation (ingredients missing from the catalog contribute nothing).
+    """
+    names = [item["name"].strip().lower() for f in formulations for item in f.get("ingredients", [])]
+    rows = np.repeat(np.arange(len(formulations)), [len(f.get("ingredients", [])) for f in formulations])
+    shares = np.array([max(float(item.get("percentage", 0) or 0), 0.0)
+                       for f in formulations for item in f.get("ingredients", [])])
+    ingredients, columns = np.unique(np.array(names, dtype=str), return_inverse=True)
+
+    weights = np.zeros((len(formulations), len(ingredients)), dtype=np.float32)
+    np.add.at(weights, (rows, columns), shares)
+    totals = weights.sum(axis=1, keepdims=True)
+    weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+    catalog_rows = catalog.lookup_many(list(ingredients)) if len(ingredients) else np.zeros(0, dtype=int)
+    descriptors = np.where((catalog_rows >= 0)[:, None],
+                           catalog.descriptors[np.maximum(catalog_rows, 0)], 0.0).astype(np.float32)
+    profiles = weights @ descriptors if len(ingredients) else np.zeros((len(formulations), len(ALL_DESCRIPTORS)),
+                                                                       dtype=np.float32)
+    return {"ingredients": ingredients, "weights": weights, "profiles": profiles}
+
+
+def pairwise_distances(a, b=None, metric="euclidean"):
+    """(len(a), len(b)) distance matrix, Euclidean or cosine, without Python loops."""
+    a = np.asarray(a, dtype=np.float32)
+    b = a if b is None else np.asarray(b, dtype=np.float32)
+    if metric == "cosine":
+        a_norm = np.linalg.norm(a, axis=1, keepdims=True)
+        b_norm = np.linalg.norm(b, axis=1, keepdims=True)
+        a_unit = np.divide(a, a_norm, out=np.zeros_like(a), where=a_norm > 0)
+        b_unit = np.divide(b, b_norm, out=np.zeros_like(b), where=b_norm > 0)
+        return np.clip(1 - a_unit @ b_unit.T, 0, 2)
+    # |a - b|^2 = |a|^2 + |b|^2 - 2ab, clipped for rounding error
+    squared = (a * a).sum(axis=1)[:, None] + (b * b).sum(axis=1)[None, :] - 2 * a @ b.T
+    return np.sqrt(np.maximum(squared, 0))
+
+
+def combined_features(features, profile_weight=0.5):
+    """Perceived profile (scaled to 0-1 intensities) and ingredient shares, weighted for distances.
+
+    Squared Euclidean distance over the result is ``profile_weight`` times the profile
+    distance plus the remainder times the ingredient-share distance.
+    """
+    return np.hstack([
+        np.sqrt(profile_weight) * features["profiles"] / 7.0,
+        np.sqrt(1 - profile_weight) * features["weights"],
+    ]).astype(np.float32)
+
+
+def kmeans(points, k, iterations=50, seed=0):
+    """Lloyd's k-means with k-means++ seeding; returns ``(labels, centers)``."""
+    points = np.asarray(points, dtype=np.float32)
+    k = max(1, min(k, len(points)))
+    rng = np.random.default_rng(seed)
+    centers = points[[rng.integers(len(points))]]
+    for _ in range(1, k):
+        nearest = pairwise_distances(points, centers).min(axis=1) ** 2
+        total = nearest.sum()
+        index = rng.choice(len(points), p=nearest / total) if total > 0 else rng.integers(len(points))
+        centers = np.vstack([centers, points[index]])
+
+    labels = np.zeros(len(points), dtype=np.intp)
+    for _ in range(iterations):
+        labels = pairwise_distances(points, centers).argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        # Empty clusters keep their previous center
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return labels, centers
+
+
+def project_2d(points):
+    """Principal-component projection to two dimensions; linear in the number of points."""
+    points = np.asarray(points, dtype=np.float64)
+    centered = points - points.mean(axis=0)
+    if len(points) < 2:
+        return np.zeros((len(points), 2))
+    # The (features x features) covariance keeps this cheap for thousands of points
+    _, vectors = np.linalg.eigh(centered.T @ centered)
+    projected = centered @ vectors[:, ::-1][:, :2]
+    if projected.shape[1] < 2:
+        projected = np.hstack([projected, np.zeros((len(points), 2 - projected.shape[1]))])
+    return projected
+
+
+def downsample(points, labels, max_points, keep=(), seed=0):
+    """Indices of at most ``max_points`` points that preserve the shape of a 2-D scatter.
+
+    Points are binned on a grid per cluster and one point is kept per occupied cell, so
+    dense regions are thinned while sparse outliers survive. ``keep`` indices are always
+    included.
+    """
+    n = len(points)
+    if n <= max_points:
+        return np.arange(n)
+    keep = np.asarray(keep, dtype=np.intp)
+    cells = int(np.sqrt(max_points))
+    low, high = points.min(axis=0), points.max(axis=0)
+    grid = np.floor((points - low) / np.where(high > low, high - low, 1) * (cells - 1)).astype(np.int64)
+    cell_ids = (np.asarray(labels, dtype=np.int64) * cells + grid[:, 0]) * cells + grid[:, 1]
+    _, chosen = np.unique(cell_ids, return_index=True)
+    if len(chosen) + len(keep) > max_points:
+        chosen = np.random.default_rng(seed).choice(chosen, max_points - len(keep), replace=False)
+    return np.union1d(chosen, keep)
@@ -0,0 +1,10 @@
+import os
+from pathlib import Path
+
+# Location for on-disk state (response cache, project store, catalogs)
+DATA_DIR = Path(os.environ.get("ESSENCE_DATA_DIR", ".essence_data"))
+
+
+def data_path(name):
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    return DATA_DIR / name
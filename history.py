@@ -0,0 +1,216 @@
+import json
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    parent_id INTEGER REFERENCES versions(id),
+    depth INTEGER NOT NULL,
+    delta TEXT,
+    snapshot TEXT,
+    formulation_id INTEGER,
+    created TEXT NOT NULL,
+    label TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_versions_project ON versions(project_id, id);
+CREATE INDEX IF NOT EXISTS idx_versions_parent ON versions(parent_id, id);
+
+CREATE TABLE IF NOT EXISTS version_heads (
+    project_id INTEGER PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    version_id INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# A full snapshot is stored every this many versions along a chain, bounding rebuilds
+SNAPSHOT_INTERVAL = 20
+
+
+def diff(old, new):
+    """Delta turning dict ``old`` into ``new``, carrying the old values needed to invert it.
+
+    ``set`` holds new values of added or changed keys, ``unset`` the old values of
+    changed or removed keys, and ``sub`` nested deltas for keys that are dicts on both
+    sides. An empty dict means no change.
+    """
+    delta = {}
+    set_values, unset_values, sub = {}, {}, {}
+    for key in old.keys() | new.keys():
+        if key not in new:
+            unset_values[key] = old[key]
+        elif key not in old:
+            set_values[key] = new[key]
+        elif isinstance(old[key], dict) and isinstance(new[key], dict):
+            nested = diff(old[key], new[key])
+            if nested:
+                sub[key] = nested
+        elif old[key] != new[key]:
+            set_values[key] = new[key]
+            unset_values[key] = old[key]
+    for name, part in (("set", set_values), ("unset", unset_values), ("sub", sub)):
+        if part:
+            delta[name] = part
+    return delta
+
+
+def apply_delta(state, delta):
+    """Return a copy of ``state`` with ``delta`` applied; untouched branches are shared."""
+    state = dict(state)
+    for key in delta.get("unset", {}):
+        state.pop(key, None)
+    state.update(delta.get("set", {}))
+    for key, nested in delta.get("sub", {}).items():
+        state[key] = apply_delta(state.get(key, {}), nested)
+    return state
+
+
+def invert(delta):
+    inverse = {}
+    if "unset" in delta:
+        inverse["set"] = delta["unset"]
+    if "set" in delta:
+        inverse["unset"] = delta["set"]
+    if "sub" in delta:
+        inverse["sub"] = {key: invert(nested) for key, nested in delta["sub"].items()}
+    return inverse
+
+
+def describe(delta):
+    """Short human-readable label for a project-state delta."""
+    parts = []
+    profile = delta.get("sub", {}).get("profile", {})
+    old, new = profile.get("unset", {}), profile.get("set", {})
+    for desc in sorted(old.keys() | new.keys()):
+        parts.append(f"{desc} {old.get(desc, 0)}→{new.get(desc, 0)}")
+    if "profile" in delta.get("set", {}) or "profile" in delta.get("unset", {}):
+        parts.append("Profile replaced")
+    if "description" in delta.get("set", {}) or "description" in delta.get("unset", {}):
+        parts.append("Description edited")
+    if "formulation" in delta.get("set", {}) or "formulation" in delta.get("unset", {}):
+        formulation_id = delta.get("set", {}).get("formulation")
+        parts.append(f"Formulation #{formulation_id}" if formulation_id is not None else "No formulation")
+    return ", ".join(parts) or "No change"
+
+
+class VersionHistory:
+    """Append-only version tree of each project's editable state.
+
+    The state is the description, the profile and the id of the current formulation;
+    formulations are immutable rows, so a version never copies one. Every version
+    stores the delta from its parent, including old values, so undo and redo apply a
+    single delta to the current state regardless of history length. Every
+    ``SNAPSHOT_INTERVAL`` versions along a chain also store the full state, so any
+    version is rebuilt from at most that many deltas. Undoing and then editing starts
+    a new branch; nothing is ever overwritten except the per-project head pointer.
+    Methods run on the connection passed in, inside the store's transactions.
+    """
+
+    def __init__(self, conn):
+        conn.executescript(SCHEMA)
+
+    def start(self, conn, project_id, state, label="Created"):
+        """Record ``state`` as a root snapshot and make it the head."""
+        return self._insert(conn, project_id, None, 0, None, state, label)
+
+    def record(self, conn, project_id, old_state, new_state):
+        """Append a version for a change from ``old_state``; returns its id, or None if nothing changed."""
+        delta = diff(old_state, new_state)
+        if not delta:
+            return None
+        head = self.head(conn, project_id)
+        if head is None:
+            # Projects predating version history get a root snapshot of their state before this edit
+            head = (self.start(conn, project_id, old_state, label="Before history"), 0)
+        head_id, depth = head
+        depth += 1
+        snapshot = new_state if depth >= SNAPSHOT_INTERVAL else None
+        return self._insert(conn, project_id, head_id, 0 if snapshot is not None else depth, delta, snapshot,
+                            describe(delta))
+
+    def head(self, conn, project_id):
+        """``(version_id, depth)`` of the project's current version, or None."""
+        return conn.execute(
+            "SELECT v.id, v.depth FROM version_heads h JOIN versions v ON v.id = h.version_id "
+            "WHERE h.project_id = ?", (project_id,)
+        ).fetchone()
+
+    def undo(self, conn, project_id, state):
+        """Step the head to its parent; returns the parent's state or None at the root."""
+        row = conn.execute(
+            "SELECT v.parent_id, v.delta FROM version_heads h JOIN versions v ON v.id = h.version_id "
+            "WHERE h.project_id = ?", (project_id,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        self._set_head(conn, project_id, row[0])
+        return apply_delta(state, invert(json.loads(row[1])))
+
+    def redo(self, conn, project_id, state):
+        """Step the head to its newest child; returns that state or None if there is none."""
+        row = conn.execute(
+            "SELECT v.id, v.delta FROM version_heads h JOIN versions v ON v.parent_id = h.version_id "
+            "WHERE h.project_id = ? ORDER BY v.id DESC LIMIT 1", (project_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._set_head(conn, project_id, row[0])
+        return apply_delta(state, json.loads(row[1]))
+
+    def state_at(self, conn, version_id):
+        """Rebuild a version's state from its nearest snapshot ancestor."""
+        chain = conn.execute(
+            "WITH RECURSIVE chain(id, parent_id, delta, snapshot, step) AS ("
+            "SELECT id, parent_id, delta, snapshot, 0 FROM versions WHERE id = ? "
+            "UNION ALL SELECT v.id, v.parent_id, v.delta, v.snapshot, chain.step + 1 "
+            "FROM versions v JOIN chain ON v.id = chain.parent_id WHERE chain.snapshot IS NULL) "
+            "SELECT delta, snapshot FROM chain ORDER BY step DESC",
+            (version_id,),
+        ).fetchall()
+        if not chain:
+            raise KeyError(version_id)
+        state = json.loads(chain[0][1])
+        for delta, _ in chain[1:]:
+            state = apply_delta(state, json.loads(delta))
+        return state
+
+    def checkout(self, conn, project_id, version_id):
+        """Make any version of the project the head and return its state; later edits branch from it."""
+        if not conn.execute("SELECT 1 FROM versions WHERE id = ? AND project_id = ?",
+                            (version_id, project_id)).fetchone():
+            raise KeyError(version_id)
+        self._set_head(conn, project_id, version_id)
+        return self.state_at(conn, version_id)
+
+    def versions(self, conn, project_id, limit=50):
+        """Newest versions first, as dicts with id, parent, created, label, formulation id and head flag."""
+        head = self.head(conn, project_id)
+        rows = conn.execute(
+            "SELECT id, parent_id, created, label, formulation_id FROM versions WHERE project_id = ? "
+            "ORDER BY id DESC LIMIT ?", (project_id, limit)
+        ).fetchall()
+        return [
+            {"id": version_id, "parent": parent_id, "created": created, "label": label,
+             "formulation_id": formulation_id, "head": head is not None and head[0] == version_id}
+            for version_id, parent_id, created, label, formulation_id in rows
+        ]
+
+    def _insert(self, conn, project_id, parent_id, depth, delta, snapshot, label):
+        # The current formulation at the time, listed with each version for comparison
+        formulation = conn.execute("SELECT current_formulation_id FROM projects WHERE id = ?",
+                                   (project_id,)).fetchone()
+        cursor = conn.execute(
+            "INSERT INTO versions (project_id, parent_id, depth, delta, snapshot, formulation_id, created, label) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (project_id, parent_id, depth, None if delta is None else json.dumps(delta),
+             None if snapshot is None else json.dumps(snapshot), formulation[0],
+             datetime.now().isoformat(timespec="seconds"), label),
+        )
+        self._set_head(conn, project_id, cursor.lastrowid)
+        return cursor.lastrowid
+
+    def _set_head(self, conn, project_id, version_id):
+        conn.execute(
+            "INSERT INTO version_heads (project_id, version_id) VALUES (?1, ?2) "
+            "ON CONFLICT(project_id) DO UPDATE SET version_id = ?2",
+            (project_id, version_id),
+        )
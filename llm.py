@@ -0,0 +1,568 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+import openai
+import streamlit as st
+
+from config import data_path
+from scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+# Completion budget reserved against the tokens/min limit before usage is known
+COMPLETION_TOKEN_ESTIMATE = 800
+
+SYSTEM_PROMPT = (
+    "You are an expert perfumer. Given a target sensory profile (descriptor intensities on a 0-7 scale) "
+    "and a natural language brief, propose a fragrance formulation. Respond with JSON only, using the schema: "
+    '{"name": str, "ingredients": [{"name": str, "percentage": float, "note": "top"|"heart"|"base"}], '
+    '"notes": str}. Percentages must sum to 100.'
+)
+
+REFINE_SYSTEM_PROMPT = (
+    "You are an expert perfumer refining a fragrance formulation over several rounds. Each round gives "
+    "a summary of earlier rounds, the current formulation, which target descriptors changed (0-7 scale) "
+    "and the perfumer's feedback. Adjust the current formulation rather than starting over. Respond with "
+    'JSON only, using the schema: {"name": str, "ingredients": [{"name": str, "percentage": float, '
+    '"note": "top"|"heart"|"base"}], "notes": str, "change": str}, where "change" describes this '
+    "round's edits in at most 15 words. Percentages must sum to 100."
+)
+
+
+def normalize_profile(profile):
+    """Drop zero intensities and sort descriptors so equivalent profiles compare equal."""
+    return {desc: int(val) for desc, val in sorted(profile.items()) if val}
+
+
+def normalize_description(description):
+    return " ".join((description or "").lower().split())
+
+
+def build_messages(profile, description, draft=None):
+    profile = normalize_profile(profile)
+    profile_text = ", ".join(f"{desc}: {val}" for desc, val in profile.items()) or "no strong descriptors"
+    content = f"Sensory profile: {profile_text}\nBrief: {description.strip()}"
+    if draft:
+        # A compact draft keeps the polish prompt small; the model refines rather than starts over
+        draft_text = ", ".join(f"{item['name']} {item['percentage']}%" for item in draft["ingredients"])
+        content += f"\nRefine this draft blend, keeping its structure where it fits the brief: {draft_text}"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+def estimate_tokens(messages):
+    # Roughly four characters per token for English prose
+    return sum(len(m["content"]) for m in messages) // 4 + COMPLETION_TOKEN_ESTIMATE
+
+
+def cache_key(model, temperature, profile, description, variant=0, draft=None):
+    parts = [model, round(float(temperature), 2), normalize_profile(profile), normalize_description(description)]
+    if variant:
+        parts.append(variant)
+    if draft:
+        parts.append([[item["name"], item["percentage"]] for item in draft["ingredients"]])
+    payload = json.dumps(parts, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _reply_json(text):
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise ValueError("Model response did not contain a JSON formulation")
+    return json.loads(match.group(0))
+
+
+def parse_formulation(text):
+    """Parse a model reply into a formulation dict, tolerating surrounding prose or code fences."""
+    data = _reply_json(text)
+    ingredients = [_normalize_ingredient(item) for item in data.get("ingredients", []) if item.get("name")]
+    return {"name": data.get("name", ""), "ingredients": ingredients, "notes": data.get("notes", "")}
+
+
+def _normalize_ingredient(item):
+    return {
+        "name": str(item.get("name", "")).strip(),
+        "percentage": float(item.get("percentage", 0) or 0),
+        "note": str(item.get("note", "")).strip().lower(),
+    }
+
+
+class IncrementalFormulationParser:
+    """Pull complete ingredient objects out of a formulation JSON document as it streams in.
+
+    ``feed`` returns the ingredients whose closing brace arrived in that chunk, so rows can
+    be rendered long before the document is complete. Braces inside string values are
+    ignored, and an object that does not parse is skipped rather than ending the stream;
+    ``result`` still parses the whole reply.
+    """
+
+    _ARRAY_START = re.compile(r'"ingredients"\s*:\s*\[')
+
+    def __init__(self):
+        self.text = ""
+        self._pos = None
+        self._depth = 0
+        self._obj_start = None
+        self._in_string = False
+        self._escape = False
+        self._closed = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self._pos is None:
+            match = self._ARRAY_START.search(self.text)
+            if not match:
+                return []
+            self._pos = match.end()
+
+        found = []
+        text = self.text
+        while self._pos < len(text) and not self._closed:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = self._pos
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        item = json.loads(text[self._obj_start:self._pos + 1])
+                        if item.get("name"):
+                            found.append(_normalize_ingredient(item))
+                    except (ValueError, TypeError):
+                        pass
+            elif ch == "]" and self._depth == 0:
+                self._closed = True
+            self._pos += 1
+        return found
+
+    def result(self):
+        return parse_formulation(self.text)
+
+
+class ResponseCache:
+    """Two-tier response cache: an in-memory LRU in front of a SQLite table.
+
+    Entries expire after ``ttl`` seconds in both tiers. The memory tier holds at most
+    ``memory_size`` entries; the disk tier is trimmed to ``disk_size`` entries, least
+    recently used first.
+    """
+
+    def __init__(self, path, memory_size=256, disk_size=10000, ttl=7 * 24 * 3600):
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if now - created >= self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            value = json.loads(value)
+            self._remember(key, created, value)
+            return value
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._evict_disk(now)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.disk_size,),
+        )
+
+
+@st.cache_resource(show_spinner=False)
+def get_client(api_key):
+    # Retries are left to the scheduler so 429s, 5xx and connection errors back off together.
+    # Retries are left to the scheduler so 429s back off together instead of storming.
+    return openai.OpenAI(api_key=api_key, max_retries=0)
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    return ResponseCache(data_path("response_cache.sqlite3"))
+
+
+def _create(client, scheduler, priority, model, temperature, messages, timing=None, **kwargs):
+    def call():
+        if timing is not None:
+            timing["sent"] = time.perf_counter()
+        return client.chat.completions.create(model=model, temperature=temperature, messages=messages, **kwargs)
+
+    if scheduler is None:
+        return call()
+    estimate = estimate_tokens(messages)
+    response = scheduler.run(call, model, estimate, priority)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        scheduler.settle(model, estimate, usage.total_tokens)
+    return response
+
+
+async def _acreate(client, scheduler, priority, model, temperature, messages, timing=None, **kwargs):
+    def call():
+        if timing is not None:
+            timing["sent"] = time.perf_counter()
+        return client.chat.completions.create(model=model, temperature=temperature, messages=messages, **kwargs)
+
+    if scheduler is None:
+        return await call()
+    estimate = estimate_tokens(messages)
+    response = await scheduler.arun(call, model, estimate, priority)
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        scheduler.settle(model, estimate, usage.total_tokens)
+    return response
+
+
+def _record_call(telemetry, model, kind, started, timing, messages, text="", usage=None, first_token=None,
+                 error=False):
+    """Report one API call: queue wait until the request was sent, then latency from there."""
+    if telemetry is None:
+        return
+    now = time.perf_counter()
+    sent = timing.get("sent", now)
+    if usage is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        # Same four-characters-per-token estimate the scheduler budgets with
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = len(text) // 4
+    telemetry.record_llm(model, kind, now - sent, queue_wait=sent - started,
+                         first_token=None if first_token is None else first_token - sent,
+                         prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, error=error)
+
+
+def _record_hit(telemetry, model, kind, started):
+    if telemetry is not None:
+        telemetry.record_llm(model, kind, time.perf_counter() - started, cached=True)
+
+
+def _semantic_match(semantic, cache, key, model, temperature, profile, description):
+    """Consult the semantic cache after an exact miss: ``(reuse, seed)``, at most one set.
+
+    A reused formulation is also stored under the exact key so the next identical brief
+    skips the similarity search.
+    """
+    if semantic is None:
+        return None, None
+    reuse, seed = semantic.lookup(model, temperature, profile, description)
+    if reuse is not None and cache is not None:
+        cache.set(key, reuse)
+    return reuse, seed
+
+
+def generate_formulation(client, model, temperature, profile, description, cache=None,
+                         scheduler=None, priority=PRIORITY_INTERACTIVE, telemetry=None, semantic=None):
+    """Return ``(formulation, cached)`` for a profile and brief, consulting ``cache`` first.
+
+    With a ``semantic`` cache, a near-duplicate past brief is reused as is, or its
+    formulation is sent as a draft to refine when it is only moderately similar.
+    """
+    started = time.perf_counter()
+    key = cache_key(model, temperature, profile, description)
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            _record_hit(telemetry, model, "single", started)
+            return hit, True
+    reuse, seed = _semantic_match(semantic, cache, key, model, temperature, profile, description)
+    if reuse is not None:
+        _record_hit(telemetry, model, "single", started)
+        return reuse, True
+
+    messages = build_messages(profile, description, seed)
+    timing = {}
+    try:
+        response = _create(client, scheduler, priority, model, temperature, messages, timing=timing)
+    except Exception:
+        _record_call(telemetry, model, "single", started, timing, messages, error=True)
+        raise
+    text = response.choices[0].message.content
+    _record_call(telemetry, model, "single", started, timing, messages, text, getattr(response, "usage", None))
+    formulation = parse_formulation(text)
+    if cache is not None:
+        cache.set(key, formulation)
+    if semantic is not None:
+        semantic.add(model, temperature, profile, description, formulation)
+    return formulation, False
+
+
+def stream_formulation(client, model, temperature, profile, description, cache=None,
+                       scheduler=None, priority=PRIORITY_INTERACTIVE, draft=None, telemetry=None, semantic=None):
+    """Stream a formulation, yielding ``("ingredient", row)`` events as rows complete.
+
+    The final event is ``("formulation", formulation, cached)``. Cache hits replay their
+    ingredients immediately without calling the API. Passing a local ``draft`` asks the
+    model to polish it instead of formulating from scratch; the ``semantic`` cache is
+    only consulted for briefs without one.
+    """
+    started = time.perf_counter()
+    key = cache_key(model, temperature, profile, description, draft=draft)
+    hit = cache.get(key) if cache is not None else None
+    if hit is None and draft is None:
+        hit, draft = _semantic_match(semantic, cache, key, model, temperature, profile, description)
+    else:
+        # Polished drafts depend on the draft, so they are neither matched nor remembered
+        semantic = None
+    if hit is not None:
+        _record_hit(telemetry, model, "stream", started)
+        for row in hit["ingredients"]:
+            yield ("ingredient", row)
+        yield ("formulation", hit, True)
+        return
+
+    messages = build_messages(profile, description, draft)
+    timing = {}
+    text = []
+    usage = None
+    first_token = None
+    try:
+        # Usage arrives on a final chunk without choices when include_usage is set
+        stream = _create(client, scheduler, priority, model, temperature, messages, timing=timing,
+                         stream=True, stream_options={"include_usage": True})
+        parser = IncrementalFormulationParser()
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token is None:
+                    first_token = time.perf_counter()
+                text.append(delta)
+                for row in parser.feed(delta):
+                    yield ("ingredient", row)
+        formulation = parser.result()
+    except Exception:
+        _record_call(telemetry, model, "stream", started, timing, messages, "".join(text), usage, first_token,
+                     error=True)
+        raise
+    _record_call(telemetry, model, "stream", started, timing, messages, "".join(text), usage, first_token)
+    if scheduler is not None and usage is not None:
+        scheduler.settle(model, estimate_tokens(messages), usage.total_tokens)
+    if cache is not None:
+        cache.set(key, formulation)
+    if semantic is not None:
+        semantic.add(model, temperature, profile, description, formulation)
+    yield ("formulation", formulation, False)
+
+
+async def agenerate_formulation(client, model, temperature, profile, description, cache=None, variant=0,
+                                scheduler=None, priority=PRIORITY_BULK, telemetry=None):
+    """Async counterpart of ``generate_formulation`` for an ``openai.AsyncOpenAI`` client."""
+    started = time.perf_counter()
+    key = cache_key(model, temperature, profile, description, variant)
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            _record_hit(telemetry, model, "variant", started)
+            return hit, True
+
+    messages = build_messages(profile, description)
+    timing = {}
+    try:
+        response = await _acreate(client, scheduler, priority, model, temperature, messages, timing=timing)
+    except Exception:
+        _record_call(telemetry, model, "variant", started, timing, messages, error=True)
+        raise
+    text = response.choices[0].message.content
+    _record_call(telemetry, model, "variant", started, timing, messages, text, getattr(response, "usage", None))
+    formulation = parse_formulation(text)
+    if cache is not None:
+        cache.set(key, formulation)
+    return formulation, False
+
+
+async def generate_variants(api_key, model, temperature, profile, description, n, concurrency=4, cache=None,
+                            scheduler=None, telemetry=None):
+    """Generate ``n`` formulation variants concurrently, at most ``concurrency`` in flight.
+
+    Yields ``("variant", index, formulation, cached)`` or ``("error", index, exc)`` in
+    completion order. Closing the generator early cancels the outstanding requests.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    # The async HTTP pool is bound to the running event loop, so it lives for one batch
+    async with openai.AsyncOpenAI(api_key=api_key, max_retries=0 if scheduler else 2) as client:
+        async def run(index):
+            async with semaphore:
+                try:
+                    formulation, cached = await agenerate_formulation(
+                        client, model, temperature, profile, description, cache=cache, variant=index + 1,
+                        scheduler=scheduler, priority=PRIORITY_BULK, telemetry=telemetry,
+                    )
+                except Exception as e:
+                    return ("error", index, e)
+                return ("variant", index, formulation, cached)
+
+        tasks = [asyncio.create_task(run(index)) for index in range(n)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def profile_delta(old, new):
+    """Descriptors whose intensity differs between two profiles, as ``{descriptor: (old, new)}``."""
+    old, new = normalize_profile(old), normalize_profile(new)
+    return {desc: (old.get(desc, 0), new.get(desc, 0))
+            for desc in sorted(old.keys() | new.keys()) if old.get(desc, 0) != new.get(desc, 0)}
+
+
+def _format_delta(delta):
+    return ", ".join(f"{desc} {before}->{after}" for desc, (before, after) in delta.items()) or "none"
+
+
+def _format_formulation(formulation):
+    return "; ".join(f"{item['name']} {item['percentage']:g}% {item.get('note', '')}".strip()
+                     for item in formulation["ingredients"])
+
+
+class RefinementSession:
+    """State of an iterative refinement, kept small enough to resend every round.
+
+    Only the brief and starting profile form the stable prompt prefix. Each round adds
+    the profile delta since the previous round, the current formulation and feedback;
+    earlier rounds are compacted into the net profile change plus the last
+    ``recent_rounds`` change notes, so prompt size stays flat as rounds accumulate.
+    """
+
+    def __init__(self, description, profile, formulation, recent_rounds=3, note_chars=160, history=50):
+        self.description = description.strip()
+        self.start_profile = normalize_profile(profile)
+        self.profile = dict(self.start_profile)
+        self.formulation = formulation
+        self.recent = deque(maxlen=recent_rounds)
+        self.note_chars = note_chars
+        self.round_count = 0
+        # Per-round stats for display only; never sent to the model
+        self.rounds = deque(maxlen=history)
+
+    def summary(self):
+        lines = [f"Net target changes so far: {_format_delta(profile_delta(self.start_profile, self.profile))}"]
+        lines += [f"Round {number}: {note}" for number, note in self.recent]
+        return "\n".join(lines)
+
+    def messages(self, profile, feedback):
+        start = ", ".join(f"{desc}: {val}" for desc, val in self.start_profile.items()) or "no strong descriptors"
+        return [
+            {"role": "system", "content": REFINE_SYSTEM_PROMPT},
+            # Unchanged for the whole session, so provider-side prompt caching can reuse it
+            {"role": "user", "content": f"Brief: {self.description or 'none'}\nStarting profile: {start}"},
+            {"role": "user", "content": (
+                f"Earlier rounds:\n{self.summary()}\n"
+                f"Current formulation: {_format_formulation(self.formulation)}\n"
+                f"Profile changes this round: {_format_delta(profile_delta(self.profile, profile))}\n"
+                f"Feedback: {feedback.strip()[:self.note_chars] or 'none'}"
+            )},
+        ]
+
+    def record(self, profile, feedback, formulation, change, stats):
+        delta = profile_delta(self.profile, profile)
+        note = change or feedback.strip() or "adjusted"
+        if delta:
+            note = f"{_format_delta(delta)}; {note}"
+        self.round_count += 1
+        number = self.round_count
+        self.recent.append((number, note[:self.note_chars]))
+        self.profile = normalize_profile(profile)
+        self.formulation = formulation
+        self.rounds.append({"round": number, "changes": _format_delta(delta), "feedback": feedback.strip(),
+                            "change": change, **stats})
+
+
+def refine_formulation(client, model, temperature, session, profile, feedback, scheduler=None,
+                       priority=PRIORITY_INTERACTIVE, telemetry=None):
+    """Run one refinement round against ``session`` and return the refined formulation.
+
+    ``profile`` is the target after this round's slider changes; the session is updated
+    with the result, including the round's token usage and latency.
+    """
+    started = time.perf_counter()
+    messages = session.messages(profile, feedback)
+    timing = {}
+    try:
+        response = _create(client, scheduler, priority, model, temperature, messages, timing=timing)
+    except Exception:
+        _record_call(telemetry, model, "refine", started, timing, messages, error=True)
+        raise
+    text = response.choices[0].message.content
+    usage = getattr(response, "usage", None)
+    _record_call(telemetry, model, "refine", started, timing, messages, text, usage)
+    formulation = parse_formulation(text)
+    change = str(_reply_json(text).get("change", "")).strip()
+    session.record(profile, feedback, formulation, change, {
+        "prompt_tokens": usage.prompt_tokens if usage is not None else sum(len(m["content"]) for m in messages) // 4,
+        "completion_tokens": usage.completion_tokens if usage is not None else len(text) // 4,
+        "seconds": round(time.perf_counter() - started, 2),
+    })
+    return formulation
@@ -0,0 +1,401 @@
+"""Concurrent-session load test of streamlit-fragrance-app.py against the mock LLM server.
+
+For each session count, a fresh ``streamlit run`` server (one app process, with its own
+data directory) is started with ``OPENAI_BASE_URL`` pointing at ``mock_llm.py``, and
+that many simulated sessions connect to it at once. Each session is a websocket
+client speaking the browser's protocol: it sends widget changes as rerun requests
+(fragment reruns for widgets inside fragments) and waits for the script to finish.
+Every session repeats a workflow of module switches, profile edits and streamed
+generations on its own project.
+
+    python loadtest.py --sessions 1,2,4,8,16 --cycles 5
+    python loadtest.py --sessions 8 --latency lognormal:1.0,0.6 --rate-limit-rate 0.1 --error-rate 0.02
+
+Reports throughput, p50/p95/p99 interaction latency (overall and for generations),
+LLM errors shown to users and the app server's resident memory per session count,
+plus the largest count whose p95 stays within ``--target-p95``. Latency is measured
+from sending a rerun to receiving its ``script_finished`` message, so it covers the
+server's work and the network but not browser rendering.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from websockets.asyncio.client import connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from benchmark import APP_PATH, seed_projects
+from mock_llm import add_server_arguments, parse_latency, server_arguments
+
+MOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_llm.py")
+
+WORKSPACE_MODULES = ["📋 Profile", "🧪 Formulation", "📊 Analysis", "🔄 Refinement"]
+
+# Element types that are widgets, and the WidgetState field each reports its value in
+WIDGET_VALUE_FIELDS = {
+    "button": "trigger_value",
+    "checkbox": "bool_value",
+    "radio": "string_value",
+    "selectbox": "string_value",
+    "slider": "double_array_value",
+    "text_area": "string_value",
+    "text_input": "string_value",
+}
+
+
+class SessionClient:
+    """One simulated browser tab on a Streamlit server's websocket stream.
+
+    Widgets are found by key or label among the elements of the latest run. Only the
+    widgets changed by an interaction are sent; the server keeps every other widget's
+    value from the previous run, as it does for a browser.
+    """
+
+    def __init__(self, url, timeout=300):
+        self.url = url
+        self.timeout = timeout
+        self.widgets = {}
+        self.alerts = []
+        self.exceptions = 0
+        self._ws = None
+
+    async def open(self):
+        self._ws = await connect(self.url, subprotocols=["streamlit"], max_size=None, open_timeout=60,
+                                 ping_interval=None)
+        await self.rerun()
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+
+    def find(self, kind, key=None, label=None):
+        for widget_id, (widget_kind, proto, fragment_id) in self.widgets.items():
+            # Keyed widget ids end with their user key
+            if widget_kind == kind and (widget_id.endswith(f"-{key}") if key else proto.label == label):
+                return widget_id, fragment_id
+        raise LookupError(f"no {kind} with key={key!r} label={label!r} in the latest run")
+
+    async def interact(self, *changes):
+        """Apply ``(kind, key_or_label, value)`` changes in one rerun and wait for it to finish."""
+        states, fragment_ids = [], set()
+        for kind, name, value in changes:
+            try:
+                widget_id, fragment_id = self.find(kind, key=name)
+            except LookupError:
+                widget_id, fragment_id = self.find(kind, label=name)
+            states.append((widget_id, WIDGET_VALUE_FIELDS[kind], value))
+            fragment_ids.add(fragment_id)
+        # Widgets inside one fragment rerun just that fragment, as in the browser
+        fragment_id = fragment_ids.pop() if len(fragment_ids) == 1 else ""
+        await self.rerun(states, fragment_id)
+
+    async def rerun(self, states=(), fragment_id=""):
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.fragment_id = fragment_id
+        for widget_id, field, value in states:
+            widget = client_state.widget_states.widgets.add()
+            widget.id = widget_id
+            if field == "double_array_value":
+                widget.double_array_value.data.extend([float(value)])
+            else:
+                setattr(widget, field, value)
+        if not fragment_id:
+            self.widgets = {}
+        self.alerts, self.exceptions = [], 0
+        await self._ws.send(message.SerializeToString())
+        await asyncio.wait_for(self._receive_run(), self.timeout)
+
+    async def _receive_run(self):
+        while True:
+            msg = ForwardMsg.FromString(await self._ws.recv())
+            kind = msg.WhichOneof("type")
+            if kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type in WIDGET_VALUE_FIELDS:
+                    proto = getattr(element, element_type)
+                    self.widgets[proto.id] = (element_type, proto, msg.delta.fragment_id)
+                elif element_type == "alert":
+                    self.alerts.append((element.alert.format, element.alert.body))
+                elif element_type == "exception":
+                    self.exceptions += 1
+            elif kind == "script_finished" and msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("app failed to compile")
+                return
+
+
+async def _open_profile(session, cycle):
+    await session.interact(("radio", "active_module", WORKSPACE_MODULES[0]))
+
+
+async def _edit_profile(session, cycle):
+    # Two sliders give 49 distinct profiles per session before briefs repeat and hit the cache
+    await session.interact(("slider", "slider_Woody", cycle % 7 + 1), ("slider", "slider_Fresh", cycle // 7 % 7 + 1))
+
+
+async def _open_formulation(session, cycle):
+    await session.interact(("radio", "active_module", WORKSPACE_MODULES[1]))
+
+
+async def _generate(session, cycle):
+    await session.interact(("button", "generate_formulation_btn", True))
+
+
+async def _open_analysis(session, cycle):
+    await session.interact(("radio", "active_module", WORKSPACE_MODULES[2]))
+
+
+# One cycle of a simulated user's work, as (interaction kind, action) pairs
+WORKFLOW = (
+    ("navigate", _open_profile),
+    ("edit_profile", _edit_profile),
+    ("navigate", _open_formulation),
+    ("generate", _generate),
+    ("navigate", _open_analysis),
+)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of ``values`` (0 < q <= 100), or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, -(-len(ordered) * q // 100) - 1))]
+
+
+def process_memory_mb(pid):
+    """``(resident, peak resident)`` MB of a process from /proc, or ``(None, None)`` elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as fileobj:
+            fields = dict(line.split(":", 1) for line in fileobj if ":" in line)
+        return (int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024)
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not answer {url} within {timeout}s")
+
+
+def start_mock_server(args):
+    """Launch ``mock_llm.py`` on a free port; returns ``(process, base_url)``."""
+    process = subprocess.Popen([sys.executable, MOCK_PATH, "--port", "0"] + server_arguments(args),
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.kill()
+        raise RuntimeError("mock LLM server failed to start")
+    return process, base_url
+
+
+def start_app_server(data_dir, base_url):
+    """Launch the app headless on a free port; returns ``(process, port)``."""
+    port = _free_port()
+    env = dict(os.environ, ESSENCE_DATA_DIR=data_dir, OPENAI_BASE_URL=base_url)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true",
+         "--server.address", "127.0.0.1", "--server.port", str(port), "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false", "--logger.level", "error"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_for(f"http://127.0.0.1:{port}/_stcore/health", process)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process, port
+
+
+def _server_stats(base_url, reset=False):
+    root = base_url.rsplit("/v1", 1)[0]
+    request = urllib.request.Request(f"{root}/stats/reset" if reset else f"{root}/stats",
+                                     data=b"" if reset else None)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)
+
+
+async def warm_up(url):
+    """Run the app once so imports and shared resources are loaded before memory is measured."""
+    session = SessionClient(url)
+    try:
+        await session.open()
+    finally:
+        await session.close()
+
+
+async def run_sessions(url, count, cycles, think_time=0.0, reuse_similar=False):
+    """Connect ``count`` sessions, then run the workflow on all of them at once."""
+    sessions = [SessionClient(url) for _ in range(count)]
+    try:
+        # Sessions open their projects one at a time; setup is not part of what is measured
+        for index, session in enumerate(sessions):
+            await session.open()
+            await session.interact(("text_input", "API Key", "sk-loadtest"))
+            if not reuse_similar:
+                await session.interact(("checkbox", "reuse_similar", False))
+            name = f"Bench {index:05d}"
+            await session.interact(("text_input", "project_search", name), ("selectbox", "project_picker", name))
+
+        timings = {kind: [] for kind, _ in WORKFLOW}
+        outcomes = {"generated": 0, "cached": 0, "llm_errors": 0, "app_errors": 0}
+
+        async def drive(session):
+            for cycle in range(cycles):
+                for kind, action in WORKFLOW:
+                    started = time.perf_counter()
+                    await action(session, cycle)
+                    timings[kind].append(time.perf_counter() - started)
+                    outcomes["app_errors"] += session.exceptions
+                    if kind == "generate":
+                        bodies = [body for _, body in session.alerts]
+                        outcomes["llm_errors"] += sum("generation failed" in body for body in bodies)
+                        outcomes["cached"] += "Loaded formulation from cache" in bodies
+                        outcomes["generated"] += "Formulation generated" in bodies
+                    if think_time:
+                        await asyncio.sleep(think_time)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(drive(session) for session in sessions))
+        wall = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+
+    latencies = [t for values in timings.values() for t in values]
+    return {
+        "sessions": count,
+        "interactions": len(latencies),
+        "wall_seconds": round(wall, 2),
+        "throughput_per_second": round(len(latencies) / wall, 2),
+        "generations_per_second": round(len(timings["generate"]) / wall, 2),
+        **{f"p{q}_seconds": round(percentile(latencies, q), 3) for q in (50, 95, 99)},
+        **{f"generate_p{q}_seconds": round(percentile(timings["generate"], q), 3) for q in (50, 95, 99)},
+        **outcomes,
+    }
+
+
+def run_isolated(count, args, base_url):
+    """Measure one session count on a fresh app server with its own seeded data directory."""
+    from store import ProjectStore
+
+    _server_stats(base_url, reset=True)
+    with tempfile.TemporaryDirectory() as data_dir:
+        store = ProjectStore(Path(data_dir) / "studio.sqlite3")
+        store.seed_if_empty()
+        seed_projects(count, store)
+        del store
+        try:
+            process, port = start_app_server(data_dir, base_url)
+        except RuntimeError as e:
+            return {"sessions": count, "error": str(e)}
+        url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        try:
+            asyncio.run(warm_up(url))
+            warm_mb, _ = process_memory_mb(process.pid)
+            result = asyncio.run(run_sessions(url, count, args.cycles, args.think_time, args.reuse_similar))
+            rss_mb, peak_mb = process_memory_mb(process.pid)
+        except Exception as e:
+            return {"sessions": count, "error": f"{type(e).__name__}: {e}"}
+        finally:
+            process.terminate()
+            process.wait()
+    if rss_mb is not None:
+        result.update(rss_warm_mb=round(warm_mb, 1), rss_mb=round(rss_mb, 1), rss_peak_mb=round(peak_mb, 1),
+                      rss_per_session_mb=round((rss_mb - warm_mb) / count, 2))
+    stats = _server_stats(base_url)
+    result["server"] = {name: stats[name] for name in
+                        ("requests", "completed", "rate_limited", "server_errors", "max_in_flight")}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test concurrent app sessions against a mock LLM.")
+    parser.add_argument("--sessions", default="1,2,4,8", help="comma-separated session counts to test")
+    parser.add_argument("--cycles", type=int, default=5, help="workflow cycles per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds a session pauses between interactions")
+    parser.add_argument("--reuse-similar", action="store_true",
+                        help="leave semantic reuse on, so similar briefs skip the LLM")
+    parser.add_argument("--target-p95", type=float, default=2.0,
+                        help="interaction p95 seconds a session count must stay within to count as served")
+    parser.add_argument("--base-url", help="use a running mock server instead of starting one")
+    parser.add_argument("--output", default="loadtest_results.json")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    try:
+        parse_latency(args.latency)
+        counts = sorted({int(n) for n in args.sessions.split(",")})
+    except ValueError as e:
+        parser.error(str(e))
+
+    process, base_url = (None, args.base_url) if args.base_url else start_mock_server(args)
+    results = []
+    try:
+        print(f"{'sessions':>8} {'inter/s':>8} {'gen/s':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'gen p95':>8} "
+              f"{'llm err':>7} {'429s':>5} {'rss MB':>7} {'MB/sess':>7}")
+        for count in counts:
+            result = run_isolated(count, args, base_url)
+            results.append(result)
+            if "error" in result:
+                print(f"{count:>8} FAILED: {result['error']}")
+                continue
+            print(f"{count:>8} {result['throughput_per_second']:>8} {result['generations_per_second']:>6} "
+                  f"{result['p50_seconds']:>7} {result['p95_seconds']:>7} {result['p99_seconds']:>7} "
+                  f"{result['generate_p95_seconds']:>8} {result['llm_errors']:>7} "
+                  f"{result['server']['rate_limited']:>5} {result.get('rss_mb', '-'):>7} "
+                  f"{result.get('rss_per_session_mb', '-'):>7}", flush=True)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    served = [r["sessions"] for r in results
+              if "error" not in r and r["p95_seconds"] <= args.target_p95 and not r["app_errors"]]
+    capacity = max(served) if served else 0
+    print(f"Sessions served within p95 {args.target_p95}s: {capacity or 'none'}"
+          + (" (raise --sessions to find the limit)" if capacity and capacity == counts[-1] else ""))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "server": {"latency": args.latency, "tokens_per_second": args.tokens_per_second,
+                   "rate_limit_rate": args.rate_limit_rate, "error_rate": args.error_rate},
+        "workflow": [kind for kind, _ in WORKFLOW],
+        "cycles": args.cycles,
+        "target_p95_seconds": args.target_p95,
+        "capacity_sessions": capacity,
+        "results": results,
+    }
+    with open(args.output, "w") as fileobj:
+        json.dump(report, fileobj, indent=2)
+    sys.exit(0 if all("error" not in r for r in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
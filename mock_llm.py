@@ -0,0 +1,306 @@
+"""Local stand-in for the OpenAI chat-completions API, for load tests and offline demos.
+
+Replies are well-formed formulation JSON chosen deterministically from the request,
+served with a configurable latency distribution and token rate, and with a share of
+requests failing with 429 (with ``Retry-After``) or 500 responses. Streaming, the
+final usage chunk (``stream_options.include_usage``) and HTTP keep-alive are
+supported. Point the app or ``batch.py`` at it through the OpenAI SDK's
+``OPENAI_BASE_URL`` environment variable:
+
+    python mock_llm.py --port 8765 --latency lognormal:0.6,0.5 --tokens-per-second 80 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run streamlit-fragrance-app.py
+
+``GET /stats`` returns request counters; ``POST /stats/reset`` zeroes them.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (name, note) pairs replies are drawn from; all are in the bundled ingredient catalog
+INGREDIENTS = (
+    ("Bergamot Oil", "top"), ("Lemon Oil", "top"), ("Grapefruit Oil", "top"), ("Mandarin Oil", "top"),
+    ("Pink Pepper Oil", "top"), ("Cardamom Oil", "top"), ("Lavender Oil", "heart"), ("Hedione", "heart"),
+    ("Rose Absolute", "heart"), ("Jasmine Absolute", "heart"), ("Geraniol", "heart"), ("Clove Bud Oil", "heart"),
+    ("Iso E Super", "base"), ("Cedarwood Oil", "base"), ("Sandalwood Oil", "base"), ("Vetiver Oil", "base"),
+    ("Ambroxan", "base"), ("Vanillin", "base"), ("Tonka Bean Absolute", "base"), ("Patchouli Oil", "base"),
+)
+
+# Characters per streamed token, matching the four-characters-per-token estimate used elsewhere
+CHARS_PER_TOKEN = 4
+
+
+def parse_latency(spec):
+    """Build a sampler from ``fixed:S``, ``uniform:LOW,HIGH``, ``lognormal:MEDIAN,SIGMA`` or ``exponential:MEAN``.
+
+    Values are seconds until the first token (or the whole reply when not streaming,
+    before token time is added).
+    """
+    kind, _, args = spec.partition(":")
+    try:
+        values = [float(v) for v in args.split(",")] if args else []
+        if kind == "fixed" and len(values) == 1:
+            return lambda rng: values[0]
+        if kind == "uniform" and len(values) == 2:
+            return lambda rng: rng.uniform(*values)
+        if kind == "lognormal" and len(values) == 2:
+            median, sigma = values
+            return lambda rng: median * rng.lognormvariate(0, sigma)
+        if kind == "exponential" and len(values) == 1:
+            return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    except ValueError:
+        pass
+    raise ValueError(f"invalid latency spec {spec!r}")
+
+
+def formulation_reply(messages):
+    """Deterministic formulation JSON for a conversation; refine prompts also get a ``change``."""
+    text = json.dumps(messages, sort_keys=True)
+    rng = random.Random(zlib.crc32(text.encode("utf-8")))
+    chosen = rng.sample(INGREDIENTS, rng.randint(4, 8))
+    weights = [rng.uniform(1, 10) for _ in chosen]
+    shares = [round(100 * w / sum(weights), 1) for w in weights]
+    shares[-1] = round(100 - sum(shares[:-1]), 1)
+    reply = {
+        "name": f"Mock Accord {zlib.crc32(text.encode('utf-8')) % 10000:04d}",
+        "ingredients": [{"name": name, "percentage": share, "note": note}
+                        for (name, note), share in zip(chosen, shares)],
+        "notes": "Generated by the local mock server.",
+    }
+    if messages and '"change"' in str(messages[0].get("content", "")):
+        reply["change"] = f"Rebalanced {chosen[0][0]} and {chosen[-1][0]}."
+    return json.dumps(reply)
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {"requests": 0, "completed": 0, "streamed": 0, "rate_limited": 0, "server_errors": 0,
+                           "bad_requests": 0, "completion_tokens": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                self.counts[name] += delta
+            self.counts["max_in_flight"] = max(self.counts["max_in_flight"], self.counts["in_flight"])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockLLM/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.stats.snapshot())
+        elif self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self._send_error(404, "not_found", f"No route for GET {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.path.rstrip("/") == "/stats/reset":
+            self.server.stats.reset()
+            self._send_json(200, {})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_error(404, "not_found", f"No route for POST {self.path}")
+            return
+        try:
+            request = json.loads(body)
+            messages = request["messages"]
+        except (ValueError, KeyError, TypeError):
+            self.server.stats.add(bad_requests=1)
+            self._send_error(400, "invalid_request_error", "Request body must be JSON with messages")
+            return
+
+        server, stats = self.server, self.server.stats
+        stats.add(requests=1, in_flight=1)
+        try:
+            with server.rng_lock:
+                roll = server.rng.random()
+                latency = max(0.0, server.latency(server.rng))
+            if roll < server.rate_limit_rate:
+                stats.add(rate_limited=1)
+                self._send_error(429, "rate_limit_error", "Rate limit reached (mock)", code="rate_limit_exceeded",
+                                 headers={"Retry-After": f"{server.retry_after:g}"})
+                return
+            if roll < server.rate_limit_rate + server.error_rate:
+                time.sleep(latency)
+                stats.add(server_errors=1)
+                self._send_error(500, "server_error", "Internal server error (mock)")
+                return
+
+            content = formulation_reply(messages)
+            prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // CHARS_PER_TOKEN
+            completion_tokens = -(-len(content) // CHARS_PER_TOKEN)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            token_seconds = completion_tokens / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+            model = request.get("model", "mock")
+            if request.get("stream"):
+                include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+                self._stream(model, content, latency, token_seconds / completion_tokens,
+                             usage if include_usage else None)
+                stats.add(streamed=1)
+            else:
+                time.sleep(latency + token_seconds)
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion",
+                    "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+            stats.add(completed=1, completion_tokens=completion_tokens)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away mid-reply, e.g. a session navigated off a streaming request
+            self.close_connection = True
+        finally:
+            stats.add(in_flight=-1)
+
+    def _stream(self, model, content, latency, seconds_per_token, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def chunk(choices, **extra):
+            event = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": choices, **extra}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+
+        time.sleep(latency)
+        chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        # Pace tokens against a deadline so sleep overhead does not slow the stream down
+        started = time.perf_counter()
+        for i, start in enumerate(range(0, len(content), CHARS_PER_TOKEN)):
+            delay = started + i * seconds_per_token - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            chunk([{"index": 0, "delta": {"content": content[start:start + CHARS_PER_TOKEN]}, "finish_reason": None}])
+        chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            chunk([], usage=usage)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, error_type, message, code=None, headers=None):
+        self._send_json(status, {"error": {"message": message, "type": error_type, "param": None, "code": code}},
+                        headers)
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering chat completions; one thread per connection."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address=("127.0.0.1", 0), latency="lognormal:0.5,0.4", tokens_per_second=60.0,
+                 rate_limit_rate=0.0, error_rate=0.0, retry_after=1.0, seed=None, verbose=False):
+        super().__init__(address, MockHandler)
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats = MockStats()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve on a daemon thread and return the base URL for ``OPENAI_BASE_URL``."""
+        threading.Thread(target=self.serve_forever, name="mock-llm", daemon=True).start()
+        return self.base_url
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:0.5,0.4",
+                        help="seconds to first token: fixed:S, uniform:LOW,HIGH, lognormal:MEDIAN,SIGMA "
+                             "or exponential:MEAN (default: %(default)s)")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0,
+                        help="completion token rate; 0 sends the reply at once (default: %(default)s)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None, help="seed for latencies and injected errors")
+
+
+def server_arguments(args):
+    """Command-line flags reproducing the server options in ``args``, for launching a server process."""
+    return ["--latency", args.latency, "--tokens-per-second", str(args.tokens_per_second),
+            "--rate-limit-rate", str(args.rate_limit_rate), "--error-rate", str(args.error_rate),
+            "--retry-after", str(args.retry_after)] + ([] if args.seed is None else ["--seed", str(args.seed)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat-completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    try:
+        parse_latency(args.latency)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = MockLLMServer((args.host, args.port), latency=args.latency, tokens_per_second=args.tokens_per_second,
+                           rate_limit_rate=args.rate_limit_rate, error_rate=args.error_rate,
+                           retry_after=args.retry_after, seed=args.seed, verbose=args.verbose)
+    # The first stdout line is the base URL, so scripts can start the server on port 0
+    print(server.base_url, flush=True)
+    print(f"Mock chat completions at {server.base_url} (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import streamlit as st
+from PIL import Image, ImageDraw, ImageFont
+
+from config import data_path
+
+logger = logging.getLogger(__name__)
+
+# Bump when the drawing changes so stale thumbnails are not served from disk
+RENDERER_VERSION = 1
+
+THUMBNAIL_SIZES = (64, 128, 256)
+
+# Structure shown for each catalog ingredient: (molecule, SMILES). Naturals show a
+# characteristic constituent.
+STRUCTURES = {
+    "Bergamot Oil": ("Linalyl acetate", "CC(=O)OC(C)(CCC=C(C)C)C=C"),
+    "Lemon Oil": ("Limonene", "CC1=CCC(CC1)C(=C)C"),
+    "Sweet Orange Oil": ("Limonene", "CC1=CCC(CC1)C(=C)C"),
+    "Grapefruit Oil": ("Nootkatone", "CC1CC(=O)C=C2C1(C)CC(CC2)C(=C)C"),
+    "Mandarin Oil": ("Methyl N-methylanthranilate", "CNc1ccccc1C(=O)OC"),
+    "Lime Oil": ("Limonene", "CC1=CCC(CC1)C(=C)C"),
+    "Citral": ("Citral", "CC(C)=CCCC(C)=CC=O"),
+    "Peppermint Oil": ("Menthol", "CC(C)C1CCC(C)CC1O"),
+    "Rosemary Oil": ("1,8-Cineole", "CC12CCC(CC1)C(C)(C)O2"),
+    "Basil Oil": ("Estragole", "COc1ccc(CC=C)cc1"),
+    "Galbanum Oil": ("2-Methoxy-3-isobutylpyrazine", "COc1nccnc1CC(C)C"),
+    "Cis-3-Hexenol": ("cis-3-Hexenol", "CCC=CCCO"),
+    "Black Pepper Oil": ("beta-Caryophyllene", "CC1=CCCC(=C)C2CC(C)(C)C2CC1"),
+    "Cardamom Oil": ("alpha-Terpinyl acetate", "CC1=CCC(CC1)C(C)(C)OC(C)=O"),
+    "Pink Pepper Oil": ("alpha-Pinene", "CC1=CCC2CC1C2(C)C"),
+    "Linalool": ("Linalool", "CC(C)=CCCC(C)(O)C=C"),
+    "Lavender Oil": ("Linalyl acetate", "CC(=O)OC(C)(CCC=C(C)C)C=C"),
+    "Clary Sage Oil": ("Linalyl acetate", "CC(=O)OC(C)(CCC=C(C)C)C=C"),
+    "Hedione": ("Methyl dihydrojasmonate", "CCCCCC1C(CC(=O)OC)CCC1=O"),
+    "Phenylethyl Alcohol": ("2-Phenylethanol", "OCCc1ccccc1"),
+    "Rose Absolute": ("Citronellol", "CC(CCC=C(C)C)CCO"),
+    "Jasmine Absolute": ("Benzyl acetate", "CC(=O)OCc1ccccc1"),
+    "Ylang Ylang Oil": ("Benzyl benzoate", "O=C(OCc1ccccc1)c1ccccc1"),
+    "Geraniol": ("Geraniol", "CC(C)=CCCC(C)=CCO"),
+    "Heliotropin": ("Piperonal", "O=Cc1ccc2OCOc2c1"),
+    "Alpha Isomethyl Ionone": ("alpha-Isomethyl ionone", "CC1=CCCC(C)(C)C1C=C(C)C(C)=O"),
+    "Cinnamon Bark Oil": ("Cinnamaldehyde", "O=CC=Cc1ccccc1"),
+    "Clove Bud Oil": ("Eugenol", "COc1cc(CC=C)ccc1O"),
+    "Gamma Decalactone": ("gamma-Decalactone", "CCCCCCC1CCC(=O)O1"),
+    "Delta Decalactone": ("delta-Decalactone", "CCCCCC1CCCC(=O)O1"),
+    "Raspberry Ketone": ("Raspberry ketone", "CC(=O)CCc1ccc(O)cc1"),
+    "Acetyl Pyrazine": ("Acetylpyrazine", "CC(=O)c1cnccn1"),
+    "Iso E Super": ("OTNE", "CC(=O)C1(C)CC2=C(CCCC2(C)C)CC1C"),
+    "Cedarwood Oil": ("Cedrol", "CC1CCC2C13CCC(C)(O)C(C3)C2(C)C"),
+    "Oakmoss Absolute": ("Methyl atrarate", "COC(=O)c1c(C)cc(O)c(C)c1O"),
+    "Ambroxan": ("Ambroxide", "CC1(C)CCCC2(C)C1CCC1(C)OCCC12"),
+    "Vanillin": ("Vanillin", "COc1cc(C=O)ccc1O"),
+    "Ethyl Vanillin": ("Ethyl vanillin", "CCOc1cc(C=O)ccc1O"),
+    "Ethyl Maltol": ("Ethyl maltol", "CCc1occc(=O)c1O"),
+    "Coumarin": ("Coumarin", "O=c1ccc2ccccc2o1"),
+    "Tonka Bean Absolute": ("Coumarin", "O=c1ccc2ccccc2o1"),
+    "Benzoin Resinoid": ("Benzyl benzoate", "O=C(OCc1ccccc1)c1ccccc1"),
+    "Peru Balsam": ("Benzyl cinnamate", "O=C(OCc1ccccc1)C=Cc1ccccc1"),
+    "Galaxolide": ("Galaxolide", "CC1COCc2cc3c(cc21)C(C)(C)C(C)C3(C)C"),
+    "Habanolide": ("Habanolide", "O=C1CCCCCCCCCC=CCCCO1"),
+    "Ethylene Brassylate": ("Ethylene brassylate", "O=C1CCCCCCCCCCCC(=O)OCCO1"),
+}
+
+_STRUCTURE_KEYS = {name.lower(): name for name in STRUCTURES}
+
+ATOM_COLORS = {"O": (200, 40, 40), "N": (40, 70, 200), "S": (190, 160, 20)}
+
+_TOKEN = re.compile(r"\[[^\]]+\]|Br|Cl|[BCNOSPFI]|[bcnosp]|[=#:/\\.\-]|[()]|%\d{2}|\d")
+
+
+def structure_for(ingredient):
+    """``(molecule, smiles)`` for a catalog ingredient name, or None."""
+    name = _STRUCTURE_KEYS.get(ingredient.strip().lower())
+    return STRUCTURES[name] if name else None
+
+
+def parse_smiles(smiles):
+    """Parse a SMILES string into ``(atoms, bonds)``.
+
+    ``atoms`` is a list of ``(element, aromatic)``; ``bonds`` a list of ``(i, j, order)``
+    with order 1, 2, 3 or 1.5 for aromatic. Covers the organic subset, bracket atoms,
+    branches and ring closures; stereo marks are ignored.
+    """
+    atoms, bonds = [], []
+    stack, rings = [], {}
+    previous, order = None, None
+    for token in _TOKEN.findall(smiles):
+        if token == "(":
+            stack.append(previous)
+        elif token == ")":
+            previous = stack.pop()
+        elif token == ".":
+            previous = None
+        elif token in "-/\\":
+            order = 1
+        elif token in "=#:":
+            order = {"=": 2, "#": 3, ":": 1.5}[token]
+        elif token[0] == "%" or token.isdigit():
+            digit = token.lstrip("%")
+            if digit in rings:
+                other, ring_order = rings.pop(digit)
+                bonds.append((other, previous, order or ring_order or _default_order(atoms, other, previous)))
+            else:
+                rings[digit] = (previous, order)
+            order = None
+        else:
+            symbol = re.match(r"\[?\d*([A-Z][a-z]?|[a-z]{1,2})", token).group(1)
+            atoms.append((symbol.capitalize(), symbol.islower()))
+            index = len(atoms) - 1
+            if previous is not None:
+                bonds.append((previous, index, order or _default_order(atoms, previous, index)))
+            previous, order = index, None
+    if rings:
+        raise ValueError(f"Unclosed ring in SMILES {smiles!r}")
+    return atoms, bonds
+
+
+def _default_order(atoms, i, j):
+    return 1.5 if atoms[i][1] and atoms[j][1] else 1
+
+
+def layout(atoms, bonds, iterations=200):
+    """2-D coordinates with unit bond length by stress majorization over graph distances."""
+    n = len(atoms)
+    if n == 1:
+        return np.zeros((1, 2))
+    adjacency = np.zeros((n, n), dtype=bool)
+    for i, j, _ in bonds:
+        adjacency[i, j] = adjacency[j, i] = True
+
+    # All-pairs shortest paths by repeated boolean frontier expansion
+    distance = np.full((n, n), np.inf)
+    np.fill_diagonal(distance, 0)
+    reached = np.eye(n, dtype=bool)
+    step = 0
+    while True:
+        step += 1
+        frontier = (reached.astype(np.int32) @ adjacency.astype(np.int32)) > 0
+        new = frontier & ~reached
+        if not new.any():
+            break
+        distance[new] = step
+        reached |= new
+    # Disconnected fragments sit a little apart
+    distance[np.isinf(distance)] = distance[np.isfinite(distance)].max() + 2
+
+    # Target separations: 120-degree zigzag along chains, regular polygons within rings
+    steps = distance
+    distance = np.sqrt((steps * np.sqrt(3) / 2) ** 2 + 0.25 * (steps % 2))
+    for ring in _rings(n, bonds):
+        size = len(ring)
+        positions = np.arange(size)
+        around = np.abs(positions[:, None] - positions[None, :])
+        around = np.minimum(around, size - around)
+        chord = np.sin(np.pi * around / size) / np.sin(np.pi / size)
+        distance[np.ix_(ring, ring)] = np.minimum(distance[np.ix_(ring, ring)], chord)
+
+    # Classical MDS start, then SMACOF with Kamada-Kawai weights
+    centering = np.eye(n) - 1.0 / n
+    gram = -0.5 * centering @ (distance ** 2) @ centering
+    values, vectors = np.linalg.eigh(gram)
+    coords = vectors[:, -2:] * np.sqrt(np.maximum(values[-2:], 1e-9))
+    # Fixed jitter lets symmetric, nearly linear starts unfold rings out of the plane's main axis
+    coords += np.random.default_rng(0).normal(scale=0.3, size=coords.shape)
+    weights = np.zeros_like(distance)
+    off_diagonal = distance > 0
+    weights[off_diagonal] = steps[off_diagonal] ** -2
+    v_matrix = np.diag(weights.sum(axis=1)) - weights
+    v_pinv = np.linalg.pinv(v_matrix)
+    for _ in range(iterations):
+        current = np.linalg.norm(coords[:, None, :] - coords[None, :, :], axis=2)
+        ratio = np.zeros_like(current)
+        np.divide(weights * distance, current, out=ratio, where=current > 1e-9)
+        b_matrix = np.diag(ratio.sum(axis=1)) - ratio
+        coords = v_pinv @ b_matrix @ coords
+    return coords - coords.mean(axis=0)
+
+
+def _rings(atom_count, bonds):
+    """Smallest cycle closed by each ring bond, in parse order."""
+    neighbours = {i: set() for i in range(atom_count)}
+    rings = []
+    for i, j, _ in bonds:
+        # A bond between atoms that are already connected closes a ring; adding it afterwards
+        # lets fused rings find their short cycle through the shared edge
+        path = _path(neighbours, i, j)
+        if path is not None:
+            rings.append(path)
+        neighbours[i].add(j)
+        neighbours[j].add(i)
+    return rings
+
+
+def _path(neighbours, start, goal):
+    parents = {start: None}
+    queue = [start]
+    for node in queue:
+        if node == goal:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = parents[node]
+            return path
+        for nxt in neighbours[node]:
+            if nxt not in parents:
+                parents[nxt] = node
+                queue.append(nxt)
+    return None
+
+
+def render_structure(smiles, size, scale=3):
+    """Skeletal formula of ``smiles`` as optimized PNG bytes, ``size`` pixels square.
+
+    Drawn at ``scale`` times the target size and downsampled for antialiasing.
+    """
+    atoms, bonds = parse_smiles(smiles)
+    coords = layout(atoms, bonds)
+    canvas = size * scale
+    margin = canvas * 0.12
+    span = max(np.ptp(coords, axis=0).max(), 1.0)
+    unit = (canvas - 2 * margin) / span
+    points = (coords - coords.min(axis=0)) * unit
+    points += (canvas - (np.ptp(coords, axis=0) * unit)) / 2
+    points[:, 1] = canvas - points[:, 1]
+
+    image = Image.new("RGB", (canvas, canvas), "white")
+    draw = ImageDraw.Draw(image)
+    line = max(1, round(unit * 0.06))
+    ink = (58, 47, 91)
+    labelled = [atoms[i][0] != "C" for i in range(len(atoms))]
+    font_size = max(8, round(unit * 0.45))
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError:
+        font = ImageFont.load_default()
+
+    for i, j, order in bonds:
+        start, end = _trim(points[i], points[j], labelled[i], labelled[j], unit * 0.28)
+        draw.line([tuple(start), tuple(end)], fill=ink, width=line)
+        if order in (2, 3):
+            direction = end - start
+            normal = np.array([-direction[1], direction[0]]) / max(np.linalg.norm(direction), 1e-9)
+            for k in range(1, int(order)):
+                offset = normal * unit * 0.16 * (k if order == 2 else (1 if k == 1 else -1))
+                shrink = direction * 0.12
+                draw.line([tuple(start + offset + shrink), tuple(end + offset - shrink)], fill=ink, width=line)
+    for ring in _rings(len(atoms), bonds):
+        if not all(atoms[k][1] for k in ring):
+            continue
+        centre = points[ring].mean(axis=0)
+        radius = np.linalg.norm(points[ring] - centre, axis=1).mean() * 0.6
+        draw.ellipse([tuple(centre - radius), tuple(centre + radius)], outline=ink, width=line)
+    for i, (element, _) in enumerate(atoms):
+        if labelled[i]:
+            x, y = points[i]
+            draw.text((x, y), element, fill=ATOM_COLORS.get(element, ink), font=font, anchor="mm")
+
+    image = image.resize((size, size), Image.LANCZOS).quantize(colors=32)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _trim(start, end, trim_start, trim_end, gap):
+    # Leave room around heteroatom labels
+    direction = (end - start) / max(np.linalg.norm(end - start), 1e-9)
+    return (start + direction * gap if trim_start else start), (end - direction * gap if trim_end else end)
+
+
+class ThumbnailCache:
+    """Content-addressed PNG thumbnails: an in-memory LRU in front of a directory of files.
+
+    Files are named by a hash of renderer version, SMILES and size, so identical
+    structures share one file and renderer changes never serve stale images. Missing
+    thumbnails render on a small thread pool; ``get_ready`` never waits for them.
+    SMILES that fail to render are logged once and never scheduled again.
+    """
+
+    def __init__(self, directory, memory_size=512, workers=2):
+        self.directory = directory
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(smiles, size):
+        return hashlib.sha256(f"{RENDERER_VERSION}|{smiles}|{size}".encode("utf-8")).hexdigest()
+
+    def get(self, smiles, size):
+        """PNG bytes, rendering synchronously if necessary; None if the SMILES cannot be rendered."""
+        image = self.get_ready(smiles, size)
+        if image is None:
+            future = self._pending_future(smiles, size)
+            image = future.result() if future is not None else None
+        return image
+
+    def get_ready(self, smiles, size):
+        """PNG bytes if already rendered, else None after scheduling a background render."""
+        key = self.key(smiles, size)
+        with self._lock:
+            if key in self._failed:
+                return None
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                return image
+        path = self._path(key)
+        if os.path.exists(path):
+            with open(path, "rb") as fileobj:
+                image = fileobj.read()
+            self._remember(key, image)
+            return image
+        self._pending_future(smiles, size)
+        return None
+
+    def failed(self, smiles, size):
+        """True if rendering this thumbnail raised; ``get_ready`` returns None for it for good."""
+        with self._lock:
+            return self.key(smiles, size) in self._failed
+
+    def precompute(self, smiles_list, sizes=THUMBNAIL_SIZES):
+        """Schedule every missing thumbnail; returns immediately."""
+        for smiles in dict.fromkeys(smiles_list):
+            for size in sizes:
+                if not os.path.exists(self._path(self.key(smiles, size))):
+                    self._pending_future(smiles, size)
+
+    def wait(self):
+        """Block until every scheduled render has finished."""
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            future.result()
+
+    def _pending_future(self, smiles, size):
+        key = self.key(smiles, size)
+        with self._lock:
+            if key in self._failed:
+                return None
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._render, key, smiles, size)
+                self._pending[key] = future
+            return future
+
+    def _render(self, key, smiles, size):
+        try:
+            image = render_structure(smiles, size)
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see a partial image
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as fileobj:
+                fileobj.write(image)
+            os.replace(tmp_path, path)
+            self._remember(key, image)
+            return image
+        except Exception:
+            # Caught here so the error is seen even when nobody reads the future
+            logger.warning("Could not render thumbnail for SMILES %r", smiles, exc_info=True)
+            with self._lock:
+                self._failed.add(key)
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _remember(self, key, image):
+        with self._lock:
+            self._memory[key] = image
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+
+@st.cache_resource(show_spinner=False)
+def get_thumbnail_cache():
+    cache = ThumbnailCache(str(data_path("thumbnails")))
+    # Warm every catalog structure in the background so formulations rarely wait
+    cache.precompute(smiles for _, smiles in STRUCTURES.values())
+    return cache
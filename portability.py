@@ -0,0 +1,326 @@
+import argparse
+import gzip
+import io
+import json
+import math
+import os
+import tempfile
+from datetime import datetime
+
+from profiles import ALL_DESCRIPTORS
+from store import MAX_PROJECT_NAME_LENGTH, ProjectStore
+
+EXPORT_FORMATS = {"JSON Lines": ".jsonl.gz", "Parquet": ".parquet"}
+
+# Flat column layout shared by both record types in Parquet exports
+PARQUET_COLUMNS = ["type", "project", "created", "description", "formulations",
+                   "untracked_formulations", "profile", "formulation"]
+
+MAX_REPORTED_ERRORS = 20
+
+# Streamlit keeps a download's bytes in memory, so larger exports go through the CLI instead
+MAX_DOWNLOAD_BYTES = 200 * 1024 * 1024
+
+
+def iter_records(store, project=None, chunk_size=500):
+    """Yield export records: every project (with its profile) first, then every formulation.
+
+    Rows are read in chunks from a separate read-only connection, so neither the full
+    dataset nor the store lock is held while the export is consumed.
+    """
+    conn = store.open_reader()
+    try:
+        where, params = ("WHERE p.name = ?", (project,)) if project else ("", ())
+        cursor = conn.execute(
+            "SELECT p.id, p.name, p.created, p.description, p.formulation_count, "
+            "p.formulation_count - (SELECT COUNT(*) FROM formulations f WHERE f.project_id = p.id) "
+            f"FROM projects p {where} ORDER BY p.id",
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            placeholders = ",".join("?" * len(rows))
+            profiles = {}
+            for project_id, descriptor, value in conn.execute(
+                f"SELECT project_id, descriptor, value FROM profiles WHERE project_id IN ({placeholders})",
+                [row[0] for row in rows],
+            ):
+                profiles.setdefault(project_id, {})[descriptor] = value
+            for project_id, name, created, description, count, untracked in rows:
+                yield {
+                    "type": "project",
+                    "name": name,
+                    "created": created,
+                    "description": description,
+                    "formulations": count,
+                    "untracked_formulations": max(0, untracked),
+                    "profile": profiles.get(project_id, {}),
+                }
+
+        cursor = conn.execute(
+            "SELECT p.name, f.created, f.payload FROM formulations f JOIN projects p ON p.id = f.project_id "
+            f"{where} ORDER BY f.id",
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for name, created, payload in rows:
+                yield {"type": "formulation", "project": name, "created": created, "formulation": json.loads(payload)}
+    finally:
+        conn.close()
+
+
+def write_jsonl(records, fileobj):
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as out:
+        for record in records:
+            out.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+
+
+def write_parquet(records, fileobj, batch_size=5000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("type", pa.string()), ("project", pa.string()), ("created", pa.string()),
+        ("description", pa.string()), ("formulations", pa.int64()), ("untracked_formulations", pa.int64()),
+        ("profile", pa.string()), ("formulation", pa.string()),
+    ])
+    with pq.ParquetWriter(fileobj, schema, compression="zstd") as writer:
+        batch = {column: [] for column in PARQUET_COLUMNS}
+        for record in records:
+            row = _parquet_row(record)
+            for column in PARQUET_COLUMNS:
+                batch[column].append(row[column])
+            if len(batch["type"]) >= batch_size:
+                writer.write_table(pa.table(batch, schema=schema))
+                batch = {column: [] for column in PARQUET_COLUMNS}
+        if batch["type"]:
+            writer.write_table(pa.table(batch, schema=schema))
+
+
+def export_to_file(store, fmt, project=None, directory=None):
+    """Stream an export to a temporary file and return its path."""
+    fd, path = tempfile.mkstemp(suffix=EXPORT_FORMATS[fmt], dir=directory)
+    with os.fdopen(fd, "wb") as fileobj:
+        records = iter_records(store, project=project)
+        if fmt == "Parquet":
+            write_parquet(records, fileobj)
+        else:
+            write_jsonl(records, fileobj)
+    return path
+
+
+def export_bytes(store, fmt, project=None, max_bytes=MAX_DOWNLOAD_BYTES):
+    """The finished export file's bytes; raises ValueError if it is larger than ``max_bytes``.
+
+    The records are streamed to disk, but Streamlit needs the whole file in memory to
+    serve it, so only exports small enough to hold are returned.
+    """
+    path = export_to_file(store, fmt, project=project)
+    try:
+        size = os.path.getsize(path)
+        if size > max_bytes:
+            raise ValueError(f"Export is {size / 2 ** 20:.0f} MB, over the {max_bytes / 2 ** 20:.0f} MB download "
+                             "limit. Run `python portability.py export` instead.")
+        with open(path, "rb") as fileobj:
+            return fileobj.read()
+    finally:
+        os.remove(path)
+
+
+def read_records(fileobj):
+    """Yield ``(position, record)`` from a JSON Lines (optionally gzipped) or Parquet file."""
+    head = fileobj.read(4)
+    fileobj.seek(0)
+    if head == b"PAR1":
+        import pyarrow.parquet as pq
+
+        position = 0
+        for batch in pq.ParquetFile(fileobj).iter_batches(batch_size=5000):
+            for row in batch.to_pylist():
+                position += 1
+                yield position, _record_from_parquet(row)
+        return
+
+    stream = gzip.GzipFile(fileobj=fileobj) if head[:2] == b"\x1f\x8b" else fileobj
+    for position, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield position, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield position, ValueError(f"invalid JSON ({e.msg})")
+
+
+def validate_profile(profile):
+    """Raise ValueError unless ``profile`` maps known descriptors to integers from 0 to 7."""
+    if not isinstance(profile, dict):
+        raise ValueError("profile must be an object")
+    for desc, value in profile.items():
+        if desc not in ALL_DESCRIPTORS:
+            raise ValueError(f"unknown descriptor {desc!r}")
+        if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 7:
+            raise ValueError(f"{desc} intensity must be an integer from 0 to 7")
+
+
+def validate_record(record):
+    """Raise ValueError describing the first problem with an import record."""
+    if isinstance(record, Exception):
+        raise ValueError(str(record))
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+    kind = record.get("type")
+    if kind == "project":
+        name = record.get("name")
+        if not isinstance(name, str) or not name.strip() or len(name) > MAX_PROJECT_NAME_LENGTH:
+            raise ValueError(f"project name must be a non-empty string of at most {MAX_PROJECT_NAME_LENGTH} characters")
+        _check_date(record.get("created"), "%Y-%m-%d")
+        if not isinstance(record.get("description", ""), str):
+            raise ValueError("description must be a string")
+        validate_profile(record.get("profile", {}))
+        untracked = record.get("untracked_formulations", 0)
+        if not isinstance(untracked, int) or isinstance(untracked, bool) or untracked < 0:
+            raise ValueError("untracked_formulations must be a non-negative integer")
+    elif kind == "formulation":
+        if not isinstance(record.get("project"), str):
+            raise ValueError("formulation record needs a project name")
+        _check_date(record.get("created"), None)
+        formulation = record.get("formulation")
+        if not isinstance(formulation, dict) or not isinstance(formulation.get("ingredients"), list):
+            raise ValueError("formulation must be an object with an ingredients list")
+        for item in formulation["ingredients"]:
+            if not isinstance(item, dict) or not isinstance(item.get("name"), str):
+                raise ValueError("each ingredient needs a name")
+            percentage = item.get("percentage", 0)
+            if (not isinstance(percentage, (int, float)) or isinstance(percentage, bool)
+                    or not math.isfinite(percentage)):
+                raise ValueError(f"percentage for {item['name']!r} must be a number")
+    else:
+        raise ValueError(f"unknown record type {kind!r}")
+
+
+def import_records(store, records, batch_size=1000, profile_index=None):
+    """Validate and insert ``(position, record)`` pairs, committing one transaction per batch.
+
+    Projects whose names existed before the import are skipped along with their
+    formulations; a repeated project record in the file is skipped on its own.
+    Returns counts plus the first few validation errors.
+    """
+    result = {"projects": 0, "formulations": 0, "skipped": 0, "invalid": 0, "errors": []}
+    # Names that existed before this import, and names this import created
+    skipped_projects, created_projects = set(), set()
+    batch = []
+
+    def flush():
+        imported_profiles = []
+        with store.transaction():
+            for record in batch:
+                if record["type"] == "project":
+                    name = record["name"]
+                    if store.project_exists(name):
+                        if name not in created_projects:
+                            skipped_projects.add(name)
+                        result["skipped"] += 1
+                        continue
+                    store.create_project(name, record.get("description", ""), record.get("profile", {}),
+                                         created=record["created"],
+                                         formulation_count=record.get("untracked_formulations", 0))
+                    created_projects.add(name)
+                    imported_profiles.append((name, record.get("profile", {})))
+                    result["projects"] += 1
+                elif record["project"] in skipped_projects or not store.project_exists(record["project"]):
+                    result["skipped"] += 1
+                else:
+                    store.add_formulation(record["project"], record["formulation"], created=record["created"])
+                    result["formulations"] += 1
+        if profile_index is not None:
+            profile_index.upsert_many(imported_profiles)
+        batch.clear()
+
+    for position, record in records:
+        try:
+            validate_record(record)
+        except ValueError as e:
+            result["invalid"] += 1
+            if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                result["errors"].append(f"Record {position}: {e}")
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return result
+
+
+def _check_date(value, fmt):
+    if not isinstance(value, str):
+        raise ValueError("created must be a date string")
+    try:
+        if fmt:
+            datetime.strptime(value, fmt)
+        else:
+            datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"invalid created date {value!r}") from None
+
+
+def _parquet_row(record):
+    if record["type"] == "project":
+        return {"type": "project", "project": record["name"], "created": record["created"],
+                "description": record["description"], "formulations": record["formulations"],
+                "untracked_formulations": record["untracked_formulations"],
+                "profile": json.dumps(record["profile"]), "formulation": None}
+    return {"type": "formulation", "project": record["project"], "created": record["created"],
+            "description": None, "formulations": None, "untracked_formulations": None,
+            "profile": None, "formulation": json.dumps(record["formulation"])}
+
+
+def _record_from_parquet(row):
+    try:
+        if row["type"] == "project":
+            return {"type": "project", "name": row["project"], "created": row["created"],
+                    "description": row["description"] or "", "formulations": row["formulations"],
+                    "untracked_formulations": row["untracked_formulations"] or 0,
+                    "profile": json.loads(row["profile"] or "{}")}
+        return {"type": row["type"], "project": row["project"], "created": row["created"],
+                "formulation": json.loads(row["formulation"] or "null")}
+    except json.JSONDecodeError as e:
+        return ValueError(f"invalid JSON column ({e.msg})")
+
+
+def main():
+    from config import data_path
+
+    parser = argparse.ArgumentParser(description="Export or import Essence Studio projects.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="write projects and formulations to a file")
+    export_cmd.add_argument("path")
+    export_cmd.add_argument("--format", choices=list(EXPORT_FORMATS), default="JSON Lines")
+    export_cmd.add_argument("--project", help="export a single project")
+    import_cmd = commands.add_parser("import", help="load projects and formulations from a file")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    store = ProjectStore(data_path("studio.sqlite3"))
+    if args.command == "export":
+        with open(args.path, "wb") as fileobj:
+            records = iter_records(store, project=args.project)
+            if args.format == "Parquet":
+                write_parquet(records, fileobj)
+            else:
+                write_jsonl(records, fileobj)
+    else:
+        with open(args.path, "rb") as fileobj:
+            result = import_records(store, read_records(fileobj), batch_size=args.batch_size)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import threading
+from collections import ChainMap
+from types import MappingProxyType
+
+import numpy as np
+import streamlit as st
+
+# Reference data is shared by every session in the process, so it is read-only
+
+# All possible descriptors
+ALL_DESCRIPTORS = ("Fruity", "Floral", "Spicy", "Sweet", "Sour", "Woody",
+                   "Creamy", "Nutty", "Fresh", "Herbal", "Citrus", "Earthy",
+                   "Green", "Musky", "Powdery", "Vanilla", "Amber", "Balsamic")
+DESCRIPTOR_INDEX = MappingProxyType({desc: i for i, desc in enumerate(ALL_DESCRIPTORS)})
+
+# Preset combinations
+PRESET_COMBINATIONS = MappingProxyType({
+    name: MappingProxyType(profile) for name, profile in {
+        "Floral Fresh": {"Floral": 6, "Fresh": 5, "Citrus": 3, "Green": 2},
+        "Woody Oriental": {"Woody": 5, "Spicy": 4, "Amber": 3, "Vanilla": 2},
+        "Citrus Aromatic": {"Citrus": 6, "Herbal": 4, "Fresh": 3},
+        "Gourmand Sweet": {"Sweet": 5, "Vanilla": 4, "Creamy": 3, "Nutty": 2},
+    }.items()
+})
+
+# Most presets one session can save on top of the shared ones
+MAX_SESSION_PRESETS = 20
+
+
+def session_presets(session_state):
+    """Presets visible to a session: its own saved presets layered over the shared ones.
+
+    Writes through the returned ChainMap land in the session's overlay only, so the
+    shared presets are never copied or modified.
+    """
+    if "preset_overlay" not in session_state:
+        session_state["preset_overlay"] = {}
+    return ChainMap(session_state["preset_overlay"], PRESET_COMBINATIONS)
+
+
+def profile_vector(profile):
+    vector = np.zeros(len(ALL_DESCRIPTORS), dtype=np.float32)
+    for desc, val in profile.items():
+        if desc in DESCRIPTOR_INDEX:
+            vector[DESCRIPTOR_INDEX[desc]] = val
+    return vector
+
+
+class ProfileIndex:
+    """Dense float32 matrix of sensory profiles with vectorized kNN search.
+
+    Rows are updated in place on ``upsert`` and removed by swapping in the last row,
+    so the index never needs rebuilding. Row norms are kept alongside for cosine search.
+    """
+
+    def __init__(self, capacity=1024):
+        self._matrix = np.zeros((capacity, len(ALL_DESCRIPTORS)), dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self._keys = []
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def upsert(self, key, profile):
+        vector = profile_vector(profile)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = len(self._keys)
+                if row == len(self._matrix):
+                    self._grow()
+                self._keys.append(key)
+                self._rows[key] = row
+            self._matrix[row] = vector
+            self._norms[row] = np.linalg.norm(vector)
+
+    def upsert_many(self, items):
+        for key, profile in items:
+            self.upsert(key, profile)
+
+    def remove(self, key):
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is None:
+                return
+            last = len(self._keys) - 1
+            if row != last:
+                moved = self._keys[last]
+                self._matrix[row] = self._matrix[last]
+                self._norms[row] = self._norms[last]
+                self._keys[row] = moved
+                self._rows[moved] = row
+            self._keys.pop()
+
+    def query(self, profile, k=5, metric="cosine", exclude=None):
+        """Return up to ``k`` ``(key, score)`` pairs, best first.
+
+        Cosine scores are similarities in [0, 1]; Euclidean scores are distances.
+        """
+        target = profile_vector(profile)
+        with self._lock:
+            n = len(self._keys)
+            if n == 0:
+                return []
+            matrix = self._matrix[:n]
+            if metric == "cosine":
+                target_norm = np.linalg.norm(target)
+                denom = self._norms[:n] * target_norm
+                scores = np.divide(matrix @ target, denom, out=np.zeros(n, dtype=np.float32), where=denom > 0)
+                order_scores = -scores
+            else:
+                diff = matrix - target
+                scores = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+                order_scores = scores
+            if exclude is not None and exclude in self._rows:
+                order_scores[self._rows[exclude]] = np.inf
+            k = min(k, n - (exclude in self._rows))
+            if k <= 0:
+                return []
+            top = np.argpartition(order_scores, k - 1)[:k]
+            top = top[np.argsort(order_scores[top])]
+            return [(self._keys[i], float(scores[i])) for i in top]
+
+    def _grow(self):
+        capacity = len(self._matrix) * 2
+        matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+        matrix[:len(self._matrix)] = self._matrix
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:len(self._norms)] = self._norms
+        self._matrix, self._norms = matrix, norms
+
+
+@st.cache_resource(show_spinner=False)
+def get_profile_index(_store):
+    index = ProfileIndex()
+    index.upsert_many(_store.iter_profiles())
+    return index
@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict
+
+import openai
+import streamlit as st
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Default (requests/min, tokens/min) per model; override via RequestScheduler(limits=...)
+MODEL_RATE_LIMITS = {
+    "gpt-4-turbo": (500, 30000),
+    "gpt-4": (500, 10000),
+    "gpt-3.5-turbo": (3500, 200000),
+}
+DEFAULT_RATE_LIMIT = (500, 10000)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` is available (0 if it is available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        # Settle the difference between estimated and actual usage
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RequestScheduler:
+    """Process-wide admission control for LLM calls.
+
+    Each model gets a requests/min and a tokens/min bucket. Waiting calls are admitted
+    strictly in (priority, arrival) order per model, so interactive generations overtake
+    bulk variant jobs. A 429, 5xx or connection error pauses the whole model for the
+    backoff delay instead of letting every waiting caller retry at once; the failed call
+    waits out the pause in the queue, at its original position.
+    """
+
+    def __init__(self, limits=None, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.limits = dict(MODEL_RATE_LIMITS if limits is None else limits)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queues = defaultdict(list)
+        self._buckets = {}
+        self._paused_until = defaultdict(float)
+        self._stats = defaultdict(lambda: {"admitted": 0, "rate_limited": 0, "retries": 0, "wait_seconds": 0.0})
+
+    def _model_buckets(self, model):
+        if model not in self._buckets:
+            rpm, tpm = self.limits.get(model, DEFAULT_RATE_LIMIT)
+            self._buckets[model] = (TokenBucket(rpm), TokenBucket(tpm))
+        return self._buckets[model]
+
+    def acquire(self, model, tokens, priority=PRIORITY_INTERACTIVE, cancel_event=None, seq=None):
+        """Block until a call to ``model`` using ``tokens`` may start.
+
+        Pass the ``seq`` of an earlier ``acquire`` to keep that call's place in the queue.
+        """
+        if seq is None:
+            seq = next(self._seq)
+        entry = (priority, seq)
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queues[model], entry)
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise asyncio.CancelledError()
+                    now = time.monotonic()
+                    wait = 0.5
+                    if self._queues[model][0] == entry:
+                        requests_bucket, tokens_bucket = self._model_buckets(model)
+                        wait = max(
+                            self._paused_until[model] - now,
+                            requests_bucket.wait_time(1, now),
+                            tokens_bucket.wait_time(tokens, now),
+                        )
+                        if wait <= 0:
+                            requests_bucket.take(1)
+                            tokens_bucket.take(tokens)
+                            stats = self._stats[model]
+                            stats["admitted"] += 1
+                            stats["wait_seconds"] += now - started
+                            return
+                    self._cond.wait(timeout=min(wait, 0.5))
+            finally:
+                self._queues[model].remove(entry)
+                heapq.heapify(self._queues[model])
+                self._cond.notify_all()
+
+    def settle(self, model, estimated, actual):
+        with self._cond:
+            self._model_buckets(model)[1].adjust(actual - estimated)
+
+    def _refund(self, model, tokens):
+        # A failed attempt is not settled, so its token reservation would otherwise be spent twice
+        with self._cond:
+            self._model_buckets(model)[1].adjust(-tokens)
+            self._cond.notify_all()
+
+    def _backoff(self, model, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        # Full jitter keeps callers that failed together from retrying together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        with self._cond:
+            stats = self._stats[model]
+            if getattr(error, "status_code", None) == 429:
+                stats["rate_limited"] += 1
+            stats["retries"] += 1
+            self._paused_until[model] = max(self._paused_until[model], time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def _exhausted(self, attempt, error):
+        status = getattr(error, "status_code", None)
+        transient = (status == 429 or (status is not None and status >= 500)
+                     or isinstance(error, openai.APIConnectionError))
+        return not transient or attempt >= self.max_retries
+
+    def run(self, call, model, tokens, priority=PRIORITY_INTERACTIVE):
+        """Run ``call()`` once admitted, retrying 429, 5xx and connection errors with exponential backoff."""
+        # Retries re-enter the queue at their original arrival position and wait out the pause there
+        seq = next(self._seq)
+        for attempt in itertools.count():
+            self.acquire(model, tokens, priority, seq=seq)
+            try:
+                return call()
+            except Exception as e:
+                self._refund(model, tokens)
+                if self._exhausted(attempt, e):
+                    raise
+                self._backoff(model, attempt, e)
+
+    async def arun(self, call, model, tokens, priority=PRIORITY_INTERACTIVE):
+        """Async variant of ``run``; ``call`` returns an awaitable."""
+        seq = next(self._seq)
+        for attempt in itertools.count():
+            cancel_event = threading.Event()
+            try:
+                await asyncio.to_thread(self.acquire, model, tokens, priority, cancel_event, seq)
+            except asyncio.CancelledError:
+                cancel_event.set()
+                raise
+            try:
+                return await call()
+            except Exception as e:
+                self._refund(model, tokens)
+                if self._exhausted(attempt, e):
+                    raise
+                self._backoff(model, attempt, e)
+
+    def metrics(self):
+        with self._cond:
+            models = set(self._queues) | set(self._stats)
+            result = {}
+            for model in sorted(models):
+                queue = self._queues.get(model, [])
+                result[model] = {
+                    "queued_interactive": sum(1 for p, _ in queue if p == PRIORITY_INTERACTIVE),
+                    "queued_bulk": sum(1 for p, _ in queue if p != PRIORITY_INTERACTIVE),
+                    **self._stats[model],
+                }
+            return result
+
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    return RequestScheduler()
@@ -0,0 +1,249 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+import streamlit as st
+
+from config import data_path
+from llm import normalize_description, normalize_profile
+from profiles import profile_vector
+
+# Brief text cosine similarity at or above which a past formulation is reused outright,
+# or sent as a draft to refine when at or above the seed one
+REUSE_THRESHOLD = 0.92
+SEED_THRESHOLD = 0.75
+
+# Largest per-descriptor intensity difference (0-7 scale) allowed for reuse and for seeding
+REUSE_MAX_DELTA = 0
+SEED_MAX_DELTA = 2
+
+STOP_WORDS = frozenset(
+    "a an and as at be but by for from in into is it its of on or so that the this to with".split()
+)
+
+
+class Embedder(ABC):
+    """Maps texts to fixed-width vectors; subclass to plug in another embedding backend.
+
+    ``embed`` returns a (len(texts), dim) float32 array of unit (or zero) rows.
+    ``observe`` is called with every text added to the cache, for backends that learn
+    corpus statistics; it is a no-op by default.
+    """
+
+    dim = 0
+
+    @abstractmethod
+    def embed(self, texts):
+        """Embed ``texts`` as a (len(texts), dim) float32 array."""
+
+    def observe(self, texts):
+        return None
+
+
+class HashedTfidfEmbedder(Embedder):
+    """Offline TF-IDF over hashed word unigrams and bigrams.
+
+    Features are hashed into ``dim`` signed buckets, so no vocabulary is stored.
+    Document frequencies grow as texts are observed; vectors already in an index keep
+    the weights they were embedded with until it is rebuilt.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self._doc_freq = np.zeros(dim, dtype=np.float32)
+        self._docs = 0
+        self._lock = threading.Lock()
+
+    def features(self, text):
+        words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOP_WORDS]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _buckets(self, text):
+        counts = {}
+        for feature in self.features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            bucket, sign = h % self.dim, (1.0 if h & 0x80000000 else -1.0)
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+        return counts
+
+    def observe(self, texts):
+        with self._lock:
+            for text in texts:
+                for bucket in self._buckets(text):
+                    self._doc_freq[bucket] += 1
+                self._docs += 1
+
+    def embed(self, texts):
+        with self._lock:
+            idf = np.log((1 + self._docs) / (1 + self._doc_freq)) + 1
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for bucket, count in self._buckets(text).items():
+                # Sublinear term frequency; the sign of colliding features is kept
+                vectors[i, bucket] = math.copysign(1 + math.log(abs(count)), count) if count else 0.0
+        vectors *= idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of past formulations keyed by brief, sensory profile and settings.
+
+    Brief text and profile are separate gates rather than one blended score. Text is
+    compared by cosine over embeddings; profiles by the largest per-descriptor
+    difference on the 0-7 scale, so strengthening or adding a descriptor always
+    counts. A formulation is reused only for a near-identical profile with the same
+    model and temperature, and offered as a draft to refine for a close one. Small
+    caches are searched exhaustively; past ``exact_limit`` entries, random-hyperplane
+    LSH tables over the text embeddings narrow the search to candidate buckets.
+    Entries persist in SQLite and are re-embedded on startup, so the embedder can be
+    swapped without migrating stored vectors.
+    """
+
+    def __init__(self, path, embedder=None, threshold=REUSE_THRESHOLD, seed_threshold=SEED_THRESHOLD,
+                 max_delta=REUSE_MAX_DELTA, seed_max_delta=SEED_MAX_DELTA, max_entries=20000,
+                 ttl=30 * 24 * 3600, exact_limit=4096, tables=8, bits=12):
+        self.embedder = embedder or HashedTfidfEmbedder()
+        self.threshold = threshold
+        self.seed_threshold = seed_threshold
+        self.max_delta = max_delta
+        self.seed_max_delta = seed_max_delta
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.exact_limit = exact_limit
+        self._lock = threading.Lock()
+        self._planes = np.random.default_rng(0).standard_normal(
+            (tables, bits, self.embedder.dim)
+        ).astype(np.float32)
+        self._bit_values = 1 << np.arange(bits)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY, model TEXT NOT NULL, description TEXT NOT NULL, "
+            "profile TEXT NOT NULL, formulation TEXT NOT NULL, created REAL NOT NULL, temperature REAL)"
+        )
+        # Entries written before temperature was recorded keep NULL and are only used as drafts
+        if "temperature" not in [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]:
+            self._conn.execute("ALTER TABLE entries ADD COLUMN temperature REAL")
+        self._conn.execute("DELETE FROM entries WHERE created <= ?", (time.time() - ttl,))
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, model, temperature, description, profile, formulation FROM entries "
+            "ORDER BY id DESC LIMIT ?",
+            (max_entries,),
+        ).fetchall()[::-1]
+        self.embedder.observe([row[3] for row in rows])
+        self._ids = [row[0] for row in rows]
+        self._models = [row[1] for row in rows]
+        self._temperatures = [row[2] for row in rows]
+        self._formulations = [json.loads(row[5]) for row in rows]
+        capacity = max(1024, len(rows))
+        self._matrix = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+        self._matrix[:len(rows)] = self._text_vectors([row[3] for row in rows])
+        self._profiles = np.zeros((capacity, len(profile_vector({}))), dtype=np.float32)
+        for i, row in enumerate(rows):
+            self._profiles[i] = profile_vector(json.loads(row[4]))
+        self._rebuild_buckets()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _text_vectors(self, descriptions):
+        # An empty brief is its own point, so two empty ones still match
+        texts = [normalize_description(d) or "(no brief)" for d in descriptions]
+        if not texts:
+            return np.zeros((0, self.embedder.dim), dtype=np.float32)
+        return self.embedder.embed(texts)
+
+    def _signatures(self, vectors):
+        # (tables, rows) bucket ids from the side of each hyperplane a vector falls on
+        return (np.einsum("tbd,nd->tnb", self._planes, vectors) > 0) @ self._bit_values
+
+    def _rebuild_buckets(self):
+        self._buckets = [{} for _ in range(len(self._planes))]
+        for table, signatures in zip(self._buckets, self._signatures(self._matrix[:len(self._ids)])):
+            for row, signature in enumerate(signatures.tolist()):
+                table.setdefault(signature, []).append(row)
+
+    def lookup(self, model, temperature, profile, description):
+        """Return ``(reuse, seed)`` formulations for a brief; at most one is not None."""
+        query = self._text_vectors([description])
+        target = profile_vector(normalize_profile(profile))
+        with self._lock:
+            if not self._ids:
+                return None, None
+            if len(self._ids) <= self.exact_limit:
+                candidates = np.arange(len(self._ids))
+            else:
+                rows = set()
+                for table, signature in zip(self._buckets, self._signatures(query)[:, 0].tolist()):
+                    rows.update(table.get(signature, ()))
+                candidates = np.fromiter(rows, dtype=np.intp, count=len(rows))
+            candidates = candidates[[self._models[i] == model for i in candidates]]
+            if not len(candidates):
+                return None, None
+            deltas = np.abs(self._profiles[candidates] - target).max(axis=1)
+            scores = self._matrix[candidates] @ query[0]
+
+            reusable = ((deltas <= self.max_delta) & (scores >= self.threshold)
+                        & np.array([self._temperatures[i] == temperature for i in candidates], dtype=bool))
+            if reusable.any():
+                best = np.flatnonzero(reusable)[np.argmax(scores[reusable])]
+                return self._formulations[candidates[best]], None
+            seedable = (deltas <= self.seed_max_delta) & (scores >= self.seed_threshold)
+            if seedable.any():
+                # Closest profile first, then the most similar brief
+                order = np.lexsort((-scores[seedable], deltas[seedable]))
+                return None, self._formulations[candidates[np.flatnonzero(seedable)[order[0]]]]
+            return None, None
+
+    def add(self, model, temperature, profile, description, formulation):
+        profile = normalize_profile(profile)
+        self.embedder.observe([normalize_description(description) or "(no brief)"])
+        vector = self._text_vectors([description])
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO entries (model, temperature, description, profile, formulation, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (model, temperature, description, json.dumps(profile), json.dumps(formulation), time.time()),
+            )
+            self._conn.commit()
+            row = len(self._ids)
+            self._ids.append(cursor.lastrowid)
+            self._models.append(model)
+            self._temperatures.append(temperature)
+            self._formulations.append(formulation)
+            if row == len(self._matrix):
+                self._matrix = np.vstack([self._matrix, np.zeros_like(self._matrix)])
+                self._profiles = np.vstack([self._profiles, np.zeros_like(self._profiles)])
+            self._matrix[row] = vector[0]
+            self._profiles[row] = profile_vector(profile)
+            for table, signature in zip(self._buckets, self._signatures(vector)[:, 0].tolist()):
+                table.setdefault(signature, []).append(row)
+            # Trim in batches so the buckets are rebuilt rarely
+            if len(self._ids) > self.max_entries * 1.1:
+                drop = len(self._ids) - self.max_entries
+                self._conn.execute("DELETE FROM entries WHERE id <= ?", (self._ids[drop - 1],))
+                self._conn.commit()
+                del self._ids[:drop], self._models[:drop], self._temperatures[:drop], self._formulations[:drop]
+                self._matrix[:len(self._ids)] = self._matrix[drop:drop + len(self._ids)]
+                self._profiles[:len(self._ids)] = self._profiles[drop:drop + len(self._ids)]
+                self._rebuild_buckets()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._ids, self._models, self._temperatures, self._formulations = [], [], [], []
+            self._rebuild_buckets()
+
+
+@st.cache_resource(show_spinner=False)
+def get_semantic_cache():
+    return SemanticCache(data_path("semantic_cache.sqlite3"))
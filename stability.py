@@ -0,0 +1,132 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+from catalog import NOTES, get_catalog
+from profiles import ALL_DESCRIPTORS
+
+# Evaporation rate per hour is exp(slope * volatility + intercept): a volatility of 0.95
+# gives a half-life of roughly 15 minutes, 0.08 roughly 35 hours
+RATE_SLOPE = 5.75
+RATE_INTERCEPT = -4.36
+
+# Volatility assumed for ingredients missing from the catalog
+NOTE_VOLATILITY = {"top": 0.85, "heart": 0.45, "base": 0.15}
+
+# Hours after application; denser early on, where top notes change fastest
+TIME_GRID = np.concatenate([np.linspace(0, 2, 25), np.linspace(2.25, 12, 40), np.linspace(12.5, 48, 72)])
+
+# Odour is considered gone once the headspace falls below this share of its initial strength
+LONGEVITY_THRESHOLD = 0.1
+
+
+def formulation_hash(formulation):
+    """Content hash of a formulation's ingredients; name and notes do not affect stability."""
+    parts = sorted((item["name"].strip().lower(), float(item.get("percentage", 0)), item.get("note", ""))
+                   for item in formulation.get("ingredients", []))
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+class StabilitySimulator:
+    """Evaporation and perceived-profile drift for formulations over ``TIME_GRID``.
+
+    Each ingredient evaporates exponentially at a rate set by its volatility, and what
+    is perceived is the headspace (evaporation flux) rather than what remains on skin.
+    All formulations of a call are simulated as one (formulation, time, ingredient)
+    array operation; results are kept in an LRU keyed by ``formulation_hash``.
+    """
+
+    def __init__(self, catalog, cache_size=512):
+        self.catalog = catalog
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def simulate(self, formulations):
+        """Return one result dict per formulation, simulating only those not cached.
+
+        Each result holds ``times``, ``remaining`` (share of material left on skin),
+        ``intensity`` (headspace relative to the start), ``note_balance`` (time x
+        top/heart/base shares of the headspace), ``profile`` (time x descriptor
+        perceived profile), ``drift`` (distance from the initial perceived profile)
+        and ``longevity_hours``.
+        """
+        hashes = [formulation_hash(f) for f in formulations]
+        with self._lock:
+            results = {h: self._cache[h] for h in hashes if h in self._cache}
+            for h in results:
+                self._cache.move_to_end(h)
+        missing = {h: f for h, f in zip(hashes, formulations) if h not in results}
+        if missing:
+            computed = dict(zip(missing, self._run(list(missing.values()))))
+            results.update(computed)
+            with self._lock:
+                self._cache.update(computed)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [results[h] for h in hashes]
+
+    def _run(self, formulations):
+        # Dense (formulation, ingredient) weights over the union of ingredients used
+        names = sorted({item["name"].strip().lower() for f in formulations for item in f.get("ingredients", [])})
+        column = {name: j for j, name in enumerate(names)}
+        weights = np.zeros((len(formulations), len(names)))
+        fallback_notes = np.full(len(names), "heart", dtype="U5")
+        for i, formulation in enumerate(formulations):
+            for item in formulation.get("ingredients", []):
+                j = column[item["name"].strip().lower()]
+                weights[i, j] += max(float(item.get("percentage", 0) or 0), 0.0)
+                if item.get("note") in NOTE_VOLATILITY:
+                    fallback_notes[j] = item["note"]
+        totals = weights.sum(axis=1, keepdims=True)
+        weights = np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0)
+
+        rows = self.catalog.lookup_many(names)
+        known = rows >= 0
+        safe_rows = np.maximum(rows, 0)
+        volatility = np.where(known, self.catalog.volatility[safe_rows],
+                              [NOTE_VOLATILITY[note] for note in fallback_notes])
+        notes = np.where(known, self.catalog.notes[safe_rows], fallback_notes)
+        descriptors = np.where(known[:, None], self.catalog.descriptors[safe_rows], 0.0)
+        rates = np.exp(RATE_SLOPE * volatility + RATE_INTERCEPT)
+
+        # (formulation, time, ingredient) mass left on skin and evaporation flux
+        mass = weights[:, None, :] * np.exp(-rates[None, None, :] * TIME_GRID[None, :, None])
+        flux = mass * rates
+        flux_total = flux.sum(axis=2)
+        safe_flux = np.where(flux_total > 0, flux_total, 1.0)[..., None]
+
+        profile = flux @ descriptors / safe_flux
+        note_balance = np.stack([flux[..., notes == note].sum(axis=2) for note in NOTES], axis=2) / safe_flux
+        drift = np.linalg.norm(profile - profile[:, :1, :], axis=2)
+        intensity = flux_total / np.where(flux_total[:, :1] > 0, flux_total[:, :1], 1.0)
+        below = intensity < LONGEVITY_THRESHOLD
+        longevity = np.where(below.any(axis=1), TIME_GRID[below.argmax(axis=1)], TIME_GRID[-1])
+
+        return [
+            {
+                "times": TIME_GRID,
+                "remaining": mass[i].sum(axis=1),
+                "intensity": intensity[i],
+                "note_balance": note_balance[i],
+                "profile": profile[i],
+                "drift": drift[i],
+                "longevity_hours": float(longevity[i]),
+            }
+            for i in range(len(formulations))
+        ]
+
+
+@st.cache_resource(show_spinner=False)
+def get_stability_simulator():
+    return StabilitySimulator(get_catalog())
+
+
+def descriptor_at(result, hours):
+    """Perceived profile (descriptor -> intensity) at the grid point nearest ``hours``."""
+    index = int(np.abs(result["times"] - hours).argmin())
+    return dict(zip(ALL_DESCRIPTORS, result["profile"][index].round(2).tolist()))
@@ -0,0 +1,395 @@
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import streamlit as st
+
+from aggregates import DashboardAggregates
+from config import data_path
+from history import VersionHistory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT NOT NULL DEFAULT '',
+    created TEXT NOT NULL,
+    formulation_count INTEGER NOT NULL DEFAULT 0,
+    current_formulation_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_projects_created ON projects(created);
+CREATE INDEX IF NOT EXISTS idx_projects_formulation_count ON projects(formulation_count);
+CREATE INDEX IF NOT EXISTS idx_projects_name_nocase ON projects(name COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS profiles (
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    descriptor TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (project_id, descriptor)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_profiles_descriptor ON profiles(descriptor, value);
+
+CREATE TABLE IF NOT EXISTS formulations (
+    id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    created TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_formulations_project ON formulations(project_id, id);
+"""
+
+# Longest project name accepted on creation and on import
+MAX_PROJECT_NAME_LENGTH = 200
+
+# Portfolio sort keys accepted by list_projects
+SORT_COLUMNS = {
+    "created": "p.created",
+    "formulations": "p.formulation_count",
+    "descriptor": "d.value",
+}
+
+# Seed portfolio for a fresh database
+SEED_PROJECTS = {
+    "Summer Breeze": {
+        "created": "2023-05-10",
+        "formulations": 3,
+        "profile": {"Fruity": 5, "Floral": 4, "Sweet": 3, "Fresh": 6},
+        "description": "A light, refreshing summer fragrance with citrus and floral notes"
+    },
+    "Spicy Delight": {
+        "created": "2023-06-15",
+        "formulations": 5,
+        "profile": {"Spicy": 6, "Woody": 4, "Sweet": 2},
+        "description": "A warm, spicy fragrance with cinnamon and clove notes"
+    },
+    "Fresh Morning": {
+        "created": "2023-07-01",
+        "formulations": 4,
+        "profile": {"Fresh": 7, "Herbal": 5, "Citrus": 4},
+        "description": "A crisp, energizing scent with mint and citrus elements"
+    }
+}
+
+
+class ProjectStore:
+    """SQLite-backed store for projects, their sensory profiles and formulations.
+
+    One connection is shared by all sessions behind a lock; the database runs in WAL
+    mode so readers in other processes are never blocked by a writer. Group related
+    writes with ``transaction()`` so they commit once.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        # Stores created before formulations were versioned start at each project's newest one
+        if "current_formulation_id" not in [row[1] for row in self._conn.execute("PRAGMA table_info(projects)")]:
+            self._conn.execute("ALTER TABLE projects ADD COLUMN current_formulation_id INTEGER")
+            self._conn.execute(
+                "UPDATE projects SET current_formulation_id = "
+                "(SELECT MAX(id) FROM formulations f WHERE f.project_id = projects.id)"
+            )
+        self.aggregates = DashboardAggregates(self._conn)
+        self.history = VersionHistory(self._conn)
+        if self.aggregates.needs_rebuild():
+            with self.transaction() as conn:
+                self.aggregates.rebuild(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._depth == 0:
+                self._conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self._conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("ROLLBACK")
+                raise
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._conn.execute("COMMIT")
+
+    def open_reader(self):
+        """A separate read-only connection, for long scans that must not hold the store lock."""
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _project_id(self, name):
+        row = self._query("SELECT id FROM projects WHERE name = ?", (name,))
+        if not row:
+            raise KeyError(name)
+        return row[0][0]
+
+    def seed_if_empty(self, projects=SEED_PROJECTS):
+        with self.transaction():
+            if self._query("SELECT 1 FROM projects LIMIT 1"):
+                return
+            for name, details in projects.items():
+                self.create_project(name, details["description"], details["profile"],
+                                    created=details["created"], formulation_count=details["formulations"])
+
+    def create_project(self, name, description="", profile=None, created=None, formulation_count=0):
+        if not name.strip() or len(name) > MAX_PROJECT_NAME_LENGTH:
+            raise ValueError(f"project name must be a non-empty string of at most {MAX_PROJECT_NAME_LENGTH} characters")
+        created = created or datetime.now().strftime("%Y-%m-%d")
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO projects (name, description, created, formulation_count) VALUES (?, ?, ?, ?)",
+                (name, description, created, formulation_count),
+            )
+            self.aggregates.project_created(conn, created, formulation_count)
+            profile = self._write_profile(conn, cursor.lastrowid, profile or {})
+            self.history.start(conn, cursor.lastrowid,
+                               {"description": description, "profile": profile, "formulation": None})
+
+    def project_exists(self, name):
+        return bool(self._query("SELECT 1 FROM projects WHERE name = ?", (name,)))
+
+    def get_project(self, name):
+        rows = self._query(
+            "SELECT id, created, formulation_count, description FROM projects WHERE name = ?", (name,)
+        )
+        if not rows:
+            return None
+        project_id, created, count, description = rows[0]
+        return {
+            "name": name,
+            "created": created,
+            "formulations": count,
+            "profile": self._read_profile(project_id),
+            "description": description,
+        }
+
+    def get_profile(self, name):
+        rows = self._query(
+            "SELECT pr.descriptor, pr.value FROM profiles pr JOIN projects p ON p.id = pr.project_id "
+            "WHERE p.name = ?", (name,)
+        )
+        return dict(rows)
+
+    def search_projects(self, prefix="", limit=50):
+        """Project names starting with ``prefix`` (case-insensitive), via a range scan on the name index."""
+        where, params = self._prefix_clause(prefix)
+        rows = self._query(
+            f"SELECT p.name FROM projects p {where} ORDER BY p.name COLLATE NOCASE LIMIT ?", params + [limit]
+        )
+        return [row[0] for row in rows]
+
+    def list_projects(self, limit=None, offset=0, sort="created", descending=False, descriptor=None, prefix=""):
+        """One page of projects, optionally restricted to those using ``descriptor`` or matching ``prefix``.
+
+        ``sort`` is one of ``SORT_COLUMNS``; sorting by ``"descriptor"`` requires ``descriptor``.
+        """
+        join, where, params = self._portfolio_filter(descriptor, prefix)
+        direction = "DESC" if descending else "ASC"
+        rows = self._query(
+            f"SELECT p.id, p.name, p.created, p.formulation_count, p.description FROM projects p {join} {where} "
+            f"ORDER BY {SORT_COLUMNS[sort]} {direction}, p.id {direction} LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, offset],
+        )
+        profiles = self._read_profiles([row[0] for row in rows])
+        return [
+            {"name": name, "created": created, "formulations": count,
+             "profile": profiles.get(project_id, {}), "description": description}
+            for project_id, name, created, count, description in rows
+        ]
+
+    def _portfolio_filter(self, descriptor=None, prefix=""):
+        join, params = "", []
+        if descriptor:
+            join = "JOIN profiles d ON d.project_id = p.id AND d.descriptor = ?"
+            params.append(descriptor)
+        where, prefix_params = self._prefix_clause(prefix)
+        return join, where, params + prefix_params
+
+    @staticmethod
+    def _prefix_clause(prefix):
+        if not prefix:
+            return "", []
+        # SQLite turns a LIKE prefix into a range scan on the NOCASE index, with an exact upper bound
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return "WHERE p.name LIKE ? ESCAPE '\\'", [pattern]
+
+    def iter_profiles(self):
+        """Yield ``(name, profile)`` for every project, including empty profiles."""
+        rows = self._query(
+            "SELECT p.name, pr.descriptor, pr.value FROM projects p "
+            "LEFT JOIN profiles pr ON pr.project_id = p.id ORDER BY p.id"
+        )
+        name, profile = None, {}
+        for row_name, descriptor, value in rows:
+            if row_name != name:
+                if name is not None:
+                    yield name, profile
+                name, profile = row_name, {}
+            if descriptor is not None:
+                profile[descriptor] = value
+        if name is not None:
+            yield name, profile
+
+    def update_description(self, name, description):
+        with self.transaction() as conn:
+            project_id = self._project_id(name)
+            old_state = self._state(conn, project_id)
+            conn.execute("UPDATE projects SET description = ? WHERE id = ?", (description, project_id))
+            self.history.record(conn, project_id, old_state, dict(old_state, description=description))
+
+    def set_profile(self, name, profile):
+        with self.transaction() as conn:
+            project_id = self._project_id(name)
+            old_state = self._state(conn, project_id)
+            profile = self._write_profile(conn, project_id, profile)
+            self.history.record(conn, project_id, old_state, dict(old_state, profile=profile))
+
+    def undo(self, name):
+        """Restore the project's previous version; returns False if there is nothing to undo."""
+        with self.transaction() as conn:
+            project_id = self._project_id(name)
+            return self._restore(conn, project_id, self.history.undo(conn, project_id, self._state(conn, project_id)))
+
+    def redo(self, name):
+        """Reapply the most recently undone version; returns False if there is nothing to redo."""
+        with self.transaction() as conn:
+            project_id = self._project_id(name)
+            return self._restore(conn, project_id, self.history.redo(conn, project_id, self._state(conn, project_id)))
+
+    def checkout_version(self, name, version_id):
+        """Restore any earlier version; edits made afterwards branch from it."""
+        with self.transaction() as conn:
+            project_id = self._project_id(name)
+            return self._restore(conn, project_id, self.history.checkout(conn, project_id, version_id))
+
+    def list_versions(self, name, limit=50):
+        with self._lock:
+            return self.history.versions(self._conn, self._project_id(name), limit)
+
+    def version_state(self, version_id):
+        """``{"description", "profile", "formulation"}`` as of a version; the formulation is an id."""
+        with self._lock:
+            return self.history.state_at(self._conn, version_id)
+
+    def get_formulation(self, formulation_id):
+        rows = self._query("SELECT payload FROM formulations WHERE id = ?", (formulation_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def add_formulation(self, name, formulation, created=None):
+        """Store a formulation and make it the project's current one, as a new version."""
+        with self.transaction() as conn:
+            project_id = self._project_id(name)
+            old_state = self._state(conn, project_id)
+            created = created or datetime.now().isoformat(timespec="seconds")
+            cursor = conn.execute(
+                "INSERT INTO formulations (project_id, created, name, payload) VALUES (?, ?, ?, ?)",
+                (project_id, created, formulation.get("name", ""), json.dumps(formulation)),
+            )
+            self.aggregates.formulation_added(conn, created[:10], formulation)
+            conn.execute(
+                "UPDATE projects SET formulation_count = formulation_count + 1, current_formulation_id = ? "
+                "WHERE id = ?", (cursor.lastrowid, project_id)
+            )
+            self.history.record(conn, project_id, old_state, dict(old_state, formulation=cursor.lastrowid))
+
+    def list_formulations(self, name, limit=None):
+        rows = self._query(
+            "SELECT f.payload FROM formulations f JOIN projects p ON p.id = f.project_id "
+            "WHERE p.name = ? ORDER BY f.id LIMIT ?",
+            (name, -1 if limit is None else limit),
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def latest_formulation(self, name):
+        """The project's current formulation: the newest, unless undo or a checkout moved back."""
+        rows = self._query(
+            "SELECT f.payload FROM projects p JOIN formulations f ON f.id = p.current_formulation_id "
+            "WHERE p.name = ?",
+            (name,),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def count_projects(self, descriptor=None, prefix=""):
+        if not descriptor and not prefix:
+            return self.dashboard_summary()["projects"]
+        join, where, params = self._portfolio_filter(descriptor, prefix)
+        return self._query(f"SELECT COUNT(*) FROM projects p {join} {where}", params)[0][0]
+
+    def dashboard_summary(self):
+        with self._lock:
+            return self.aggregates.summary()
+
+    def daily_activity(self):
+        with self._lock:
+            return self.aggregates.daily_activity()
+
+    def _state(self, conn, project_id):
+        # The versioned part of a project; formulations are immutable rows, so only the current one's id
+        description, formulation_id = conn.execute(
+            "SELECT description, current_formulation_id FROM projects WHERE id = ?", (project_id,)
+        ).fetchone()
+        profile = dict(conn.execute(
+            "SELECT descriptor, value FROM profiles WHERE project_id = ?", (project_id,)
+        ).fetchall())
+        return {"description": description, "profile": profile, "formulation": formulation_id}
+
+    def _restore(self, conn, project_id, state):
+        # Writes a state from history without recording a new version
+        if state is None:
+            return False
+        conn.execute("UPDATE projects SET description = ? WHERE id = ?", (state["description"], project_id))
+        self._write_profile(conn, project_id, state["profile"])
+        # Versions recorded before formulations were versioned leave the current one in place
+        if "formulation" in state:
+            conn.execute("UPDATE projects SET current_formulation_id = ? WHERE id = ?",
+                         (state["formulation"], project_id))
+        return True
+
+    def _read_profile(self, project_id):
+        rows = self._query("SELECT descriptor, value FROM profiles WHERE project_id = ?", (project_id,))
+        return dict(rows)
+
+    def _read_profiles(self, project_ids):
+        profiles = {}
+        # Chunk to stay under SQLite's bound-parameter limit
+        for start in range(0, len(project_ids), 500):
+            chunk = project_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for project_id, descriptor, value in self._query(
+                f"SELECT project_id, descriptor, value FROM profiles WHERE project_id IN ({placeholders})", chunk
+            ):
+                profiles.setdefault(project_id, {})[descriptor] = value
+        return profiles
+
+    def _write_profile(self, conn, project_id, profile):
+        profile = {desc: int(val) for desc, val in profile.items() if val}
+        old_profile = dict(conn.execute(
+            "SELECT descriptor, value FROM profiles WHERE project_id = ?", (project_id,)
+        ).fetchall())
+        self.aggregates.profile_changed(conn, old_profile, profile)
+        conn.execute("DELETE FROM profiles WHERE project_id = ?", (project_id,))
+        conn.executemany(
+            "INSERT INTO profiles (project_id, descriptor, value) VALUES (?, ?, ?)",
+            [(project_id, desc, int(val)) for desc, val in profile.items() if val],
+        )
+        return profile
+
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    store = ProjectStore(data_path("studio.sqlite3"))
+    store.seed_if_empty()
+    return store
@@ -1,11 +1,25 @@
 import streamlit as st
-import openai
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import time
+import asyncio
+
+from llm import RefinementSession, generate_variants, get_client, get_response_cache, refine_formulation, stream_formulation
+from scheduler import get_scheduler
+from store import MAX_PROJECT_NAME_LENGTH, get_store
+from profiles import ALL_DESCRIPTORS, MAX_SESSION_PRESETS, PRESET_COMBINATIONS, get_profile_index, session_presets
+from charts import profile_key, radar_figure, radar_grid_figure
+from portability import EXPORT_FORMATS, MAX_DOWNLOAD_BYTES, export_bytes, import_records, read_records
+from catalog import NOTES, get_catalog
+from blend import draft_formulation
+from compare import combined_features, comparison_features, downsample, kmeans, pairwise_distances, project_2d
+from molecules import get_thumbnail_cache, structure_for
+from semantic import get_semantic_cache
+from stability import descriptor_at, formulation_hash, get_stability_simulator
+from telemetry import get_telemetry, session_footprint
 
 # Configure page layout and styling
 st.set_page_config(
@@ -15,8 +29,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Timing spans and LLM telemetry for this app process, shown under Advanced Analytics
+telemetry = get_telemetry()
+run_started = time.perf_counter()
+
 # Custom CSS for a sophisticated premium look
-st.markdown("""
+with telemetry.span("css"):
+    st.markdown("""
 <style>
     /* Main color palette: dark purple, gold accents, subtle grays */
     :root {
@@ -122,6 +141,20 @@ st.markdown("""
         color: white !important;
     }
     
+    /* Workspace module selector styled as tabs */
+    .st-key-active_module [role="radiogroup"] {
+        gap: 8px;
+    }
+    .st-key-active_module [role="radiogroup"] label {
+        border-radius: 4px 4px 0px 0px;
+        padding: 8px 16px;
+        background-color: #f0f0f4;
+    }
+    .st-key-active_module [role="radiogroup"] label:has(input:checked) {
+        background-color: var(--primary-color);
+        color: white;
+    }
+    
     /* Sidebar styling */
     [data-testid="stSidebar"] {
         background-color: #fcfcfc;
@@ -207,37 +240,19 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-# Session state initialization for projects and formulations
-if 'projects' not in st.session_state:
-    st.session_state.projects = {
-        "Summer Breeze": {
-            "created": "2023-05-10",
-            "formulations": 3,
-            "profile": {"Fruity": 5, "Floral": 4, "Sweet": 3, "Fresh": 6},
-            "description": "A light, refreshing summer fragrance with citrus and floral notes"
-        },
-        "Spicy Delight": {
-            "created": "2023-06-15",
-            "formulations": 5,
-            "profile": {"Spicy": 6, "Woody": 4, "Sweet": 2},
-            "description": "A warm, spicy fragrance with cinnamon and clove notes"
-        },
-        "Fresh Morning": {
-            "created": "2023-07-01",
-            "formulations": 4,
-            "profile": {"Fresh": 7, "Herbal": 5, "Citrus": 4},
-            "description": "A crisp, energizing scent with mint and citrus elements"
-        }
-    }
+# Persistent project store, profile similarity index, ingredient catalog and render caches shared by all sessions
+store = get_store()
+profile_index = get_profile_index(store)
+ingredient_catalog = get_catalog()
+stability_simulator = get_stability_simulator()
+thumbnail_cache = get_thumbnail_cache()
 
+# Session state initialization for the active project
 if 'current_project' not in st.session_state:
     st.session_state.current_project = None
 
-if 'formulations' not in st.session_state:
-    st.session_state.formulations = {}
-
 # Sidebar for authentication and app settings
-with st.sidebar:
+with st.sidebar, telemetry.span("sidebar"):
     # Premium sidebar header
     st.markdown("""
     <div style="text-align:center; margin-bottom:20px;">
@@ -276,6 +291,8 @@ with st.sidebar:
     )
     temperature = st.slider("Creativity", 0.0, 1.0, 0.7, 0.1, 
                           help="Higher values produce more creative results, lower values are more focused")
+    reuse_similar = st.toggle("Reuse similar briefs", True, key="reuse_similar",
+                              help="Answer near-duplicate briefs from past formulations instead of calling the API")
     st.markdown("</div>", unsafe_allow_html=True)
     
     # Display Settings with toggle switches
@@ -306,10 +323,21 @@ with st.sidebar:
         </h4>
     """, unsafe_allow_html=True)
     
-    if st.session_state.projects:
-        project_options = list(st.session_state.projects.keys())
+    if store.count_projects():
+        # Apply a project opened from the dashboard before the picker is drawn
+        if 'open_project' in st.session_state:
+            st.session_state.project_picker = st.session_state.pop('open_project')
+        
+        # Searchable picker: only names matching the typed prefix are listed
+        project_search = st.text_input("Search projects", key="project_search",
+                                       placeholder="Search projects...", label_visibility="collapsed")
+        project_options = store.search_projects(project_search, limit=50)
+        picked = st.session_state.get("project_picker")
+        if picked and picked != "Create New Project" and picked not in project_options:
+            project_options.insert(0, picked)
         project_options.insert(0, "Create New Project")
-        selected_project = st.selectbox("Select or Create", project_options, label_visibility="collapsed")
+        selected_project = st.selectbox("Select or Create", project_options, key="project_picker",
+                                        label_visibility="collapsed")
         
         if selected_project != "Create New Project":
             st.session_state.current_project = selected_project
@@ -322,15 +350,41 @@ with st.sidebar:
             </div>
             """, unsafe_allow_html=True)
             
-            if st.button("Export Project Data", key="export_btn", 
-                       help="Export your project as JSON for backup or sharing"):
-                st.success("Project exported successfully!")
-                time.sleep(1)
+            # Export is generated only when the download is clicked, streamed to a compressed file
+            export_scope = st.radio("Export scope", ["This project", "All projects"], horizontal=True,
+                                    key="export_scope", label_visibility="collapsed")
+            export_format = st.selectbox("Export format", list(EXPORT_FORMATS.keys()), key="export_format",
+                                         label_visibility="collapsed")
+            export_project = selected_project if export_scope == "This project" else None
+            export_name = selected_project if export_project else "essence-studio"
+            st.download_button("Export Project Data",
+                               data=lambda: export_bytes(store, export_format, project=export_project),
+                               file_name=f"{export_name}{EXPORT_FORMATS[export_format]}",
+                               mime="application/octet-stream", key="export_btn",
+                               help="Export projects, profiles and formulations for backup or transfer. "
+                                    f"Downloads are limited to {MAX_DOWNLOAD_BYTES // 2 ** 20} MB; "
+                                    "use `python portability.py export` for larger portfolios.")
         else:
             st.session_state.current_project = None
     
     st.markdown("</div>", unsafe_allow_html=True)
     
+    # Bulk import of an exported portfolio, validated and inserted in batches
+    with st.expander("Import Projects"):
+        import_file = st.file_uploader("Export file", type=["gz", "jsonl", "parquet"], key="import_file",
+                                       label_visibility="collapsed")
+        if import_file is not None and st.button("Import", key="import_btn"):
+            with st.spinner("Importing..."):
+                import_result = import_records(store, read_records(import_file), profile_index=profile_index)
+            st.success(f"Imported {import_result['projects']} projects and "
+                       f"{import_result['formulations']} formulations")
+            if import_result["skipped"]:
+                st.caption(f"Skipped {import_result['skipped']} records for projects that already exist")
+            if import_result["invalid"]:
+                st.warning(f"{import_result['invalid']} invalid records were ignored")
+                for error in import_result["errors"]:
+                    st.caption(error)
+    
     # User account section
     st.markdown("""
     <div style="position: absolute; bottom: 20px; left: 20px; right: 20px; text-align: center;">
@@ -362,7 +416,10 @@ if not openai_api_key:
     """, unsafe_allow_html=True)
     st.stop()
 else:
-    client = openai.OpenAI(api_key=openai_api_key)
+    client = get_client(openai_api_key)
+    response_cache = get_response_cache()
+    semantic_cache = get_semantic_cache() if reuse_similar else None
+    scheduler = get_scheduler()
 
 # Dashboard - shown when no project is selected
 if st.session_state.current_project is None:
@@ -381,49 +438,45 @@ if st.session_state.current_project is None:
     </div>
     """, unsafe_allow_html=True)
     
-    # Project metrics in premium styled cards
+    # Project metrics in premium styled cards, read from incrementally maintained counters
+    metrics_started = time.perf_counter()
+    dashboard_summary = store.dashboard_summary()
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.metric(label="ACTIVE PROJECTS", value=len(st.session_state.projects))
+        st.metric(label="ACTIVE PROJECTS", value=dashboard_summary["projects"])
         st.markdown('</div>', unsafe_allow_html=True)
     with col2:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        total_formulations = sum(project["formulations"] for project in st.session_state.projects.values())
-        st.metric(label="TOTAL FORMULATIONS", value=total_formulations)
+        st.metric(label="TOTAL FORMULATIONS", value=dashboard_summary["formulations"])
         st.markdown('</div>', unsafe_allow_html=True)
     with col3:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.metric(label="TOP DESCRIPTOR", value="Fresh")
+        st.metric(label="TOP DESCRIPTOR", value=dashboard_summary["top_descriptor"] or "—")
         st.markdown('</div>', unsafe_allow_html=True)
     with col4:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-        st.metric(label="SIGNATURE INGREDIENT", value="Citrus Oil")
+        st.metric(label="SIGNATURE INGREDIENT", value=dashboard_summary["signature_ingredient"] or "—")
         st.markdown('</div>', unsafe_allow_html=True)
+    telemetry.record_span("dashboard.metrics", time.perf_counter() - metrics_started)
     
     # Project overview graph
     st.subheader("Project Activity")
     
-    # Sample project activity data
-    project_dates = [project["created"] for project in st.session_state.projects.values()]
-    project_names = list(st.session_state.projects.keys())
-    formulation_counts = [project["formulations"] for project in st.session_state.projects.values()]
-    
-    # Create a DataFrame for the chart
-    project_df = pd.DataFrame({
-        'Project': project_names,
-        'Date': pd.to_datetime(project_dates),
-        'Formulations': formulation_counts
-    })
-    project_df = project_df.sort_values('Date')
+    # Daily activity counters
+    chart_started = time.perf_counter()
+    activity_df = pd.DataFrame(store.daily_activity(), columns=['Date', 'Projects', 'Formulations'])
+    activity_df['Date'] = pd.to_datetime(activity_df['Date'])
     
-    fig = px.bar(project_df, x='Project', y='Formulations', 
+    fig = px.bar(activity_df, x='Date', y='Formulations', 
                  color='Formulations', 
                  color_continuous_scale='Blues',
+                 hover_data=['Projects'],
                  labels={'Formulations': 'Number of Formulations'},
-                 title='Formulations by Project')
-    fig.update_layout(xaxis_title='Project', yaxis_title='Formulations', plot_bgcolor='rgba(0,0,0,0)')
+                 title='Formulations by Day')
+    fig.update_layout(xaxis_title='Date', yaxis_title='Formulations', plot_bgcolor='rgba(0,0,0,0)')
     st.plotly_chart(fig, use_container_width=True)
+    telemetry.record_span("chart.activity", time.perf_counter() - chart_started)
     
     # Project cards with premium styling
     st.markdown("""
@@ -434,9 +487,68 @@ if st.session_state.current_project is None:
     </div>
     """, unsafe_allow_html=True)
     
+    # Portfolio filters, sorting and pagination; only the current page is fetched and rendered
+    sort_options = {
+        "Newest first": ("created", True),
+        "Oldest first": ("created", False),
+        "Most formulations": ("formulations", True),
+        "Fewest formulations": ("formulations", False),
+        "Descriptor intensity": ("descriptor", True),
+    }
+    if "portfolio_page" not in st.session_state:
+        st.session_state.portfolio_page = 1
+
+    def reset_portfolio_page():
+        # A different result set starts again from its first page
+        st.session_state.portfolio_page = 1
+
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns([3, 2, 2, 1])
+    with filter_col1:
+        portfolio_search = st.text_input("Name starts with", key="portfolio_search", on_change=reset_portfolio_page)
+    with filter_col2:
+        portfolio_descriptor = st.selectbox("Descriptor", ["Any", *ALL_DESCRIPTORS], key="portfolio_descriptor",
+                                            on_change=reset_portfolio_page)
+    with filter_col3:
+        portfolio_sort = st.selectbox("Sort by", list(sort_options.keys()), key="portfolio_sort",
+                                      on_change=reset_portfolio_page)
+    with filter_col4:
+        page_size = st.selectbox("Per page", [6, 12, 24, 48], key="portfolio_page_size",
+                                 on_change=reset_portfolio_page)
+    
+    descriptor_filter = None if portfolio_descriptor == "Any" else portfolio_descriptor
+    sort_column, sort_descending = sort_options[portfolio_sort]
+    if sort_column == "descriptor" and descriptor_filter is None:
+        st.caption("Choose a descriptor to sort by its intensity; showing newest first.")
+        sort_column, sort_descending = "created", True
+    
+    matching_projects = store.count_projects(descriptor=descriptor_filter, prefix=portfolio_search)
+    page_count = max(1, -(-matching_projects // page_size))
+    if st.session_state.portfolio_page > page_count:
+        st.session_state.portfolio_page = page_count
+    page_col1, page_col2 = st.columns([1, 4])
+    with page_col1:
+        page = st.number_input("Page", min_value=1, max_value=page_count, key="portfolio_page")
+    with page_col2:
+        st.caption(f"{matching_projects} matching projects · page {page} of {page_count}")
+    
+    with telemetry.span("dashboard.portfolio_query"):
+        portfolio = store.list_projects(limit=page_size, offset=(page - 1) * page_size, sort=sort_column,
+                                        descending=sort_descending, descriptor=descriptor_filter,
+                                        prefix=portfolio_search)
+    
+    # Render the page's radar charts as one multi-subplot figure instead of one per card
+    combined_charts = st.toggle("Combined profile chart", key="combined_profile_chart",
+                                help="Draw all project profiles in a single chart to speed up the dashboard")
+    if combined_charts and portfolio:
+        with telemetry.span("chart.radar_grid"):
+            grid_fig = radar_grid_figure(tuple((details['name'], profile_key(details['profile']))
+                                               for details in portfolio))
+            st.plotly_chart(grid_fig, use_container_width=True)
+    
     # Display projects in a grid with enhanced styling
     cols = st.columns(3)
-    for i, (name, details) in enumerate(st.session_state.projects.items()):
+    for i, details in enumerate(portfolio):
+        name = details['name']
         with cols[i % 3]:
             # Enhanced project card with visual indicators
             st.markdown(f'''
@@ -454,40 +566,14 @@ if st.session_state.current_project is None:
             </div>
             ''', unsafe_allow_html=True)
             
-            # Small radar chart for each project with improved styling
-            profile_df = pd.DataFrame({
-                'Attribute': list(details['profile'].keys()),
-                'Value': list(details['profile'].values())
-            })
-            fig = px.line_polar(profile_df, r='Value', theta='Attribute', line_close=True)
-            fig.update_layout(
-                height=200, 
-                margin=dict(l=20, r=20, t=20, b=20),
-                polar=dict(
-                    radialaxis=dict(
-                        visible=True,
-                        range=[0, 7],
-                        linecolor='#3a2f5b',
-                        gridcolor='#f0f0f0'
-                    ),
-                    angularaxis=dict(
-                        linecolor='#3a2f5b',
-                        gridcolor='#f0f0f0'
-                    )
-                ),
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font=dict(color='#444')
-            )
-            fig.update_traces(
-                fill='toself',
-                fillcolor='rgba(184, 151, 61, 0.2)',
-                line=dict(color='#b8973d', width=2)
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            # Small radar chart for each project, memoized on the profile contents
+            if not combined_charts:
+                with telemetry.span("chart.radar_card"):
+                    st.plotly_chart(radar_figure(profile_key(details['profile'])), use_container_width=True,
+                                    key=f"radar_{name}")
             
             if st.button("Open Project", key=f"open_{name}"):
-                st.session_state.current_project = name
+                st.session_state.open_project = name
                 st.rerun()
     
     # Create New Project Form with premium styling
@@ -506,7 +592,7 @@ if st.session_state.current_project is None:
     """, unsafe_allow_html=True)
     
     with st.form("new_project_form"):
-        new_project_name = st.text_input("Project Name", key="new_project_name_input")
+        new_project_name = st.text_input("Project Name", max_chars=MAX_PROJECT_NAME_LENGTH, key="new_project_name_input")
         new_project_desc = st.text_area("Project Description", placeholder="Describe your fragrance project...", key="new_project_desc_input")
         
         col1, col2 = st.columns(2)
@@ -525,8 +611,10 @@ if st.session_state.current_project is None:
     
     # Process form outside the form block for better feedback
     if submit_btn:
-        if not new_project_name:
+        if not new_project_name.strip():
             st.error("Please provide a project name.")
+        elif store.project_exists(new_project_name):
+            st.error(f"A project named '{new_project_name}' already exists.")
         else:
             profile = {}
             for attr, val in [("Fruity", fruity), ("Floral", floral), ("Spicy", spicy), 
@@ -535,13 +623,9 @@ if st.session_state.current_project is None:
                 if val > 0:
                     profile[attr] = val
             
-            st.session_state.projects[new_project_name] = {
-                "created": datetime.now().strftime("%Y-%m-%d"),
-                "formulations": 0,
-                "profile": profile,
-                "description": new_project_desc
-            }
-            st.session_state.current_project = new_project_name
+            store.create_project(new_project_name, new_project_desc, profile)
+            profile_index.upsert(new_project_name, profile)
+            st.session_state.open_project = new_project_name
             
             success_msg = st.success(f"Project '{new_project_name}' created successfully! Redirecting to project workspace...")
             time.sleep(2)
@@ -550,6 +634,7 @@ if st.session_state.current_project is None:
 # Project Workspace - shown when a project is selected
 else:
     current = st.session_state.current_project
+    project = store.get_project(current)
     
     # Project header with tabs for different modules
     st.header(f"Project: {current}")
@@ -564,88 +649,660 @@ else:
     with progress_col2:
         progress = st.progress((current_stage) / len(project_stages))
     
-    # Project workspace with tabs for each module
-    tabs = st.tabs(["📋 Profile", "🧪 Formulation", "📊 Analysis", "🔄 Refinement"])
+    # All possible descriptors and preset combinations
+    all_descriptors = ALL_DESCRIPTORS
+    preset_combinations = session_presets(st.session_state)
     
-    # Module 1: Define Target Scent/Flavour Profile
-    with tabs[0]:
-        st.subheader("Define Target Scent/Flavour Profile")
+    # Project workspace modules. Only the active module's code runs on a rerun,
+    # unlike st.tabs which executes every tab body even though one is visible.
+    workspace_modules = ["📋 Profile", "🧪 Formulation", "📊 Analysis", "🔄 Refinement"]
+    active_module = st.radio("Workspace module", workspace_modules, horizontal=True,
+                             key="active_module", label_visibility="collapsed")
+    
+    # Outputs of module computations, reused until their inputs change
+    if 'module_outputs' not in st.session_state:
+        st.session_state.module_outputs = {}
+    
+    def module_output(module, name, inputs, build):
+        cached = st.session_state.module_outputs.get((module, name))
+        if cached is not None and cached[0] == inputs:
+            return cached[1]
+        value = build()
+        st.session_state.module_outputs[(module, name)] = (inputs, value)
+        return value
+    
+    # Profile editor runs as a fragment: a slider change re-executes only this section
+    @st.fragment
+    def profile_editor(current):
+        # Always read the stored profile; the outer script may not have rerun since the last edit
+        profile = store.get_profile(current)
+        
+        # Seed widget state when the editor opens on a project so sliders show its values
+        if (st.session_state.get("profile_editor_project") != current
+                or any(f"slider_{desc}" not in st.session_state for desc in all_descriptors)):
+            for desc in all_descriptors:
+                st.session_state[f"slider_{desc}"] = profile.get(desc, 0)
+            st.session_state.profile_editor_project = current
         
         col1, col2 = st.columns([3, 2])
         
         with col1:
-            project_desc = st.text_area(
-                "Natural Language Description", 
-                value=st.session_state.projects[current].get("description", ""),
-                height=150,
-                placeholder="Describe your desired scent or flavour in detail..."
-            )
-            
-            # Save description when changed
-            if project_desc != st.session_state.projects[current].get("description", ""):
-                st.session_state.projects[current]["description"] = project_desc
-            
             # Structured sensory profile input
             st.write("Adjust Sensory Profile")
             
-            # Get current profile or initialize empty
-            profile = st.session_state.projects[current].get("profile", {})
-            
-            # All possible descriptors
-            all_descriptors = ["Fruity", "Floral", "Spicy", "Sweet", "Sour", "Woody", 
-                              "Creamy", "Nutty", "Fresh", "Herbal", "Citrus", "Earthy", 
-                              "Green", "Musky", "Powdery", "Vanilla", "Amber", "Balsamic"]
-            
-            # Preset combinations
-            preset_combinations = {
-                "Floral Fresh": {"Floral": 6, "Fresh": 5, "Citrus": 3, "Green": 2},
-                "Woody Oriental": {"Woody": 5, "Spicy": 4, "Amber": 3, "Vanilla": 2},
-                "Citrus Aromatic": {"Citrus": 6, "Herbal": 4, "Fresh": 3},
-                "Gourmand Sweet": {"Sweet": 5, "Vanilla": 4, "Creamy": 3, "Nutty": 2}
-            }
-            
             # Presets selector
             preset = st.selectbox("Quick Presets", ["Custom"] + list(preset_combinations.keys()))
             
             if preset != "Custom" and st.button("Apply Preset"):
-                profile = preset_combinations[preset]
-                st.session_state.projects[current]["profile"] = profile
+                profile = dict(preset_combinations[preset])
+                store.set_profile(current, profile)
+                profile_index.upsert(current, profile)
+                # Sliders render below, so updating their state here shows the preset without a rerun
+                for desc in all_descriptors:
+                    st.session_state[f"slider_{desc}"] = profile.get(desc, 0)
                 st.success(f"Applied {preset} preset")
-                st.rerun()
             
-            # Create multi-column layout for sliders
-            slider_cols = st.columns(3)
-            updated_profile = {}
+            batch_mode = st.toggle("Batch edit", key="profile_batch_mode",
+                                   help="Adjust several sliders, then apply them together")
             
-            # Display sliders for all descriptors, showing current values if they exist
-            for i, desc in enumerate(all_descriptors):
-                with slider_cols[i % 3]:
-                    value = profile.get(desc, 0)
-                    new_value = st.slider(desc, 0, 7, value, key=f"slider_{desc}")
-                    if new_value > 0:
-                        updated_profile[desc] = new_value
+            # Create multi-column layout for sliders, inside a form when batching edits
+            slider_area = st.form("profile_batch_form", border=False) if batch_mode else st.container()
+            with slider_area:
+                slider_cols = st.columns(3)
+                
+                # Display sliders for all descriptors, showing current values if they exist
+                for i, desc in enumerate(all_descriptors):
+                    with slider_cols[i % 3]:
+                        st.slider(desc, 0, 7, key=f"slider_{desc}")
+                
+                if batch_mode:
+                    st.form_submit_button("Apply Changes")
+            
+            updated_profile = {}
+            for desc in all_descriptors:
+                value = st.session_state[f"slider_{desc}"]
+                if value > 0:
+                    updated_profile[desc] = value
             
             # Save updated profile
             if updated_profile != profile:
-                st.session_state.projects[current]["profile"] = updated_profile
-        
+                store.set_profile(current, updated_profile)
+                profile_index.upsert(current, updated_profile)
+                profile = updated_profile
+
+            # Saved presets stay in this session, layered over the shared ones
+            preset_name = st.text_input("Save as Preset", key="preset_name_input", placeholder="Preset name")
+            if st.button("Save Preset", key="save_preset_btn", disabled=not (preset_name.strip() and profile)):
+                session_overlay = preset_combinations.maps[0]
+                if preset_name.strip() not in session_overlay and len(session_overlay) >= MAX_SESSION_PRESETS:
+                    st.error(f"You can save up to {MAX_SESSION_PRESETS} presets per session.")
+                else:
+                    preset_combinations[preset_name.strip()] = dict(profile)
+                    st.success(f"Saved preset '{preset_name.strip()}'")
+
         with col2:
             # Visualization of the current sensory profile
             st.write("Current Sensory Profile")
             
             if profile:
-                profile_df = pd.DataFrame({
-                    'Attribute': list(profile.keys()),
-                    'Value': list(profile.values())
-                })
+                def build_profile_chart():
+                    profile_df = pd.DataFrame({
+                        'Attribute': list(profile.keys()),
+                        'Value': list(profile.values())
+                    })
+                    
+                    fig = px.line_polar(profile_df, r='Value', theta='Attribute', line_close=True)
+                    fig.update_layout(
+                        polar=dict(
+                            radialaxis=dict(
+                                visible=True,
+                                range=[0, 7]
+                            )
+                        ),
+                        showlegend=False
+                    )
+                    return fig
                 
-                fig = px.line_polar(profile_df, r='Value', theta='Attribute', line_close=True)
-                fig.update_layout(
-                    polar=dict(
-                        radialaxis=dict(
-                            visible=True,
-                            range=[0, 7]
-                        )
-                    ),
-                    showlegend=False
+                with telemetry.span("chart.profile_radar"):
+                    fig = module_output("profile", "radar", sorted(profile.items()), build_profile_chart)
+                    st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("Adjust the sliders to build a sensory profile.")
+            
+            # Nearest neighbours over every stored profile, for reusing past work
+            st.write("Similar Projects")
+            similarity_metric = st.radio("Similarity", ["Cosine", "Euclidean"], horizontal=True,
+                                         key="similarity_metric", label_visibility="collapsed")
+            neighbours = profile_index.query(profile, k=5, metric=similarity_metric.lower(), exclude=current)
+            if profile and neighbours:
+                similar_projects = [store.get_project(name) for name, _ in neighbours]
+                st.dataframe(pd.DataFrame({
+                    'Project': [name for name, _ in neighbours],
+                    'Similarity' if similarity_metric == "Cosine" else 'Distance': [round(score, 3) for _, score in neighbours],
+                    'Formulations': [p['formulations'] if p else 0 for p in similar_projects],
+                    'Description': [p['description'] if p else '' for p in similar_projects]
+                }), use_container_width=True, hide_index=True)
+            else:
+                st.caption("Set a profile to find similar projects.")
+    
+    # Module 1: Define Target Scent/Flavour Profile
+    if active_module == workspace_modules[0]:
+        st.subheader("Define Target Scent/Flavour Profile")
+        
+        # Seed the description widget per project; undo and redo reseed it with the restored text
+        if st.session_state.get("description_project") != current:
+            st.session_state.project_desc_input = project.get("description", "")
+            st.session_state.description_project = current
+        
+        project_desc = st.text_area(
+            "Natural Language Description", 
+            key="project_desc_input",
+            height=150,
+            placeholder="Describe your desired scent or flavour in detail..."
+        )
+        
+        # Save description when changed
+        if project_desc != project.get("description", ""):
+            store.update_description(current, project_desc)
+            project["description"] = project_desc
+        
+        # Undo/redo step through the project's version history; callbacks run before the
+        # script, so the restored description and profile render on this same run
+        def restore_version(step, *args):
+            if step(current, *args):
+                profile_index.upsert(current, store.get_profile(current))
+                st.session_state.pop("profile_editor_project", None)
+                st.session_state.pop("description_project", None)
+        
+        undo_col, redo_col, _ = st.columns([1, 1, 6])
+        undo_col.button("↶ Undo", key="undo_btn", on_click=restore_version, args=(store.undo,),
+                        use_container_width=True)
+        redo_col.button("↷ Redo", key="redo_btn", on_click=restore_version, args=(store.redo,),
+                        use_container_width=True)
+        
+        profile_editor(current)
+        
+        with st.expander("Version History"):
+            versions = store.list_versions(current)
+            st.dataframe(pd.DataFrame({
+                'Version': [v['id'] for v in versions],
+                'Saved': [v['created'] for v in versions],
+                'Change': [("▶ " if v['head'] else "") + v['label'] for v in versions],
+            }), use_container_width=True, hide_index=True)
+            
+            if len(versions) > 1:
+                version_ids = [v['id'] for v in versions]
+                version_labels = {v['id']: f"#{v['id']} · {v['label']}" for v in versions}
+                compare_a, compare_b = st.columns(2)
+                with compare_a:
+                    version_a = st.selectbox("Compare", version_ids, index=1, key="version_a",
+                                             format_func=version_labels.get)
+                with compare_b:
+                    version_b = st.selectbox("With", version_ids, index=0, key="version_b",
+                                             format_func=version_labels.get)
+                state_a, state_b = store.version_state(version_a), store.version_state(version_b)
+                changed = sorted(d for d in all_descriptors
+                                 if state_a["profile"].get(d, 0) != state_b["profile"].get(d, 0))
+                if changed:
+                    st.dataframe(pd.DataFrame({
+                        'Descriptor': changed,
+                        f'#{version_a}': [state_a["profile"].get(d, 0) for d in changed],
+                        f'#{version_b}': [state_b["profile"].get(d, 0) for d in changed],
+                    }), use_container_width=True, hide_index=True)
+                else:
+                    st.caption("Profiles are identical.")
+                if state_a["description"] != state_b["description"]:
+                    st.write(f"**#{version_a}:** {state_a['description'] or '(empty)'}")
+                    st.write(f"**#{version_b}:** {state_b['description'] or '(empty)'}")
+                
+                # Formulations are stored once; each version points at the project's current one
+                formulation_ids = {v['id']: v['formulation_id'] for v in versions}
+                formulation_a = store.get_formulation(formulation_ids[version_a]) if formulation_ids[version_a] else None
+                formulation_b = store.get_formulation(formulation_ids[version_b]) if formulation_ids[version_b] else None
+                if formulation_a or formulation_b:
+                    st.caption(f"Formulation at #{version_a}: {(formulation_a or {}).get('name', 'none')} · "
+                               f"at #{version_b}: {(formulation_b or {}).get('name', 'none')}")
+                
+                st.button(f"Restore #{version_a}", key="restore_version_btn", on_click=restore_version,
+                          args=(store.checkout_version, version_a),
+                          help="Restores the description, profile and current formulation. "
+                               "Later edits branch from the restored version; nothing is deleted")
+    
+    # Module 2: Generate Formulations
+    elif active_module == workspace_modules[1]:
+        st.subheader("Generate Formulations")
+        
+        
+        generation_mode = st.radio("Generation Mode", ["Single", "Variants", "Local Draft"], horizontal=True,
+                                   key="generation_mode")
+        if generation_mode == "Variants":
+            variant_col1, variant_col2 = st.columns(2)
+            with variant_col1:
+                variant_count = st.number_input("Number of variants", 2, 10, 5, key="variant_count")
+            with variant_col2:
+                variant_concurrency = st.slider("Max concurrent requests", 1, 10, 4, key="variant_concurrency")
+        
+        if generation_mode == "Variants" and st.button("Generate Variants", key="generate_variants_btn"):
+            if not project.get("profile") and not project.get("description"):
+                st.error("Define a sensory profile or description before generating a formulation.")
+            else:
+                # Fan requests out concurrently and render each candidate as soon as it finishes.
+                # A rerun (e.g. navigating away) interrupts the loop, which cancels pending requests.
+                variant_slots = [st.empty() for _ in range(variant_count)]
+                
+                async def render_variants():
+                    finished = 0
+                    async for event in generate_variants(
+                        openai_api_key, model_choice, temperature,
+                        project.get("profile", {}), project.get("description", ""),
+                        variant_count, variant_concurrency, cache=response_cache, scheduler=scheduler,
+                        telemetry=telemetry
+                    ):
+                        slot = variant_slots[finished].container()
+                        finished += 1
+                        if event[0] == "error":
+                            slot.error(f"Variant {event[1] + 1} failed: {event[2]}")
+                            continue
+                        _, index, formulation, cached = event
+                        store.add_formulation(current, formulation)
+                        slot.markdown(f"#### Variant {index + 1}: {formulation.get('name') or 'Untitled'}"
+                                      + (" *(cached)*" if cached else ""))
+                        slot.dataframe(pd.DataFrame(formulation["ingredients"]),
+                                       use_container_width=True, hide_index=True)
+                
+                with st.spinner(f"Generating {variant_count} variants..."), telemetry.span("llm.variants"):
+                    asyncio.run(render_variants())
+        
+        def stream_and_save(draft=None):
+            # Stream the reply so the ingredient table fills in row by row
+            status = st.empty()
+            table = st.empty()
+            rows = []
+            formulation = None
+            status.caption("Polishing draft..." if draft else "Composing formulation...")
+            stream_started = time.perf_counter()
+            try:
+                for event in stream_formulation(
+                    client, model_choice, temperature,
+                    project.get("profile", {}), project.get("description", ""),
+                    cache=response_cache, scheduler=scheduler, draft=draft, telemetry=telemetry,
+                    semantic=semantic_cache
+                ):
+                    if event[0] == "ingredient":
+                        rows.append(event[1])
+                        table.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+                    else:
+                        formulation, cached = event[1], event[2]
+            except Exception as e:
+                st.error(f"Formulation generation failed: {e}")
+            telemetry.record_span("llm.polish" if draft else "llm.stream", time.perf_counter() - stream_started)
+            status.empty()
+            table.empty()
+            if formulation is not None:
+                store.add_formulation(current, formulation)
+                st.success("Loaded formulation from cache" if cached else "Formulation generated")
+        
+        if generation_mode == "Single" and st.button("Generate Formulation", key="generate_formulation_btn"):
+            if not project.get("profile") and not project.get("description"):
+                st.error("Define a sensory profile or description before generating a formulation.")
+            else:
+                stream_and_save()
+        
+        if generation_mode == "Local Draft":
+            # Deterministic blend fitted to the profile from catalog descriptor vectors; no API call
+            draft_max_share = st.slider("Max share per ingredient (%)", 10, 60, 30, step=5, key="draft_max_share")
+            if not project.get("profile"):
+                st.info("Set a sensory profile to draft a blend locally.")
+            else:
+                draft = module_output(
+                    "formulation", "draft", (sorted(project["profile"].items()), draft_max_share),
+                    lambda: draft_formulation(ingredient_catalog, project["profile"], max_share=draft_max_share / 100)
                 )
+                st.dataframe(pd.DataFrame(draft["ingredients"]), use_container_width=True, hide_index=True)
+                st.caption(draft["notes"])
+                draft_col1, draft_col2 = st.columns(2)
+                with draft_col1:
+                    if st.button("Save Draft", key="save_draft_btn"):
+                        store.add_formulation(current, draft)
+                        st.success("Draft saved")
+                with draft_col2:
+                    polish = st.button("Polish with AI", key="polish_draft_btn")
+                if polish:
+                    stream_and_save(draft)
+        
+        latest = store.latest_formulation(current)
+        if latest and generation_mode != "Variants":
+            st.markdown(f"#### {latest.get('name') or 'Latest formulation'}")
+            latest_df = pd.DataFrame(latest["ingredients"])
+            if not latest_df.empty:
+                # Enrich with catalog data where the ingredient is known
+                catalog_rows = ingredient_catalog.lookup_many(list(latest_df["name"]))
+                known = catalog_rows >= 0
+                latest_df["cost ($/kg)"] = np.where(known, ingredient_catalog.cost[np.maximum(catalog_rows, 0)], np.nan)
+                ifra_limits = np.where(known, ingredient_catalog.ifra_limit[np.maximum(catalog_rows, 0)], np.nan)
+                latest_df["IFRA limit (%)"] = ifra_limits
+                latest_df["IFRA ok"] = np.where(known, latest_df["percentage"] <= ifra_limits, None)
+            st.dataframe(latest_df, use_container_width=True, hide_index=True)
+            if latest.get("notes"):
+                st.caption(latest["notes"])
+            
+            if show_molecular:
+                structures = [(item["name"], structure_for(item["name"])) for item in latest["ingredients"]]
+                structures = [(name, structure) for name, structure in structures if structure]
+                with st.expander(f"Molecular Structures ({len(structures)})"):
+                    if not structures:
+                        st.write("No structure data for these ingredients.")
+                    # Thumbnails come pre-rendered from the shared cache; missing ones render in the background
+                    structure_cols = st.columns(6)
+                    for i, (name, (molecule, smiles)) in enumerate(structures):
+                        with structure_cols[i % 6]:
+                            thumbnail = thumbnail_cache.get_ready(smiles, 128)
+                            caption = name if molecule == name else f"{name} ({molecule})"
+                            if thumbnail is not None:
+                                st.image(thumbnail, caption=caption, width="stretch")
+                            elif thumbnail_cache.failed(smiles, 128):
+                                st.caption(f"{caption}: structure unavailable")
+                            else:
+                                st.caption(f"Rendering {caption}...")
+        elif not latest:
+            st.info("No formulations yet for this project.")
+        
+        # Browse the shared ingredient catalog by name prefix and vectorized filters
+        with st.expander("Ingredient Catalog"):
+            catalog_col1, catalog_col2, catalog_col3, catalog_col4 = st.columns(4)
+            with catalog_col1:
+                catalog_prefix = st.text_input("Name starts with", key="catalog_prefix")
+            with catalog_col2:
+                catalog_notes = st.multiselect("Notes", ["top", "heart", "base"], key="catalog_notes")
+            with catalog_col3:
+                catalog_descriptor = st.selectbox("Descriptor", ["Any", *all_descriptors], key="catalog_descriptor")
+            with catalog_col4:
+                catalog_max_cost = st.number_input("Max cost ($/kg)", 0, 10000, 10000, step=50,
+                                                   key="catalog_max_cost")
+            catalog_matches = ingredient_catalog.filter(
+                notes=catalog_notes, max_cost=catalog_max_cost,
+                descriptor=None if catalog_descriptor == "Any" else catalog_descriptor
+            )
+            if catalog_prefix:
+                catalog_matches = np.intersect1d(catalog_matches,
+                                                 ingredient_catalog.search_prefix(catalog_prefix, limit=len(ingredient_catalog)))
+            st.caption(f"{len(catalog_matches)} of {len(ingredient_catalog)} ingredients")
+            st.dataframe(pd.DataFrame(ingredient_catalog.records(catalog_matches[:200])),
+                         use_container_width=True, hide_index=True)
+        
+        if show_advanced:
+            with st.expander("Request Scheduler"):
+                st.caption("Shared across all sessions of this app process")
+                scheduler_metrics = scheduler.metrics()
+                if scheduler_metrics:
+                    st.dataframe(pd.DataFrame(scheduler_metrics).T, use_container_width=True)
+                else:
+                    st.write("No LLM requests scheduled yet.")
+    
+    # Module 3: Analyze Results
+    elif active_module == workspace_modules[2]:
+        st.subheader("Analyze Results")
+        
+        all_formulations = store.list_formulations(current)
+        # Most recent formulations are the candidates for the detailed stability comparison
+        candidates = all_formulations[-8:]
+        if not candidates:
+            st.info("Generate formulations to compare them here.")
+        else:
+            if len(all_formulations) >= 2:
+                st.markdown(f"#### Formulation Comparison ({len(all_formulations)})")
+                compare_col1, compare_col2, compare_col3 = st.columns(3)
+                with compare_col1:
+                    compare_basis = st.radio("Compare by", ["Combined", "Perceived profile", "Ingredients"],
+                                             horizontal=True, key="compare_basis")
+                with compare_col2:
+                    cluster_count = st.slider("Clusters", 1, 8, min(4, len(all_formulations)), key="compare_clusters")
+                with compare_col3:
+                    max_points = st.select_slider("Max plotted points", [250, 500, 1000, 2000, 5000], 2000,
+                                                  key="compare_max_points")
+                
+                # Formulations are append-only, so the count and newest entry identify the set
+                compare_inputs = (current, len(all_formulations), formulation_hash(all_formulations[-1]))
+                comparison = module_output("analysis", "features", compare_inputs,
+                                           lambda: comparison_features(ingredient_catalog, all_formulations))
+                profile_weight = {"Combined": 0.5, "Perceived profile": 1.0, "Ingredients": 0.0}[compare_basis]
+                
+                def build_projection():
+                    points = combined_features(comparison, profile_weight)
+                    labels, _ = kmeans(points, cluster_count)
+                    return labels, project_2d(points)
+                
+                with telemetry.span("analysis.comparison"):
+                    cluster_labels, projection = module_output(
+                        "analysis", "projection", (compare_inputs, compare_basis, cluster_count), build_projection
+                    )
+                    formulation_labels = np.array([f"{i + 1}. {f.get('name') or 'Untitled'}"
+                                                   for i, f in enumerate(all_formulations)])
+                    # The newest formulations are always drawn; the rest are thinned per cluster
+                    shown = downsample(projection, cluster_labels, max_points,
+                                       keep=np.arange(len(all_formulations) - len(candidates), len(all_formulations)))
+                    projection_fig = go.Figure([
+                        go.Scattergl(
+                            x=projection[shown][cluster_labels[shown] == c, 0],
+                            y=projection[shown][cluster_labels[shown] == c, 1],
+                            mode="markers", name=f"Cluster {c + 1}",
+                            text=formulation_labels[shown][cluster_labels[shown] == c],
+                            hovertemplate="%{text}<extra></extra>", marker=dict(size=7, opacity=0.75),
+                        )
+                        for c in np.unique(cluster_labels)
+                    ])
+                    projection_fig.update_layout(height=420, margin=dict(l=20, r=20, t=20, b=20),
+                                                 xaxis_title="Component 1", yaxis_title="Component 2")
+                    st.plotly_chart(projection_fig, use_container_width=True, key="compare_projection")
+                if len(shown) < len(all_formulations):
+                    st.caption(f"Showing {len(shown)} of {len(all_formulations)} formulations, "
+                               "thinned where points overlap")
+                
+                # Cluster summaries from the perceived profile matrix, one vectorized pass per cluster
+                cluster_ids, cluster_sizes = np.unique(cluster_labels, return_counts=True)
+                st.dataframe(pd.DataFrame({
+                    "Cluster": [f"Cluster {c + 1}" for c in cluster_ids],
+                    "Formulations": cluster_sizes,
+                    "Main descriptors": [
+                        ", ".join(ALL_DESCRIPTORS[j] for j in
+                                  np.argsort(-comparison["profiles"][cluster_labels == c].mean(axis=0))[:3])
+                        for c in cluster_ids
+                    ],
+                    "Top ingredients": [
+                        ", ".join(comparison["ingredients"][j].title() for j in
+                                  np.argsort(-comparison["weights"][cluster_labels == c].mean(axis=0))[:3])
+                        for c in cluster_ids
+                    ],
+                }), use_container_width=True, hide_index=True)
+                
+                # Nearest neighbours of one formulation over the whole set
+                compare_target = st.selectbox("Most similar to", range(len(all_formulations)),
+                                              index=len(all_formulations) - 1,
+                                              format_func=lambda i: formulation_labels[i], key="compare_target")
+                target_points = combined_features(comparison, profile_weight)
+                target_distances = pairwise_distances(target_points[[compare_target]], target_points)[0]
+                target_distances[compare_target] = np.inf
+                nearest = np.argsort(target_distances)[:min(5, len(all_formulations) - 1)]
+                st.dataframe(pd.DataFrame({
+                    "Formulation": formulation_labels[nearest],
+                    "Distance": target_distances[nearest].round(3),
+                    "Profile distance": pairwise_distances(comparison["profiles"][[compare_target]],
+                                                           comparison["profiles"][nearest])[0].round(2),
+                    "Cluster": [f"Cluster {c + 1}" for c in cluster_labels[nearest]],
+                }), use_container_width=True, hide_index=True)
+            
+            if show_stability:
+                st.markdown("#### Stability & Longevity")
+                with telemetry.span("analysis.stability_simulation"):
+                    stability_results = stability_simulator.simulate(candidates)
+                candidate_labels = [f"{i + 1}. {f.get('name') or 'Untitled'}" for i, f in enumerate(candidates)]
+                candidate_hashes = tuple(formulation_hash(f) for f in candidates)
+            
+                def build_stability_charts():
+                    intensity_fig = go.Figure()
+                    drift_fig = go.Figure()
+                    for label, result in zip(candidate_labels, stability_results):
+                        intensity_fig.add_trace(go.Scatter(x=result["times"], y=result["intensity"], name=label))
+                        drift_fig.add_trace(go.Scatter(x=result["times"], y=result["drift"], name=label))
+                    intensity_fig.update_layout(title="Perceived Intensity", xaxis_title="Hours",
+                                                yaxis_title="Relative to application", height=320,
+                                                margin=dict(l=20, r=20, t=40, b=20))
+                    drift_fig.update_layout(title="Profile Drift", xaxis_title="Hours",
+                                            yaxis_title="Distance from opening", height=320,
+                                            margin=dict(l=20, r=20, t=40, b=20))
+                    return intensity_fig, drift_fig
+            
+                with telemetry.span("chart.stability"):
+                    intensity_fig, drift_fig = module_output("analysis", "stability", (candidate_hashes, candidate_labels),
+                                                             build_stability_charts)
+                stability_col1, stability_col2 = st.columns(2)
+                with stability_col1:
+                    st.plotly_chart(intensity_fig, use_container_width=True, key="stability_intensity")
+                with stability_col2:
+                    st.plotly_chart(drift_fig, use_container_width=True, key="stability_drift")
+            
+                st.dataframe(pd.DataFrame({
+                    "Formulation": candidate_labels,
+                    "Longevity (h)": [round(r["longevity_hours"], 1) for r in stability_results],
+                    "Drift at 1h": [round(float(np.interp(1, r["times"], r["drift"])), 2) for r in stability_results],
+                    "Drift at 8h": [round(float(np.interp(8, r["times"], r["drift"])), 2) for r in stability_results],
+                    "Opening": [max(descriptor_at(r, 0).items(), key=lambda kv: kv[1])[0] for r in stability_results],
+                    "Dry-down (8h)": [max(descriptor_at(r, 8).items(), key=lambda kv: kv[1])[0] for r in stability_results],
+                }), use_container_width=True, hide_index=True)
+            
+                balance_choice = st.selectbox("Note balance for", candidate_labels, index=len(candidate_labels) - 1,
+                                              key="stability_formulation")
+                balance = stability_results[candidate_labels.index(balance_choice)]
+                balance_fig = go.Figure([
+                    go.Scatter(x=balance["times"], y=balance["note_balance"][:, i], name=note.title(),
+                               stackgroup="notes")
+                    for i, note in enumerate(NOTES)
+                ])
+                balance_fig.update_layout(xaxis_title="Hours", yaxis_title="Share of headspace", height=300,
+                                          margin=dict(l=20, r=20, t=20, b=20))
+                st.plotly_chart(balance_fig, use_container_width=True, key="stability_balance")
+            else:
+                st.info("Turn on Stability Analysis in the sidebar to simulate evaporation and longevity.")
+    
+    # Module 4: Refine & Iterate
+    else:
+        st.subheader("Refine & Iterate")
+        
+        latest = store.latest_formulation(current)
+        if not latest:
+            st.info("Refinement tools will appear here once formulations exist.")
+        else:
+            # One refinement session per project; a formulation generated elsewhere starts a new one
+            sessions = st.session_state.setdefault("refinement_sessions", {})
+            session = sessions.get(current)
+            stored_profile = store.get_profile(current)
+            if session is None or session.formulation != latest:
+                session = sessions[current] = RefinementSession(project.get("description", ""),
+                                                                stored_profile, latest)
+            # Seed the target inputs from the stored profile when it changed elsewhere or they were cleared
+            refine_seed = (current, sorted(stored_profile.items()))
+            if (st.session_state.get("refine_seed") != refine_seed
+                    or any(f"refine_{desc}" not in st.session_state for desc in all_descriptors)):
+                for desc in all_descriptors:
+                    st.session_state[f"refine_{desc}"] = stored_profile.get(desc, 0)
+                st.session_state.refine_seed = refine_seed
+            
+            st.markdown(f"#### {session.formulation.get('name') or 'Current formulation'}")
+            st.dataframe(pd.DataFrame(session.formulation["ingredients"]), use_container_width=True, hide_index=True)
+            
+            # A form so slider moves are sent together as one round's profile delta
+            with st.form("refine_form"):
+                st.write("Adjust the target, then describe what to change")
+                refine_cols = st.columns(6)
+                for i, desc in enumerate(all_descriptors):
+                    with refine_cols[i % 6]:
+                        st.number_input(desc, 0, 7, key=f"refine_{desc}")
+                refine_feedback = st.text_area("Feedback", key="refine_feedback", height=80,
+                                               placeholder="e.g. warmer dry-down, less sharp opening")
+                refine_submitted = st.form_submit_button("Refine")
+            
+            if refine_submitted:
+                refine_profile = {desc: st.session_state[f"refine_{desc}"] for desc in all_descriptors}
+                try:
+                    with st.spinner("Refining formulation..."), telemetry.span("llm.refine"):
+                        refined = refine_formulation(client, model_choice, temperature, session, refine_profile,
+                                                     refine_feedback, scheduler=scheduler, telemetry=telemetry)
+                except Exception as e:
+                    st.error(f"Refinement failed: {e}")
+                else:
+                    store.add_formulation(current, refined)
+                    store.set_profile(current, session.profile)
+                    profile_index.upsert(current, session.profile)
+                    st.rerun()
+            
+            if session.rounds:
+                # Prompt size per round should stay flat as history is compacted into the summary
+                st.markdown("#### Rounds")
+                st.dataframe(pd.DataFrame([{
+                    "Round": r["round"], "Profile changes": r["changes"], "Feedback": r["feedback"],
+                    "Model change note": r["change"], "Prompt tokens": r["prompt_tokens"],
+                    "Completion tokens": r["completion_tokens"], "Seconds": r["seconds"],
+                } for r in session.rounds]), use_container_width=True, hide_index=True)
+                with st.expander("Rolling summary sent with the next round"):
+                    st.text(session.summary())
+
+# Whole-run time, labelled by page so dashboard and module reruns can be compared
+if st.session_state.current_project is None:
+    telemetry.record_span("script.dashboard", time.perf_counter() - run_started)
+else:
+    telemetry.record_span(f"script.{active_module.split(' ', 1)[1].lower()}", time.perf_counter() - run_started)
+
+# Where rerun time and API budget go, across every session of this app process
+if show_advanced:
+    with st.expander("Advanced Analytics", expanded=True):
+        telemetry_snapshot = telemetry.snapshot()
+        st.caption(f"Percentiles over the last {telemetry_snapshot['window']} samples per measurement, in ms")
+        span_rows = [
+            {"Section": name, "Count": stats["count"],
+             **{label: round(stats[key] * 1000, 2) for label, key in
+                [("p50", "p50"), ("p90", "p90"), ("p99", "p99"), ("Mean", "mean")] if key in stats}}
+            for name, stats in telemetry_snapshot["spans"].items()
+        ]
+        st.dataframe(pd.DataFrame(span_rows), use_container_width=True, hide_index=True)
+        
+        st.markdown("#### LLM Calls")
+        llm_rows = []
+        for model, entry in telemetry_snapshot["llm"].items():
+            for kind, metrics in entry.get("timings", {}).items():
+                row = {"Model": model, "Kind": kind}
+                for metric, stats in metrics.items():
+                    row[f"{metric} p50"] = round(stats["p50"] * 1000, 1)
+                    row[f"{metric} p90"] = round(stats["p90"] * 1000, 1)
+                llm_rows.append(row)
+        if llm_rows:
+            st.dataframe(pd.DataFrame(llm_rows), use_container_width=True, hide_index=True)
+            st.dataframe(pd.DataFrame({model: {key: value for key, value in entry.items() if key != "timings"}
+                                       for model, entry in telemetry_snapshot["llm"].items()}).T,
+                         use_container_width=True)
+        else:
+            st.write("No LLM calls recorded yet.")
+
+        st.markdown("#### Session Memory")
+        # Shared reference data reachable from session state is not charged to the session
+        footprint = session_footprint(
+            st.session_state.to_dict(),
+            shared=(ALL_DESCRIPTORS, PRESET_COMBINATIONS, ingredient_catalog, stability_simulator, store),
+        )
+        st.caption(f"This session holds about {sum(footprint.values()) / 1024:.1f} KB "
+                   f"across {len(footprint)} keys, excluding shared reference data")
+        st.dataframe(pd.DataFrame(
+            sorted(({"Key": str(key), "KB": round(size / 1024, 2)} for key, size in footprint.items()),
+                   key=lambda row: -row["KB"])[:15]
+        ), use_container_width=True, hide_index=True)
+
+        export_col1, export_col2, export_col3 = st.columns(3)
+        with export_col1:
+            st.download_button("Export JSON", telemetry.to_json, file_name="essence_telemetry.json",
+                               mime="application/json", key="telemetry_json_btn")
+        with export_col2:
+            st.download_button("Export Prometheus", telemetry.to_prometheus, file_name="essence_metrics.prom",
+                               mime="text/plain", key="telemetry_prom_btn")
+        with export_col3:
+            if st.button("Reset Telemetry", key="telemetry_reset_btn"):
+                telemetry.reset()
+                st.rerun()
@@ -0,0 +1,182 @@
+import json
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+import streamlit as st
+
+PERCENTILES = (50, 90, 99)
+
+
+class RollingStats:
+    """Recent samples of one measurement (a bounded window) plus lifetime count and sum."""
+
+    def __init__(self, window=500):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        values = np.fromiter(self.samples, dtype=float, count=len(self.samples))
+        result = {"count": self.count, "sum": round(self.total, 6)}
+        if len(values):
+            result["mean"] = round(float(values.mean()), 6)
+            for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                result[f"p{p}"] = round(float(value), 6)
+        return result
+
+
+class Telemetry:
+    """Process-wide timing spans and per-call LLM telemetry, safe to share across sessions.
+
+    Spans time named sections of the script; ``record_llm`` takes one call's queue
+    wait, time to first token, latency, token usage and cache outcome. Durations keep a
+    rolling window for percentiles; counters are lifetime totals.
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._spans = defaultdict(lambda: RollingStats(window))
+        self._llm_timings = defaultdict(lambda: RollingStats(window))
+        self._llm_counters = defaultdict(lambda: defaultdict(int))
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, time.perf_counter() - started)
+
+    def record_span(self, name, seconds):
+        with self._lock:
+            self._spans[name].add(seconds)
+
+    def record_llm(self, model, kind, latency, cached=False, queue_wait=None, first_token=None,
+                   prompt_tokens=0, completion_tokens=0, error=False):
+        """Record one LLM request (or cache hit) of ``kind`` such as "stream" or "variant"."""
+        with self._lock:
+            counters = self._llm_counters[model]
+            counters["calls"] += 1
+            counters["cache_hits" if cached else "cache_misses"] += 1
+            counters["errors"] += bool(error)
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            # Cache hits are timed separately so they do not flatten the API latency percentiles
+            self._llm_timings[(model, kind, "cache_lookup" if cached else "latency")].add(latency)
+            if queue_wait is not None:
+                self._llm_timings[(model, kind, "queue_wait")].add(queue_wait)
+            if first_token is not None:
+                self._llm_timings[(model, kind, "first_token")].add(first_token)
+
+    def snapshot(self):
+        with self._lock:
+            spans = {name: stats.summary() for name, stats in sorted(self._spans.items())}
+            llm = {model: dict(counters) for model, counters in sorted(self._llm_counters.items())}
+            timings = {key: stats.summary() for key, stats in self._llm_timings.items()}
+        for (model, kind, metric), summary in sorted(timings.items()):
+            llm[model].setdefault("timings", {}).setdefault(kind, {})[metric] = summary
+        return {"window": self.window, "spans": spans, "llm": llm}
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._llm_timings.clear()
+            self._llm_counters.clear()
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition: spans and LLM timings as summaries, LLM counters as counters."""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP essence_span_seconds Wall time of instrumented script sections.",
+            "# TYPE essence_span_seconds summary",
+        ]
+        for name, summary in snapshot["spans"].items():
+            lines += _summary_lines("essence_span_seconds", {"span": name}, summary)
+        lines += [
+            "# HELP essence_llm_seconds LLM request timings by model, request kind and phase.",
+            "# TYPE essence_llm_seconds summary",
+        ]
+        for model, entry in snapshot["llm"].items():
+            for kind, metrics in entry.get("timings", {}).items():
+                for metric, summary in metrics.items():
+                    lines += _summary_lines("essence_llm_seconds",
+                                            {"model": model, "kind": kind, "phase": metric}, summary)
+        for counter in ("calls", "cache_hits", "cache_misses", "errors", "prompt_tokens", "completion_tokens"):
+            lines.append(f"# TYPE essence_llm_{counter}_total counter")
+            for model, entry in snapshot["llm"].items():
+                lines.append(f"essence_llm_{counter}_total{_labels({'model': model})} {entry.get(counter, 0)}")
+        return "\n".join(lines) + "\n"
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes reachable from ``obj``, counting each object once.
+
+    Objects whose ids are already in ``seen`` are skipped, which is how shared
+    process-wide data referenced from a session is left out of its footprint.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, type):
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            # Views (including memory-mapped catalog columns) do not own their buffer
+            total += sys.getsizeof(item) if item.base is not None else item.nbytes + sys.getsizeof(item)
+            continue
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return total
+
+
+def session_footprint(state, shared=()):
+    """Bytes held by each session-state key, excluding anything reachable from ``shared``."""
+    shared_ids = set()
+    for obj in shared:
+        # Mark shared objects and everything they reference as already counted
+        deep_sizeof(obj, shared_ids)
+    return {key: deep_sizeof(value, set(shared_ids)) for key, value in state.items()}
+
+
+def _labels(labels):
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _summary_lines(metric, labels, summary):
+    lines = []
+    for p in PERCENTILES:
+        if f"p{p}" in summary:
+            lines.append(f"{metric}{_labels({**labels, 'quantile': p / 100})} {summary[f'p{p}']}")
+    lines.append(f"{metric}_sum{_labels(labels)} {summary['sum']}")
+    lines.append(f"{metric}_count{_labels(labels)} {summary['count']}")
+    return lines
+
+
+@st.cache_resource(show_spinner=False)
+def get_telemetry():
+    return Telemetry()
@@ -0,0 +1,21 @@
+import pytest
+
+import config
+from catalog import SEED_INGREDIENTS, IngredientCatalog, build_catalog
+
+
+@pytest.fixture(autouse=True, scope="session")
+def data_dir(tmp_path_factory):
+    # Keep every test away from the developer's .essence_data
+    path = tmp_path_factory.mktemp("essence_data")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("ESSENCE_DATA_DIR", str(path))
+        patch.setattr(config, "DATA_DIR", path)
+        yield path
+
+
+@pytest.fixture(scope="session")
+def catalog(tmp_path_factory):
+    path = tmp_path_factory.mktemp("catalog") / "catalog.npy"
+    build_catalog(SEED_INGREDIENTS, str(path))
+    return IngredientCatalog.load(str(path))
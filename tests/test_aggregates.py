@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from profiles import ALL_DESCRIPTORS
+from store import ProjectStore
+
+TABLES = ("agg_totals", "agg_descriptors", "agg_ingredients", "agg_daily")
+
+
+def _snapshot(store):
+    return {table: sorted(store._query(f"SELECT * FROM {table}")) for table in TABLES}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ProjectStore(tmp_path / "studio.sqlite3")
+    store.seed_if_empty()
+    return store
+
+
+def test_incremental_counters_match_rebuild(store):
+    rng = random.Random(0)
+    names = list(store.search_projects())
+    for i in range(40):
+        action = rng.random()
+        if action < 0.25 or not names:
+            name = f"Project {i}"
+            profile = {desc: rng.randint(0, 7) for desc in rng.sample(ALL_DESCRIPTORS, 3)}
+            store.create_project(name, profile=profile, created=f"2024-01-{rng.randint(1, 9):02d}",
+                                 formulation_count=rng.randint(0, 2))
+            names.append(name)
+        elif action < 0.55:
+            store.set_profile(rng.choice(names), {desc: rng.randint(0, 7) for desc in rng.sample(ALL_DESCRIPTORS, 4)})
+        elif action < 0.85:
+            ingredients = [{"name": rng.choice(["bergamot oil", "Vanillin", " Iso E Super "]), "percentage": 10}
+                           for _ in range(3)]
+            store.add_formulation(rng.choice(names), {"name": "Draft", "ingredients": ingredients},
+                                  created=f"2024-02-{rng.randint(1, 9):02d}T10:00:00")
+        elif action < 0.95:
+            store.undo(rng.choice(names))
+        else:
+            store.redo(rng.choice(names))
+
+    incremental = _snapshot(store)
+    summary = store.dashboard_summary()
+    with store.transaction() as conn:
+        store.aggregates.rebuild(conn)
+    assert _snapshot(store) == incremental
+    assert store.dashboard_summary() == summary
+
+
+def test_summary_sees_writes_from_another_connection(store):
+    before = store.dashboard_summary()["projects"]
+    ProjectStore(store.path).create_project("Elsewhere")
+    assert store.dashboard_summary()["projects"] == before + 1
@@ -0,0 +1,29 @@
+import random
+
+import numpy as np
+import pytest
+
+from blend import draft_formulations
+from profiles import ALL_DESCRIPTORS, PRESET_COMBINATIONS
+
+
+def _profiles(count=300, seed=0):
+    rng = random.Random(seed)
+    randomized = [{desc: rng.randint(1, 7) for desc in rng.sample(ALL_DESCRIPTORS, rng.randint(1, 6))}
+                  for _ in range(count)]
+    return [dict(preset) for preset in PRESET_COMBINATIONS.values()] + randomized
+
+
+@pytest.mark.parametrize("max_share", [0.3, 0.15])
+def test_drafts_respect_max_share_and_ifra_limits(catalog, max_share):
+    limits = {str(name): float(limit) for name, limit in zip(catalog.names, np.asarray(catalog.ifra_limit))}
+    for draft in draft_formulations(catalog, _profiles(), max_share=max_share):
+        for item in draft["ingredients"]:
+            assert item["percentage"] <= max_share * 100, (draft, item)
+            assert item["percentage"] <= limits[item["name"]], (draft, item)
+
+
+def test_drafts_drop_traces_and_sum_to_100(catalog):
+    for draft in draft_formulations(catalog, _profiles(), min_percentage=0.5):
+        assert all(item["percentage"] >= 0.5 for item in draft["ingredients"])
+        assert sum(item["percentage"] for item in draft["ingredients"]) == pytest.approx(100, abs=0.5)
@@ -0,0 +1,19 @@
+from charts import profile_key, radar_figure, radar_grid_figure
+
+
+def test_profile_key_ignores_order_and_zeros():
+    assert profile_key({"Woody": 3, "Fresh": 0, "Amber": 2}) == profile_key({"Amber": 2, "Woody": 3})
+
+
+def test_cached_figures_are_private_copies():
+    items = profile_key({"Woody": 3, "Amber": 2})
+    first = radar_figure(items)
+    first.update_layout(height=999, title="mutated")
+    second = radar_figure(items)
+    assert second is not first
+    assert second.layout.height == 200 and second.layout.title.text is None
+    assert list(second.data[0].theta) == ["Amber", "Woody", "Amber"]
+
+    grid = radar_grid_figure((("A", items), ("B", items)))
+    grid.data[0].name = "mutated"
+    assert radar_grid_figure((("A", items), ("B", items))).data[0].name == "A"
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from compare import combined_features, comparison_features, downsample, kmeans, pairwise_distances, project_2d
+
+
+def _blobs(rng, centers, size=40, spread=0.05):
+    return np.vstack([rng.normal(center, spread, (size, len(center))) for center in centers])
+
+
+def test_comparison_features(catalog):
+    formulations = [
+        {"ingredients": [{"name": "Bergamot Oil", "percentage": 30}, {"name": " vetiver oil", "percentage": 10}]},
+        {"ingredients": [{"name": "Vetiver Oil", "percentage": 5}, {"name": "Vetiver Oil", "percentage": 5},
+                         {"name": "Unknown Accord", "percentage": 10}]},
+        {"ingredients": []},
+    ]
+    features = comparison_features(catalog, formulations)
+    assert list(features["ingredients"]) == ["bergamot oil", "unknown accord", "vetiver oil"]
+    assert features["weights"].tolist() == [[0.75, 0.0, 0.25], [0.0, 0.5, 0.5], [0.0, 0.0, 0.0]]
+    vetiver = catalog.descriptors[catalog.lookup_many(["vetiver oil"])[0]]
+    # The unknown half contributes nothing to the perceived profile
+    assert features["profiles"][1] == pytest.approx(0.5 * vetiver)
+    assert not features["profiles"][2].any()
+    assert combined_features(features).shape == (3, features["profiles"].shape[1] + 3)
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_pairwise_distances_match_a_direct_computation(metric):
+    rng = np.random.default_rng(0)
+    a, b = rng.random((7, 5)), rng.random((4, 5))
+    b[0] = 0
+    expected = np.zeros((7, 4))
+    for i in range(7):
+        for j in range(4):
+            if metric == "euclidean":
+                expected[i, j] = np.linalg.norm(a[i] - b[j])
+            else:
+                norms = np.linalg.norm(a[i]) * np.linalg.norm(b[j])
+                expected[i, j] = 1 - (a[i] @ b[j] / norms if norms else 0)
+    assert pairwise_distances(a, b, metric) == pytest.approx(expected, abs=1e-5)
+    assert np.diag(pairwise_distances(a, metric=metric)) == pytest.approx(np.zeros(7), abs=1e-3)
+
+
+def test_kmeans_is_deterministic_for_a_seed_and_finds_separated_clusters():
+    rng = np.random.default_rng(0)
+    centers = [(0, 0), (1, 0), (0, 1)]
+    points = _blobs(rng, centers)
+
+    labels, found = kmeans(points, 3, seed=7)
+    again, found_again = kmeans(points, 3, seed=7)
+    assert np.array_equal(labels, again) and np.array_equal(found, found_again)
+
+    # Each blob ends up in its own cluster, whatever the label numbering
+    blob = np.repeat(np.arange(3), 40)
+    assert len({(b, l) for b, l in zip(blob, labels)}) == 3
+    assert sorted(map(tuple, found.round(1).tolist())) == sorted(map(tuple, np.array(centers, float).tolist()))
+
+
+def test_kmeans_caps_k_at_the_number_of_points():
+    labels, centers = kmeans(np.array([[0, 0], [1, 1]]), 5)
+    assert len(centers) == 2 and sorted(labels.tolist()) == [0, 1]
+    labels, centers = kmeans(np.zeros((4, 2)), 3)
+    assert len(centers) == 3 and not centers.any()
+
+
+def test_project_2d_keeps_the_widest_spread():
+    rng = np.random.default_rng(0)
+    points = np.zeros((200, 5))
+    points[:, 2] = rng.normal(0, 10, 200)
+    points[:, 4] = rng.normal(0, 1, 200)
+    projected = project_2d(points)
+    assert projected.shape == (200, 2)
+    # The first axis follows the high-variance column (up to sign and a small sample correlation)
+    assert abs(np.corrcoef(projected[:, 0], points[:, 2])[0, 1]) > 0.999
+    assert abs(np.corrcoef(projected[:, 1], points[:, 4])[0, 1]) > 0.99
+    assert project_2d(points[:1]).shape == (1, 2)
+    assert project_2d(points[:, :1]).shape == (200, 2)
+
+
+def test_downsample_thins_dense_regions_and_keeps_outliers():
+    rng = np.random.default_rng(0)
+    points = np.vstack([rng.normal(0, 0.01, (5000, 2)), [[10, 10]]])
+    labels = np.zeros(len(points), dtype=int)
+    chosen = downsample(points, labels, max_points=100, keep=[3])
+    assert len(chosen) <= 100
+    assert len(points) - 1 in chosen and 3 in chosen
+    assert np.array_equal(chosen, downsample(points, labels, max_points=100, keep=[3]))
+    assert np.array_equal(downsample(points[:50], labels[:50], max_points=100), np.arange(50))
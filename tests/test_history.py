@@ -0,0 +1,152 @@
+import pytest
+
+from history import SNAPSHOT_INTERVAL, apply_delta, diff, invert
+from store import ProjectStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(tmp_path / "studio.sqlite3")
+
+
+def _edit_many(store, name, count):
+    """Apply ``count`` rounds of edits; returns ``{version_id: state}`` for every version."""
+    def remember():
+        states[store.list_versions(name, limit=1)[0]["id"]] = _current_state(store, name)
+
+    states = {}
+    remember()
+    for i in range(count):
+        profile = {"Woody": i % 7 + 1, "Fresh": (i * 3) % 8}
+        if i % 5 == 0:
+            profile["Amber"] = 2
+        store.set_profile(name, profile)
+        remember()
+        if i % 9 == 0:
+            store.update_description(name, f"Revision {i}")
+            remember()
+        if i % 4 == 0:
+            store.add_formulation(name, {"name": f"Blend {i}", "ingredients": []})
+            remember()
+    return states
+
+
+def _current_state(store, name):
+    project = store.get_project(name)
+    formulation = store.latest_formulation(name)
+    return {"description": project["description"], "profile": project["profile"],
+            "formulation": formulation["name"] if formulation else None}
+
+
+def _version_state(store, version_id):
+    # Versions hold formulation ids; compare by the formulation each one points at
+    state = store.version_state(version_id)
+    formulation = store.get_formulation(state["formulation"]) if state["formulation"] else None
+    return dict(state, formulation=formulation["name"] if formulation else None)
+
+
+def test_diff_apply_and_invert_round_trip():
+    old = {"description": "a", "profile": {"Woody": 3, "Fresh": 2}}
+    new = {"description": "b", "profile": {"Woody": 5, "Amber": 1}}
+    delta = diff(old, new)
+    assert apply_delta(old, delta) == new
+    assert apply_delta(new, invert(delta)) == old
+    assert diff(new, new) == {}
+
+
+def test_state_at_rebuilds_every_version_across_snapshots(store):
+    store.create_project("Oud", "start", {"Woody": 4})
+    states = _edit_many(store, "Oud", 2 * SNAPSHOT_INTERVAL + 5)
+    snapshots = store._query("SELECT COUNT(*) FROM versions WHERE snapshot IS NOT NULL")[0][0]
+    assert snapshots >= 3
+    for version_id, state in states.items():
+        assert _version_state(store, version_id) == state
+
+
+def test_undo_to_root_and_redo_to_head_across_snapshots(store):
+    store.create_project("Oud", "start", {"Woody": 4})
+    states = _edit_many(store, "Oud", SNAPSHOT_INTERVAL + 5)
+    ordered = [states[version_id] for version_id in sorted(states)]
+
+    for expected in reversed(ordered[:-1]):
+        assert store.undo("Oud")
+        assert _current_state(store, "Oud") == expected
+    assert not store.undo("Oud")
+
+    for expected in ordered[1:]:
+        assert store.redo("Oud")
+        assert _current_state(store, "Oud") == expected
+    assert not store.redo("Oud")
+
+
+def test_checkout_then_edit_branches(store):
+    store.create_project("Oud", "start", {"Woody": 4})
+    states = _edit_many(store, "Oud", SNAPSHOT_INTERVAL + 5)
+    target = sorted(states)[SNAPSHOT_INTERVAL + 2]
+
+    assert store.checkout_version("Oud", target)
+    assert _current_state(store, "Oud") == states[target]
+
+    store.set_profile("Oud", {"Musky": 6})
+    branch = store.list_versions("Oud")[0]
+    assert branch["head"] and branch["parent"] == target
+    assert store.undo("Oud")
+    assert _current_state(store, "Oud") == states[target]
+    # Redo follows the newest child, which is the new branch rather than the old continuation
+    assert store.redo("Oud")
+    assert _current_state(store, "Oud")["profile"] == {"Musky": 6}
+    assert store.version_state(branch["id"])["profile"] == {"Musky": 6}
+
+
+def test_undo_and_checkout_restore_the_current_formulation(store):
+    store.create_project("Oud", profile={"Woody": 4})
+    store.add_formulation("Oud", {"name": "First", "ingredients": []})
+    store.set_profile("Oud", {"Woody": 6})
+    store.add_formulation("Oud", {"name": "Second", "ingredients": []})
+    assert store.list_versions("Oud")[0]["label"].startswith("Formulation #")
+
+    assert store.undo("Oud")
+    assert store.latest_formulation("Oud")["name"] == "First"
+    assert store.get_profile("Oud") == {"Woody": 6}
+    assert store.redo("Oud")
+    assert store.latest_formulation("Oud")["name"] == "Second"
+
+    root = store.list_versions("Oud")[-1]["id"]
+    assert store.checkout_version("Oud", root)
+    assert store.latest_formulation("Oud") is None
+    # Formulations are never deleted, only the current pointer moves
+    assert [f["name"] for f in store.list_formulations("Oud")] == ["First", "Second"]
+    assert store.get_project("Oud")["formulations"] == 2
+
+
+def test_existing_stores_point_at_their_newest_formulation(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "old.sqlite3"
+    store = ProjectStore(path)
+    store.create_project("Oud")
+    store.add_formulation("Oud", {"name": "First", "ingredients": []})
+    store.add_formulation("Oud", {"name": "Second", "ingredients": []})
+    # Recreate the schema a store had before formulations were versioned
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        "CREATE TABLE p (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, description TEXT NOT NULL DEFAULT '', "
+        "created TEXT NOT NULL, formulation_count INTEGER NOT NULL DEFAULT 0);"
+        "INSERT INTO p SELECT id, name, description, created, formulation_count FROM projects;"
+        "DROP TABLE projects; ALTER TABLE p RENAME TO projects;"
+    )
+    conn.close()
+
+    upgraded = ProjectStore(path)
+    assert upgraded.latest_formulation("Oud")["name"] == "Second"
+    upgraded.add_formulation("Oud", {"name": "Third", "ingredients": []})
+    assert upgraded.undo("Oud")
+    assert upgraded.latest_formulation("Oud")["name"] == "Second"
+
+
+def test_checkout_rejects_versions_of_other_projects(store):
+    store.create_project("Oud")
+    store.create_project("Iris")
+    other = store.list_versions("Iris")[0]["id"]
+    with pytest.raises(KeyError):
+        store.checkout_version("Oud", other)
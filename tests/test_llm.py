@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from llm import IncrementalFormulationParser, parse_formulation
+
+REPLY = json.dumps({
+    "name": "Curly {Brace} Accord",
+    "ingredients": [
+        {"name": "Bergamot {FCF} Oil", "percentage": 12.5, "note": "Top"},
+        {"name": "Rose \"Absolute\" }{", "percentage": 8, "note": "heart"},
+        {"name": "Back\\slash Musk", "percentage": "n/a", "note": "base"},
+        {"name": "", "percentage": 1, "note": "base"},
+        {"name": "Ambroxan", "percentage": 4, "note": "base"},
+    ],
+    "notes": "Ends with } and ] characters",
+})
+
+
+def _feed(parser, text, size):
+    rows = []
+    for start in range(0, len(text), size):
+        rows.extend(parser.feed(text[start:start + size]))
+    return rows
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, len(REPLY)])
+def test_streamed_rows_match_the_final_parse(size):
+    parser = IncrementalFormulationParser()
+    rows = _feed(parser, "Here you go:\n```json\n" + REPLY + "\n```", size)
+    names = [row["name"] for row in rows]
+    # The row with an unparseable percentage is skipped while streaming, not fatal
+    assert names == ["Bergamot {FCF} Oil", 'Rose "Absolute" }{', "Ambroxan"]
+    assert rows[0] == {"name": "Bergamot {FCF} Oil", "percentage": 12.5, "note": "top"}
+
+
+def test_malformed_object_is_skipped_mid_stream():
+    text = '{"ingredients": [{"name": "Iris", "percentage": }, {"name": "Vetiver", "percentage": 3}]}'
+    parser = IncrementalFormulationParser()
+    assert [row["name"] for row in _feed(parser, text, 5)] == ["Vetiver"]
+    with pytest.raises(ValueError):
+        parser.result()
+
+
+def test_parse_formulation_tolerates_surrounding_prose():
+    formulation = parse_formulation('Sure! {"name": "X", "ingredients": [{"name": "Iso E Super", "percentage": "20"}]} Done.')
+    assert formulation["ingredients"] == [{"name": "Iso E Super", "percentage": 20.0, "note": ""}]
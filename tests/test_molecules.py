@@ -0,0 +1,29 @@
+from molecules import STRUCTURES, ThumbnailCache, parse_smiles
+
+
+def test_catalog_structures_parse():
+    for molecule, smiles in STRUCTURES.values():
+        atoms, bonds = parse_smiles(smiles)
+        assert atoms and len(bonds) >= len(atoms) - smiles.count(".") - 1, molecule
+
+
+def test_failed_render_is_reported_and_not_retried(tmp_path, monkeypatch):
+    import molecules
+
+    calls = []
+    render = molecules.render_structure
+    monkeypatch.setattr(molecules, "render_structure", lambda smiles, size: calls.append(smiles) or render(smiles, size))
+    cache = ThumbnailCache(str(tmp_path))
+
+    for _ in range(3):
+        assert cache.get_ready("C1CC", 64) is None
+        cache.wait()
+    assert cache.failed("C1CC", 64)
+    assert cache.get("C1CC", 64) is None
+    assert calls == ["C1CC"]
+
+    image = cache.get("CCO", 64)
+    assert image.startswith(b"\x89PNG") and not cache.failed("CCO", 64)
+    # A fresh cache over the same directory serves the file without rendering again
+    assert ThumbnailCache(str(tmp_path)).get_ready("CCO", 64) == image
+    assert calls == ["C1CC", "CCO"]
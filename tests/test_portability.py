@@ -0,0 +1,87 @@
+import io
+
+import pytest
+
+from portability import (EXPORT_FORMATS, export_bytes, export_to_file, import_records, read_records,
+                         validate_record)
+from store import MAX_PROJECT_NAME_LENGTH, ProjectStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(tmp_path / "studio.sqlite3")
+
+
+def _project(name, **fields):
+    return {"type": "project", "name": name, "created": "2024-03-01", "description": "", "profile": {}, **fields}
+
+
+def _formulation(project, name="Draft", percentage=10):
+    return {"type": "formulation", "project": project, "created": "2024-03-02T09:00:00",
+            "formulation": {"name": name, "ingredients": [{"name": "Vanillin", "percentage": percentage}]}}
+
+
+def test_repeated_project_record_keeps_the_imported_projects_formulations(store):
+    records = [_project("Iris", profile={"Powdery": 5}), _formulation("Iris", "First"),
+               _project("Iris", profile={"Woody": 2}), _formulation("Iris", "Second")]
+    result = import_records(store, enumerate(records, start=1), batch_size=2)
+    assert result["projects"] == 1 and result["formulations"] == 2 and result["skipped"] == 1
+    assert store.get_profile("Iris") == {"Powdery": 5}
+    assert [f["name"] for f in store.list_formulations("Iris")] == ["First", "Second"]
+
+
+def test_projects_that_existed_before_the_import_are_skipped_with_their_formulations(store):
+    store.create_project("Iris")
+    result = import_records(store, enumerate([_project("Iris"), _formulation("Iris")], start=1))
+    assert result["projects"] == 0 and result["formulations"] == 0 and result["skipped"] == 2
+    assert store.list_formulations("Iris") == []
+
+
+@pytest.mark.parametrize("percentage", [True, False, float("nan"), float("inf"), "10", None])
+def test_invalid_percentages_are_rejected(percentage):
+    with pytest.raises(ValueError, match="must be a number"):
+        validate_record(_formulation("Iris", percentage=percentage))
+
+
+@pytest.mark.parametrize("intensity", [True, 8, -1, 2.0])
+def test_invalid_profile_intensities_are_rejected(intensity):
+    with pytest.raises(ValueError, match="integer from 0 to 7"):
+        validate_record(_project("Iris", profile={"Woody": intensity}))
+
+
+def test_name_length_limit_matches_between_store_and_import(store):
+    longest = "x" * MAX_PROJECT_NAME_LENGTH
+    store.create_project(longest)
+    with pytest.raises(ValueError):
+        store.create_project(longest + "x")
+    validate_record(_project(longest))
+    with pytest.raises(ValueError, match="at most"):
+        validate_record(_project(longest + "x"))
+
+
+@pytest.mark.parametrize("fmt", list(EXPORT_FORMATS))
+def test_export_round_trip(store, tmp_path, fmt):
+    store.seed_if_empty()
+    store.create_project("Iris", "powdery", {"Powdery": 5, "Woody": 2}, created="2024-03-01")
+    for i in range(3):
+        store.add_formulation("Iris", {"name": f"Iris {i}", "ingredients": [{"name": "Orris", "percentage": 12.5}]},
+                              created=f"2024-03-0{i + 2}T09:00:00")
+
+    path = export_to_file(store, fmt, directory=tmp_path)
+    target = ProjectStore(tmp_path / "target.sqlite3")
+    with open(path, "rb") as fileobj:
+        result = import_records(target, read_records(fileobj), batch_size=2)
+
+    assert result["invalid"] == 0 and result["skipped"] == 0
+    assert result["projects"] == store.count_projects()
+    assert {p["name"]: p for p in target.list_projects()} == {p["name"]: p for p in store.list_projects()}
+    assert target.list_formulations("Iris") == store.list_formulations("Iris")
+    assert target.dashboard_summary() == store.dashboard_summary()
+
+
+def test_export_bytes_refuses_downloads_over_the_limit(store):
+    store.seed_if_empty()
+    data = export_bytes(store, "JSON Lines")
+    assert sum(1 for _ in read_records(io.BytesIO(data))) == store.count_projects()
+    with pytest.raises(ValueError, match="portability.py export"):
+        export_bytes(store, "JSON Lines", max_bytes=len(data) - 1)
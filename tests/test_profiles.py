@@ -0,0 +1,109 @@
+import random
+
+import numpy as np
+import pytest
+
+from profiles import ALL_DESCRIPTORS, ProfileIndex, profile_vector
+
+
+def _random_profile(rng):
+    return {desc: rng.randint(0, 7) for desc in rng.sample(ALL_DESCRIPTORS, 4)}
+
+
+def _reference_scores(profiles, target, metric):
+    target = profile_vector(target)
+    scores = {}
+    for key, profile in profiles.items():
+        vector = profile_vector(profile)
+        if metric == "cosine":
+            denom = np.linalg.norm(vector) * np.linalg.norm(target)
+            scores[key] = float(vector @ target / denom) if denom > 0 else 0.0
+        else:
+            scores[key] = float(np.linalg.norm(vector - target))
+    return scores
+
+
+def _assert_matches_reference(index, profiles, target, k, metric, exclude=None):
+    reference = _reference_scores({key: p for key, p in profiles.items() if key != exclude}, target, metric)
+    result = index.query(target, k=k, metric=metric, exclude=exclude)
+    assert len(result) == min(k, len(reference))
+    for key, score in result:
+        assert score == pytest.approx(reference[key], abs=1e-5)
+    # Ties can come back in either order, so compare the ranked scores rather than the keys
+    ranked = sorted(reference.values(), reverse=metric == "cosine")[:len(result)]
+    assert [score for _, score in result] == pytest.approx(ranked, abs=1e-5)
+
+
+def _assert_bookkeeping(index, profiles):
+    assert len(index) == len(profiles)
+    assert sorted(index._keys) == sorted(profiles)
+    for key, profile in profiles.items():
+        row = index._rows[key]
+        assert index._keys[row] == key
+        assert np.array_equal(index._matrix[row], profile_vector(profile))
+        assert index._norms[row] == pytest.approx(np.linalg.norm(profile_vector(profile)))
+
+
+def test_upserts_and_removals_keep_rows_consistent():
+    rng = random.Random(0)
+    index, profiles = ProfileIndex(capacity=2), {}
+    for step in range(300):
+        key = f"p{rng.randint(0, 40)}"
+        if rng.random() < 0.35:
+            index.remove(key)
+            profiles.pop(key, None)
+        else:
+            profiles[key] = _random_profile(rng)
+            index.upsert(key, profiles[key])
+        if step % 25 == 0:
+            _assert_bookkeeping(index, profiles)
+            for metric in ("cosine", "euclidean"):
+                _assert_matches_reference(index, profiles, _random_profile(rng), 5, metric)
+    _assert_bookkeeping(index, profiles)
+
+
+def test_removed_keys_are_never_returned():
+    index = ProfileIndex()
+    index.upsert_many([("a", {"Woody": 5}), ("b", {"Woody": 4}), ("c", {"Fresh": 6})])
+    index.remove("a")
+    index.remove("a")
+    index.remove("missing")
+    assert [key for key, _ in index.query({"Woody": 5}, k=3)] == ["b", "c"]
+    # "c" was swapped into the removed row; updating it must not resurrect "a"
+    index.upsert("c", {"Woody": 5})
+    assert {key for key, _ in index.query({"Woody": 5}, k=3, metric="euclidean")} == {"b", "c"}
+    index.remove("b")
+    index.remove("c")
+    assert len(index) == 0 and index.query({"Woody": 5}) == []
+
+
+def test_upsert_replaces_in_place():
+    index = ProfileIndex()
+    index.upsert("a", {"Woody": 5})
+    index.upsert("b", {"Fresh": 5})
+    index.upsert("a", {"Fresh": 5, "Citrus": 1})
+    assert len(index) == 2
+    assert index.query({"Fresh": 5, "Citrus": 1}, k=1) == [("a", pytest.approx(1.0))]
+    assert index.query({"Fresh": 5}, k=2, metric="euclidean") == [("b", 0.0), ("a", 1.0)]
+    assert index.query({"Woody": 5}, k=2, metric="euclidean")[0][1] == pytest.approx(np.sqrt(50))
+
+
+@pytest.mark.parametrize("metric", ["cosine", "euclidean"])
+@pytest.mark.parametrize("extra", [0, 1, 10])
+def test_k_at_or_beyond_the_index_size(metric, extra):
+    rng = random.Random(1)
+    profiles = {f"p{i}": _random_profile(rng) for i in range(6)}
+    index = ProfileIndex()
+    index.upsert_many(profiles.items())
+    target = _random_profile(rng)
+    _assert_matches_reference(index, profiles, target, len(profiles) + extra, metric)
+    _assert_matches_reference(index, profiles, target, len(profiles) + extra, metric, exclude="p3")
+    # Excluding an unknown key does not shrink the result
+    assert len(index.query(target, k=len(profiles) + extra, metric=metric, exclude="missing")) == len(profiles)
+
+
+def test_excluding_the_only_entry_returns_nothing():
+    index = ProfileIndex()
+    index.upsert("a", {"Woody": 5})
+    assert index.query({"Woody": 5}, exclude="a") == []
+    assert index.query({"Woody": 5}, k=0) == []
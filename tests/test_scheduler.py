@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+
+from scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, RequestScheduler
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {} if retry_after is None else {"retry-after": str(retry_after)}})
+
+
+def _scheduler(**kwargs):
+    # 600 requests/min admits one call every 100 ms once the bucket is drained
+    kwargs.setdefault("base_delay", 0.0)
+    return RequestScheduler(limits={"m": (600, 10 ** 6)}, **kwargs)
+
+
+def _drain(scheduler, seconds):
+    requests_bucket, _ = scheduler._model_buckets("m")
+    requests_bucket.tokens = -seconds * requests_bucket.rate
+    requests_bucket.updated = time.monotonic()
+
+
+def _queued(scheduler):
+    metrics = scheduler.metrics().get("m", {})
+    return metrics.get("queued_interactive", 0) + metrics.get("queued_bulk", 0)
+
+
+def _start(scheduler, call, priority, expected_queue):
+    thread = threading.Thread(target=scheduler.run, args=(call, "m", 10, priority))
+    thread.start()
+    deadline = time.monotonic() + 2
+    while _queued(scheduler) < expected_queue and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return thread
+
+
+def test_admission_by_priority_then_arrival():
+    scheduler = _scheduler()
+    _drain(scheduler, 0.3)
+    order = []
+    jobs = [("bulk-1", PRIORITY_BULK), ("interactive-1", PRIORITY_INTERACTIVE), ("bulk-2", PRIORITY_BULK),
+            ("interactive-2", PRIORITY_INTERACTIVE)]
+    threads = [_start(scheduler, lambda label=label: order.append(label), priority, i + 1)
+               for i, (label, priority) in enumerate(jobs)]
+    for thread in threads:
+        thread.join()
+    assert order == ["interactive-1", "interactive-2", "bulk-1", "bulk-2"]
+
+
+def test_retried_call_keeps_its_place_in_the_queue():
+    scheduler = _scheduler()
+    order, attempts = [], []
+    running, later_queued = threading.Event(), threading.Event()
+
+    def first():
+        attempts.append(1)
+        if len(attempts) == 1:
+            running.set()
+            later_queued.wait()
+            raise StatusError(429, retry_after=0.2)
+        order.append("retried")
+
+    retried = threading.Thread(target=scheduler.run, args=(first, "m", 10))
+    retried.start()
+    running.wait()
+    # A same-priority caller that arrives while the first attempt runs must not overtake its retry
+    _drain(scheduler, 0.5)
+    later = _start(scheduler, lambda: order.append("later"), PRIORITY_INTERACTIVE, 1)
+    later_queued.set()
+    retried.join()
+    later.join()
+    assert order == ["retried", "later"]
+    assert scheduler.metrics()["m"]["rate_limited"] == 1
+
+
+def test_retry_after_is_respected():
+    scheduler = _scheduler()
+    attempts = []
+
+    def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise StatusError(429, retry_after=0.4)
+        return "ok"
+
+    assert scheduler.run(call, "m", 10) == "ok"
+    assert attempts[1] - attempts[0] >= 0.4
+
+
+@pytest.mark.parametrize("error", [
+    StatusError(500), StatusError(503),
+    openai.APIConnectionError(request=None),
+])
+def test_server_and_connection_errors_are_retried(error):
+    scheduler = _scheduler()
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise error
+        return "ok"
+
+    assert scheduler.run(call, "m", 10) == "ok"
+    assert len(attempts) == 3
+
+
+def test_client_errors_and_exhausted_retries_raise():
+    scheduler = _scheduler(max_retries=2)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        scheduler.run(bad_request, "m", 10)
+    assert len(calls) == 1
+
+    def always_busy():
+        calls.append(1)
+        raise StatusError(429)
+
+    with pytest.raises(StatusError):
+        scheduler.run(always_busy, "m", 10)
+    assert len(calls) == 1 + 3
+
+
+def test_failed_attempts_refund_their_token_reservation():
+    scheduler = _scheduler()
+    _, tokens_bucket = scheduler._model_buckets("m")
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise StatusError(502)
+
+    scheduler.run(call, "m", 1000)
+    assert tokens_bucket.capacity - tokens_bucket.tokens == pytest.approx(1000, abs=5)
+
+
+def test_arun_retries_and_keeps_one_reservation():
+    scheduler = _scheduler()
+    _, tokens_bucket = scheduler._model_buckets("m")
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise StatusError(429, retry_after=0.1)
+        return "ok"
+
+    assert asyncio.run(scheduler.arun(call, "m", 1000)) == "ok"
+    assert len(attempts) == 2
+    assert tokens_bucket.capacity - tokens_bucket.tokens == pytest.approx(1000, abs=5)
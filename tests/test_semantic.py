@@ -0,0 +1,137 @@
+import math
+
+import numpy as np
+import pytest
+
+from semantic import (REUSE_THRESHOLD, SEED_MAX_DELTA, SEED_THRESHOLD, Embedder, HashedTfidfEmbedder,
+                      SemanticCache)
+
+PROFILE = {"Woody": 4, "Fresh": 2}
+
+
+class AngleEmbedder(Embedder):
+    """Places each brief on the unit circle, so cosine similarity is the cosine of the angle between them."""
+
+    dim = 2
+
+    def __init__(self, degrees):
+        self.degrees = degrees
+
+    def embed(self, texts):
+        angles = np.radians([self.degrees[text] for text in texts])
+        return np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+
+
+# Angles from "base": 10 degrees clears the reuse threshold, 30 only the seed one, 60 neither
+ANGLES = {"base": 0, "close": 10, "near": 30, "far": 60, "(no brief)": 90}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SemanticCache(tmp_path / "semantic.sqlite3", AngleEmbedder(ANGLES))
+    cache.add("model-a", 0.7, PROFILE, "Base", {"name": "Base blend"})
+    return cache
+
+
+def test_embedder_requires_embed():
+    with pytest.raises(TypeError):
+        Embedder()
+
+
+def test_angles_straddle_the_thresholds():
+    assert math.cos(math.radians(ANGLES["close"])) >= REUSE_THRESHOLD
+    assert SEED_THRESHOLD <= math.cos(math.radians(ANGLES["near"])) < REUSE_THRESHOLD
+    assert math.cos(math.radians(ANGLES["far"])) < SEED_THRESHOLD
+
+
+@pytest.mark.parametrize("description, expected", [
+    ("  BASE ", ({"name": "Base blend"}, None)),
+    ("close", ({"name": "Base blend"}, None)),
+    ("near", (None, {"name": "Base blend"})),
+    ("far", (None, None)),
+])
+def test_brief_similarity_thresholds(cache, description, expected):
+    assert cache.lookup("model-a", 0.7, PROFILE, description) == expected
+
+
+def test_profile_delta_gates(cache):
+    # Zero intensities are dropped, so an explicit zero is the same profile
+    assert cache.lookup("model-a", 0.7, dict(PROFILE, Amber=0), "base")[0] is not None
+    assert cache.lookup("model-a", 0.7, dict(PROFILE, Woody=5), "base") == (None, {"name": "Base blend"})
+    assert cache.lookup("model-a", 0.7, dict(PROFILE, Amber=SEED_MAX_DELTA), "base")[1] is not None
+    assert cache.lookup("model-a", 0.7, dict(PROFILE, Woody=4 + SEED_MAX_DELTA + 1), "base") == (None, None)
+
+
+def test_other_temperature_only_seeds(cache):
+    assert cache.lookup("model-a", 1.0, PROFILE, "base") == (None, {"name": "Base blend"})
+
+
+def test_other_model_misses(cache):
+    assert cache.lookup("model-b", 0.7, PROFILE, "base") == (None, None)
+
+
+def test_reuse_prefers_the_most_similar_brief(cache):
+    cache.add("model-a", 0.7, PROFILE, "close", {"name": "Close blend"})
+    assert cache.lookup("model-a", 0.7, PROFILE, "close")[0] == {"name": "Close blend"}
+    assert cache.lookup("model-a", 0.7, PROFILE, "base")[0] == {"name": "Base blend"}
+
+
+def test_seed_prefers_the_closest_profile(cache):
+    cache.add("model-a", 0.7, dict(PROFILE, Woody=6), "base", {"name": "Farther profile"})
+    cache.add("model-a", 0.7, dict(PROFILE, Woody=5), "near", {"name": "Closer profile"})
+    assert cache.lookup("model-a", 0.7, dict(PROFILE, Woody=5), "base") == (None, {"name": "Closer profile"})
+
+
+def test_entries_persist_across_instances(cache, tmp_path):
+    cache.add("model-a", 0.7, PROFILE, "far", {"name": "Far blend"})
+    reopened = SemanticCache(tmp_path / "semantic.sqlite3", AngleEmbedder(ANGLES))
+    assert len(reopened) == 2
+    assert reopened.lookup("model-a", 0.7, PROFILE, "far") == ({"name": "Far blend"}, None)
+    reopened.clear()
+    assert len(SemanticCache(tmp_path / "semantic.sqlite3", AngleEmbedder(ANGLES))) == 0
+
+
+class FrozenTfidfEmbedder(HashedTfidfEmbedder):
+    """Hashed TF-IDF with fixed weights, so stored vectors do not drift from new queries."""
+
+    def observe(self, texts):
+        return None
+
+
+def _briefs(count):
+    notes = ["bergamot", "vetiver", "iris", "oud", "neroli", "amber", "fig", "tonka", "cedar", "jasmine"]
+    moods = ["bright", "smoky", "powdery", "dark", "airy", "warm", "green", "sweet", "dry", "creamy"]
+    return [f"{moods[i % 10]} {notes[i // 10 % 10]} accord number {i}" for i in range(count)]
+
+
+def test_lsh_search_beyond_the_exact_limit(tmp_path):
+    briefs = _briefs(60)
+    cache = SemanticCache(tmp_path / "semantic.sqlite3", FrozenTfidfEmbedder(), exact_limit=2)
+    for brief in briefs:
+        cache.add("model-a", 0.7, PROFILE, brief, {"name": brief})
+    assert len(cache) > cache.exact_limit
+
+    # A brief always shares every bucket with itself, so LSH never loses an exact repeat
+    for brief in briefs:
+        assert cache.lookup("model-a", 0.7, PROFILE, brief.upper()) == ({"name": brief}, None)
+    assert cache.lookup("model-a", 0.7, PROFILE, "completely unrelated words") == (None, None)
+    assert cache.lookup("model-b", 0.7, PROFILE, briefs[0]) == (None, None)
+
+    # Reopening re-embeds every entry with the learned document frequencies
+    reopened = SemanticCache(tmp_path / "semantic.sqlite3", exact_limit=2)
+    for brief in briefs:
+        assert reopened.lookup("model-a", 0.7, PROFILE, brief) == ({"name": brief}, None)
+
+
+def test_trimming_keeps_the_newest_entries_searchable(tmp_path):
+    briefs = _briefs(30)
+    cache = SemanticCache(tmp_path / "semantic.sqlite3", FrozenTfidfEmbedder(), max_entries=10,
+                          exact_limit=2)
+    for brief in briefs:
+        cache.add("model-a", 0.7, PROFILE, brief, {"name": brief})
+    assert len(cache) <= 11
+
+    kept = briefs[-len(cache):]
+    for brief in kept:
+        assert cache.lookup("model-a", 0.7, PROFILE, brief) == ({"name": brief}, None)
+    assert cache.lookup("model-a", 0.7, PROFILE, briefs[0])[0] is None
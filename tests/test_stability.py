@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from catalog import NOTES
+from stability import TIME_GRID, StabilitySimulator, descriptor_at, formulation_hash
+
+
+def _formulation(*ingredients, name="Draft"):
+    return {"name": name, "ingredients": [{"name": n, "percentage": p} for n, p in ingredients]}
+
+
+@pytest.fixture
+def simulator(catalog):
+    return StabilitySimulator(catalog)
+
+
+def test_top_notes_fade_and_base_notes_take_over(simulator):
+    result, = simulator.simulate([_formulation(("Bergamot Oil", 50), ("Vetiver Oil", 50))])
+    profiles = [descriptor_at(result, hours) for hours in TIME_GRID]
+    citrus = [p["Citrus"] for p in profiles]
+    earthy = [p["Earthy"] for p in profiles]
+    assert citrus == sorted(citrus, reverse=True) and citrus[0] > citrus[-1]
+    assert earthy == sorted(earthy) and earthy[0] < earthy[-1]
+    # Citrus comes only from the bergamot, which is nearly gone after two days
+    assert descriptor_at(result, 48)["Citrus"] < 0.5 < descriptor_at(result, 0)["Citrus"]
+
+    assert np.all(np.diff(result["remaining"]) <= 0)
+    assert np.all(np.diff(result["intensity"]) <= 0)
+    top = NOTES.index("top")
+    assert np.all(np.diff(result["note_balance"][:, top]) <= 1e-9)
+    assert result["note_balance"].sum(axis=1) == pytest.approx(np.ones(len(TIME_GRID)))
+    assert result["drift"][0] == 0 and result["drift"][-1] > 0
+
+
+def test_descriptor_at_uses_the_nearest_grid_point(simulator):
+    result, = simulator.simulate([_formulation(("Bergamot Oil", 50), ("Vetiver Oil", 50))])
+    assert descriptor_at(result, 0.04) == descriptor_at(result, 0)
+    assert descriptor_at(result, 1000) == descriptor_at(result, TIME_GRID[-1])
+
+
+def test_base_notes_outlast_top_notes(simulator):
+    top, base = simulator.simulate([_formulation(("Lemon Oil", 10)), _formulation(("Vetiver Oil", 10))])
+    assert top["longevity_hours"] < base["longevity_hours"]
+
+
+def test_results_are_cached_by_ingredients_only(simulator):
+    first = _formulation(("Bergamot Oil", 30), ("Vetiver Oil", 70), name="First")
+    renamed = _formulation((" vetiver oil", 70), ("Bergamot Oil", 30), name="Second")
+    assert formulation_hash(first) == formulation_hash(renamed)
+    a, b = simulator.simulate([first, renamed])
+    assert a is b
+    assert simulator.simulate([renamed])[0] is a
+
+
+def test_cache_evicts_the_least_recently_used(catalog):
+    simulator = StabilitySimulator(catalog, cache_size=2)
+    formulations = [_formulation(("Lemon Oil", p)) for p in (10, 20, 30)]
+    first = simulator.simulate(formulations[:1])[0]
+    simulator.simulate(formulations[1:])
+    assert len(simulator._cache) == 2
+    assert simulator.simulate(formulations[:1])[0] is not first
+
+
+def test_unknown_ingredients_use_their_note_volatility(simulator):
+    fleeting, = simulator.simulate([{"ingredients": [{"name": "Mystery Accord", "percentage": 5, "note": "top"}]}])
+    lasting, = simulator.simulate([{"ingredients": [{"name": "Mystery Accord", "percentage": 5, "note": "base"}]}])
+    assert fleeting["longevity_hours"] < lasting["longevity_hours"]
@@ -0,0 +1,46 @@
+import pytest
+
+from store import ProjectStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProjectStore(tmp_path / "studio.sqlite3")
+
+
+def test_nested_transaction_rolls_back_as_a_whole(store):
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.create_project("Outer", profile={"Woody": 3})
+            with store.transaction():
+                store.create_project("Inner")
+                raise RuntimeError("abort")
+    assert not store.project_exists("Outer")
+    assert not store.project_exists("Inner")
+    assert store.dashboard_summary()["projects"] == 0
+
+    # The depth counter is back at zero, so the next write commits on its own
+    store.create_project("After")
+    assert ProjectStore(store.path).project_exists("After")
+
+
+def test_prefix_search_boundaries(store):
+    names = ["a", "ab", "Ab", "ABZ", "abz", "ab\U0001f600", "ab\U0010ffffx", "ac", "b", "a_b", "a%", "axb"]
+    for name in names:
+        store.create_project(name)
+
+    expected = {"ab", "Ab", "ABZ", "abz", "ab\U0001f600", "ab\U0010ffffx"}
+    assert set(store.search_projects("ab")) == expected
+    assert set(store.search_projects("aB")) == expected
+    assert {p["name"] for p in store.list_projects(prefix="AB")} == expected
+    assert store.count_projects(prefix="ab") == len(expected)
+    # LIKE wildcards in the prefix match literally
+    assert store.search_projects("a_") == ["a_b"]
+    assert store.search_projects("a%") == ["a%"]
+    assert set(store.search_projects("")) == set(names)
+
+
+def test_prefix_search_uses_the_name_index(store):
+    where, params = store._prefix_clause("ab")
+    plan = store._query(f"EXPLAIN QUERY PLAN SELECT p.name FROM projects p {where}", params)
+    assert "idx_projects_name_nocase" in plan[0][3]
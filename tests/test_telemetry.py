@@ -0,0 +1,95 @@
+import re
+
+import numpy as np
+import pytest
+
+from telemetry import Telemetry, deep_sizeof, session_footprint
+
+# One sample line of the Prometheus text format: name, optional {labels}, value
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"(?:,|$)')
+
+
+def _parse_prometheus(text):
+    """``{(name, labels): value}`` for every sample, checking each belongs to a declared family."""
+    types, samples = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ")
+            types[name] = kind
+            continue
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        name, label_text, value = match.groups()
+        labels = {}
+        if label_text:
+            pairs = LABEL.findall(label_text)
+            assert "".join(f'{k}="{v}",' for k, v in pairs)[:-1] == label_text, line
+            labels = {k: v.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\") for k, v in pairs}
+        family = re.sub(r"_(sum|count)$", "", name)
+        assert name in types or types.get(family) == "summary", line
+        samples[name, tuple(sorted(labels.items()))] = float(value)
+    return samples
+
+
+@pytest.fixture
+def telemetry():
+    telemetry = Telemetry(window=4)
+    for seconds in (0.1, 0.2, 0.3, 0.4, 10.0):
+        telemetry.record_span("render", seconds)
+    telemetry.record_llm("gpt-4o", "stream", 1.5, queue_wait=0.25, first_token=0.5,
+                         prompt_tokens=100, completion_tokens=40)
+    telemetry.record_llm("gpt-4o", "stream", 0.01, cached=True)
+    telemetry.record_llm('odd "model"\nname\\', "variant", 2.0, error=True)
+    return telemetry
+
+
+def test_snapshot_keeps_lifetime_totals_and_windowed_percentiles(telemetry):
+    snapshot = telemetry.snapshot()
+    render = snapshot["spans"]["render"]
+    # The window holds the last four samples; count and sum cover all five
+    assert render["count"] == 5 and render["sum"] == pytest.approx(11.0)
+    assert render["mean"] == pytest.approx(np.mean([0.2, 0.3, 0.4, 10.0]))
+    assert render["p50"] == pytest.approx(0.35)
+
+    gpt = snapshot["llm"]["gpt-4o"]
+    assert (gpt["calls"], gpt["cache_hits"], gpt["cache_misses"], gpt["errors"]) == (2, 1, 1, 0)
+    assert set(gpt["timings"]["stream"]) == {"latency", "cache_lookup", "queue_wait", "first_token"}
+    assert gpt["timings"]["stream"]["latency"]["count"] == 1
+
+
+def test_to_prometheus_is_parseable(telemetry):
+    samples = _parse_prometheus(telemetry.to_prometheus())
+    assert samples["essence_span_seconds_count", (("span", "render"),)] == 5
+    assert samples["essence_span_seconds", (("quantile", "0.5"), ("span", "render"))] == pytest.approx(0.35)
+    latency = (("kind", "stream"), ("model", "gpt-4o"), ("phase", "latency"))
+    assert samples["essence_llm_seconds_sum", latency] == pytest.approx(1.5)
+    assert samples["essence_llm_prompt_tokens_total", (("model", "gpt-4o"),)] == 100
+    # Label values with quotes, newlines and backslashes survive escaping
+    assert samples["essence_llm_errors_total", (("model", 'odd "model"\nname\\'),)] == 1
+
+
+def test_reset_and_empty_exports(telemetry):
+    telemetry.reset()
+    assert telemetry.snapshot() == {"window": 4, "spans": {}, "llm": {}}
+    assert _parse_prometheus(telemetry.to_prometheus()) == {}
+
+
+def test_span_records_even_when_the_block_raises():
+    telemetry = Telemetry()
+    with pytest.raises(ValueError):
+        with telemetry.span("failing"):
+            raise ValueError
+    assert telemetry.snapshot()["spans"]["failing"]["count"] == 1
+
+
+def test_session_footprint_excludes_shared_objects():
+    shared = np.zeros(100_000)
+    own = np.zeros(1000)
+    footprint = session_footprint({"shared": {"data": shared}, "own": [own]}, shared=[shared])
+    assert footprint["shared"] < shared.nbytes
+    assert footprint["own"] >= own.nbytes
+    # Views do not own their buffer
+    assert deep_sizeof(shared[:10]) < shared.nbytes